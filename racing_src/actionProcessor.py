@@ -18,6 +18,7 @@ class ActionProcessor:
             self.discrete_branches = action_space_info.discrete_branches
             self.discrete_size = sum(action_space_info.discrete_branches)
             self.action_size = self.continuous_size + self.discrete_size
+            self._compile_branches()
 
         print(f"Action space detected: {self.action_type}")
         if self.action_type == "continuous":
@@ -45,6 +46,27 @@ class ActionProcessor:
         else:
             return self._process_hybrid_to_network_output(action)
 
+    def create_actions(self, network_outputs):
+        # Batch version of create_action for an (N, action_size) array; hybrid spaces give (continuous (N, c), discrete (N, branches))
+        if self.action_type == "continuous":
+            return network_outputs
+        elif self.action_type == "discrete":
+            return np.asarray(network_outputs).astype(np.int32).reshape(len(network_outputs), -1)
+        else:
+            return network_outputs[:, :self.continuous_size], self._continuous_to_discrete_batch(network_outputs[:, self.continuous_size:])
+
+    def actions_to_network_outputs(self, actions):
+        if self.action_type == "continuous":
+            return actions
+        elif self.action_type == "discrete":
+            actions = np.asarray(actions)
+            if len(self.discrete_branches) == 1:
+                return actions.reshape(len(actions))
+            return actions
+        else:
+            continuous_actions, discrete_actions = actions
+            return np.concatenate([continuous_actions, self._discrete_to_continuous_batch(discrete_actions)], axis=1)
+
     def get_size(self):
         return self.action_size
 
@@ -77,23 +99,45 @@ class ActionProcessor:
 
         return (continuous_action, discrete_action)
 
+    def _compile_branches(self):
+        # Branch i owns columns offsets[i]:offsets[i + 1] of the discrete part. gather_index pads every branch to
+        # the widest one with an index past the end, which _continuous_to_discrete_batch fills with -inf.
+        branch_sizes = np.asarray(self.discrete_branches, dtype=np.int64)
+        self.branch_sizes = branch_sizes
+        self.branch_offsets = np.concatenate([[0], np.cumsum(branch_sizes)])
+        max_branch = int(branch_sizes.max()) if len(branch_sizes) else 0
+        columns = np.arange(max_branch)
+        self.gather_index = np.where(
+            columns[None, :] < branch_sizes[:, None],
+            self.branch_offsets[:-1, None] + columns[None, :],
+            self.discrete_size
+        )
+        self._padded_row = np.empty(self.discrete_size + 1, dtype=np.float64)
+
     def _continuous_to_discrete(self, continuous_values):
-        discrete_actions = []
-        value_idx = 0
-
-        for branch_size in self.discrete_branches:
-                discrete_action = 0
-                max_continuous_val = float("-inf")
-                for i in range(branch_size):
-                        if value_idx + i < len(continuous_values):
-                                continuous_val = continuous_values[value_idx + i]
-                                if continuous_val > max_continuous_val:
-                                        discrete_action = i
-                                        max_continuous_val = continuous_val
-                discrete_actions.append(discrete_action)
-                value_idx += branch_size
-
-        return np.array(discrete_actions, dtype=np.int32)
+        padded = self._padded_row
+        available = min(len(continuous_values), self.discrete_size)
+        padded[:available] = continuous_values[:available]
+        padded[available:] = -np.inf
+        padded[np.isnan(padded)] = -np.inf
+        return np.argmax(padded[self.gather_index], axis=1).astype(np.int32)
+
+    def _continuous_to_discrete_batch(self, continuous_values):
+        # Segmented argmax: first maximum wins, NaN never wins, and missing values count as -inf,
+        # so a branch with nothing to choose from falls back to 0
+        count, available = continuous_values.shape
+        available = min(available, self.discrete_size)
+        result = np.empty((count, len(self.discrete_branches)), dtype=np.int32)
+        # Rows are processed in blocks so the gathered (rows, branches, widest branch) array stays cache sized
+        block = max(1, (1 << 18) // max(1, self.gather_index.size))
+        padded = np.empty((min(block, count), self.discrete_size + 1), dtype=np.result_type(continuous_values.dtype, np.float32))
+        padded[:, available:] = -np.inf
+        for start in range(0, count, block):
+            rows = min(block, count - start)
+            padded[:rows, :available] = continuous_values[start:start + rows, :available]
+            padded[np.isnan(padded)] = -np.inf
+            result[start:start + rows] = np.argmax(padded[:rows, self.gather_index], axis=2)
+        return result
 
     def _process_discrete_to_network_output(self, action):
         if isinstance(action, np.ndarray) and len(self.discrete_branches) == 1 and len(action) == 1:
@@ -106,17 +150,25 @@ class ActionProcessor:
         return np.concatenate([continuous_action, discrete_continuous])
 
     def _discrete_to_continuous(self, discrete_values):
-        continuous_actions = []
-        value_idx = 0
-
-        for branch_size in self.discrete_branches:
-            if value_idx < len(discrete_values):
-                discrete_val = discrete_values[value_idx]
-                for i in range(branch_size):
-                    if i == discrete_val:
-                        continuous_actions.append(1.0)
-                    else:
-                        continuous_actions.append(-1.0)
-            value_idx += 1
-
-        return np.array(continuous_actions, dtype=np.float32)
\ No newline at end of file
+        discrete_values = np.asarray(discrete_values).reshape(-1)
+        # Branches without a value are left out, as before
+        branch_count = min(len(discrete_values), len(self.discrete_branches))
+        discrete_values = discrete_values[:branch_count]
+        result = np.full(self.branch_offsets[branch_count], -1.0, dtype=np.float32)
+        choices = discrete_values.astype(np.int64)
+        valid = (choices == discrete_values) & (choices >= 0) & (choices < self.branch_sizes[:branch_count])
+        result[self.branch_offsets[:branch_count][valid] + choices[valid]] = 1.0
+        return result
+
+    def _discrete_to_continuous_batch(self, discrete_values):
+        # One-hot scatter into a -1 filled array; values that are not a valid choice for their branch stay all -1
+        discrete_values = np.asarray(discrete_values)
+        count, branch_count = discrete_values.shape
+        branch_count = min(branch_count, len(self.discrete_branches))
+        discrete_values = discrete_values[:, :branch_count]
+        result = np.full((count, self.branch_offsets[branch_count]), -1.0, dtype=np.float32)
+        choices = discrete_values.astype(np.int64)
+        valid = (choices == discrete_values) & (choices >= 0) & (choices < self.branch_sizes[:branch_count])
+        rows, branches = np.nonzero(valid)
+        result[rows, self.branch_offsets[branches] + choices[rows, branches]] = 1.0
+        return result
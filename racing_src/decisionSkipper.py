@@ -0,0 +1,59 @@
+import numpy as np
+
+
+class DecisionSkipper:
+    # Repeats the last decision while the flattened observation stays within `threshold` (largest absolute
+    # change of any entry) of the observation that decision was made on, for at most max_repeats steps in a
+    # row. Comparing against the decision's observation rather than the previous step keeps slow drifts
+    # from adding up unnoticed.
+    def __init__(self, threshold=0.5, max_repeats=2):
+        self.threshold = threshold
+        self.max_repeats = max_repeats
+        self.reference = None
+        self.repeats = 0
+        self.steps = 0
+        self.skipped = 0
+        self.total_steps = 0
+        self.total_skipped = 0
+
+    def should_reuse(self, observation, done=False):
+        # The last step of an episode always gets a fresh decision
+        self.steps += 1
+        if (done or self.reference is None or self.repeats >= self.max_repeats
+                or np.max(np.abs(observation - self.reference)) > self.threshold):
+            return False
+        self.repeats += 1
+        self.skipped += 1
+        return True
+
+    def decided(self, observation):
+        if self.reference is None:
+            self.reference = np.array(observation, dtype=np.float32)
+        else:
+            np.copyto(self.reference, observation)
+        self.repeats = 0
+
+    def reset(self):
+        # Returns (skipped, steps) for the episode that just ended
+        episode = (self.skipped, self.steps)
+        self.total_skipped += self.skipped
+        self.total_steps += self.steps
+        self.reference = None
+        self.repeats = 0
+        self.steps = 0
+        self.skipped = 0
+        return episode
+
+    def skip_fraction(self):
+        steps = self.total_steps + self.steps
+        return (self.total_skipped + self.skipped) / steps if steps else 0.0
+
+
+def create_decision_skipper(skipping_config):
+    skipping_config = skipping_config or {}
+    if not skipping_config.get("enabled", False):
+        return None
+    return DecisionSkipper(
+        threshold=skipping_config.get("threshold", 0.5),
+        max_repeats=skipping_config.get("max_repeats", 2)
+    )
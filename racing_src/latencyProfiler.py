@@ -0,0 +1,165 @@
+import os
+import json
+import math
+import time
+import threading
+from contextlib import contextmanager
+
+
+class LatencyHistogram:
+    # Fixed log-spaced bins from 1 us to 10 s (20 per decade, ~12% wide), plus an overflow bin
+    MIN_SECONDS = 1e-6
+    BINS_PER_DECADE = 20
+    BIN_COUNT = BINS_PER_DECADE * 7 + 1
+
+    def __init__(self):
+        self.counts = [0] * self.BIN_COUNT
+        self.count = 0
+        self.max = 0.0
+
+    def add(self, seconds):
+        if seconds > self.MIN_SECONDS:
+            index = min(int(math.log10(seconds / self.MIN_SECONDS) * self.BINS_PER_DECADE), self.BIN_COUNT - 1)
+        else:
+            index = 0
+        self.counts[index] += 1
+        self.count += 1
+        if seconds > self.max:
+            self.max = seconds
+
+    def percentile(self, q):
+        if self.count == 0:
+            return 0.0
+        target = q / 100.0 * self.count
+        cumulative = 0
+        for index, count in enumerate(self.counts):
+            cumulative += count
+            if cumulative >= target:
+                # Report the upper edge of the bin, capped by the largest value actually seen
+                return min(self.MIN_SECONDS * 10 ** ((index + 1) / self.BINS_PER_DECADE), self.max)
+        return self.max
+
+    def reset(self):
+        self.counts = [0] * self.BIN_COUNT
+        self.count = 0
+        self.max = 0.0
+
+
+class LatencyProfiler:
+    def __init__(self, phases, timeout=0.1, alert_fraction=0.8, summary_path=None, name="MLPlay"):
+        self.histograms = {phase: LatencyHistogram() for phase in list(phases) + ["total"]}
+        self.step_times = {phase: 0.0 for phase in self.histograms}
+        self.timeout = timeout
+        self.alert_fraction = alert_fraction
+        self.alert_threshold = timeout * alert_fraction
+        self.summary_path = summary_path
+        self.name = name
+        self.slow_steps = 0
+        self.step_count = 0
+        self.step_start = 0.0
+        self.last = 0.0
+        # timed() may run on a background learner thread while the game thread flushes the episode
+        self.lock = threading.Lock()
+
+    def start(self):
+        self.step_start = self.last = time.perf_counter()
+
+    def mark(self, phase):
+        now = time.perf_counter()
+        elapsed = now - self.last
+        self.histograms[phase].add(elapsed)
+        self.step_times[phase] = elapsed
+        self.last = now
+
+    def stop(self):
+        total = time.perf_counter() - self.step_start
+        self.histograms["total"].add(total)
+        self.step_count += 1
+        if total >= self.alert_threshold:
+            self.slow_steps += 1
+            breakdown = ", ".join(f"{phase} {seconds * 1000:.1f} ms" for phase, seconds in self.step_times.items()
+                                  if phase != "total" and seconds > 0.0)
+            print(f"[{self.name}] Step {self.step_count} took {total * 1000:.1f} ms "
+                  f"({total / self.timeout:.0%} of the {self.timeout:.3f}s timeout): {breakdown}")
+        for phase in self.step_times:
+            self.step_times[phase] = 0.0
+
+    @contextmanager
+    def timed(self, phase):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            elapsed = time.perf_counter() - start
+            with self.lock:
+                self.histograms[phase].add(elapsed)
+
+    def summary(self):
+        return {
+            phase: {
+                "count": histogram.count,
+                "p50_ms": histogram.percentile(50) * 1000,
+                "p95_ms": histogram.percentile(95) * 1000,
+                "p99_ms": histogram.percentile(99) * 1000,
+                "max_ms": histogram.max * 1000
+            }
+            for phase, histogram in self.histograms.items() if histogram.count > 0
+        }
+
+    def flush_episode(self, episode, tensorboard_writer=None):
+        with self.lock:
+            summary = self.summary()
+            for histogram in self.histograms.values():
+                histogram.reset()
+        if tensorboard_writer is not None:
+            for phase, stats in summary.items():
+                for key in ("p50_ms", "p95_ms", "p99_ms"):
+                    tensorboard_writer.add_scalar(f"latency/{phase}_{key}", stats[key], episode)
+            tensorboard_writer.add_scalar("latency/slow_steps", self.slow_steps, episode)
+        if self.summary_path is not None:
+            os.makedirs(os.path.dirname(os.path.abspath(self.summary_path)), exist_ok=True)
+            with open(self.summary_path, "a") as f:
+                f.write(json.dumps({
+                    "name": self.name,
+                    "episode": episode,
+                    "steps": self.step_count,
+                    "slow_steps": self.slow_steps,
+                    "phases": summary
+                }) + "\n")
+        if self.slow_steps:
+            print(f"[{self.name}] {self.slow_steps}/{self.step_count} steps took over "
+                  f"{self.alert_fraction:.0%} of the {self.timeout:.3f}s timeout this episode")
+        self.slow_steps = 0
+        self.step_count = 0
+        return summary
+
+
+class NullProfiler:
+    def start(self):
+        pass
+
+    def mark(self, phase):
+        pass
+
+    def stop(self):
+        pass
+
+    @contextmanager
+    def timed(self, phase):
+        yield
+
+    def flush_episode(self, episode, tensorboard_writer=None):
+        return {}
+
+
+def create_profiler(profiling_config, phases, default_summary_path=None, name="MLPlay"):
+    profiling_config = profiling_config or {}
+    if not profiling_config.get("enabled", False):
+        return NullProfiler()
+    return LatencyProfiler(
+        phases,
+        timeout=profiling_config.get("timeout", 0.1),
+        alert_fraction=profiling_config.get("alert_fraction", 0.8),
+        summary_path=profiling_config.get("summary_path") or default_summary_path,
+        name=name
+    )
@@ -1,26 +1,113 @@
 import os
-import torch
+import time
 from envWrapper import EnvWrapper
-from stable_baselines3 import PPO
+from latencyProfiler import create_profiler
+from startupProfile import startup_profile
+from decisionSkipper import create_decision_skipper
+from observationNormalizer import create_observation_normalizer
+from modelWatcher import check_policy, create_model_watcher
 
 class MLPlay():
-    def __init__(self, observation_structure, action_space_info, model_path):
+    def __init__(self, observation_structure, action_space_info, model_path, policy_server=None, engine="sb3", deterministic=False,
+                 profiling=None, name="MLPlay", decision_skipping=None, hot_reload=None):
         model_path = model_path
         if(os.path.exists(model_path) == False):
             raise FileNotFoundError(f"Model file not found at {model_path}. Please check the path in config.json.")
-        self.model = PPO.load(model_path)
+        self.deterministic = deterministic
+        self.engine = engine
+        self.model = None
+        self.numpy_policy = None
+        self.policy_handle = None
+        self.model_watcher = None
         self.env_wrapper = EnvWrapper(observation_structure, action_space_info)
+        if policy_server is not None:
+            # The server normalizes the batch and reloads the shared model itself
+            self.policy_handle = policy_server.register(model_path, self.env_wrapper.observation_space.shape[0])
+        else:
+            self._use_policy(self._load_policy(model_path))
+            self.model_watcher = create_model_watcher(hot_reload, model_path, self._load_policy, name=name)
+        self.swap_on_step = self.model_watcher is not None and (hot_reload or {}).get("swap_at", "reset") == "step"
+        self.name = name
+        self.episode_count = 1
+        self.decision_skipper = create_decision_skipper(decision_skipping)
+        self.prev_env_action = None
+        self.profiler = create_profiler(
+            profiling,
+            ["policy", "create_action"],
+            default_summary_path=os.path.join(os.path.dirname(os.path.abspath(model_path)), f"latency_racing_{time.strftime('%Y%m%d_%H%M%S')}.jsonl"),
+            name=name
+        )
 
     def reset(self):
-        pass
+        self.profiler.flush_episode(self.episode_count)
+        if self.model_watcher is not None:
+            self._swap_policy()
+        if self.decision_skipper is not None:
+            skipped, steps = self.decision_skipper.reset()
+            print(f"[{self.name}] Episode {self.episode_count}: Skipped Forward Passes = {skipped}/{steps}")
+        self.prev_env_action = None
+        self.episode_count += 1
 
     def update(self, observations, done, info, keyboard=set(), *args, **kwargs):
+        self.profiler.start()
+        if self.swap_on_step and self.model_watcher.loaded is not None:
+            self._swap_policy()
         observation = observations["flattened"]
-        action, log_prob, value = self._predict_with_info(observation)
-        return self.env_wrapper.action_processor.create_action(action)
+        if self.decision_skipper is not None and self.prev_env_action is not None and self.decision_skipper.should_reuse(observation, done):
+            if self.policy_handle is not None:
+                self.policy_handle.skip()
+            self.profiler.stop()
+            return self.prev_env_action
+        action, log_prob, value = self._predict_with_info(self.env_wrapper.normalize_observation(observation))
+        self.profiler.mark("policy")
+        if self.decision_skipper is not None:
+            self.decision_skipper.decided(observation)
+        env_action = self.env_wrapper.action_processor.create_action(action)
+        self.prev_env_action = env_action
+        self.profiler.mark("create_action")
+        self.profiler.stop()
+        startup_profile.first_action()
+        return env_action
     
+    def close(self):
+        # Leaves the shared model's batch and stops watching the model file
+        if self.policy_handle is not None:
+            self.policy_handle.close()
+        if self.model_watcher is not None:
+            self.model_watcher.close()
+
+    def _load_policy(self, model_path):
+        # (model, numpy_policy, observation normalizer); runs on the watcher's thread when reloading
+        model = None
+        numpy_policy = None
+        if self.engine == "numpy":
+            from numpyPolicy import load_numpy_policy
+            numpy_policy = load_numpy_policy(model_path)
+        else:
+            import torch
+            from stable_baselines3 import PPO
+            self.torch = torch
+            model = PPO.load(model_path)
+        size = self.env_wrapper.observation_space.shape[0]
+        check_policy(size, model, numpy_policy)
+        # Checkpoints trained on normalized observations carry their statistics, applied here unchanged
+        return model, numpy_policy, create_observation_normalizer(None, size, model_path)
+
+    def _use_policy(self, policy):
+        self.model, self.numpy_policy, self.env_wrapper.observation_normalizer = policy
+
+    def _swap_policy(self):
+        policy = self.model_watcher.take()
+        if policy is not None:
+            self._use_policy(policy)
+            print(f"[{self.name}] Episode {self.episode_count}: playing the updated model")
+
     def _predict_with_info(self, obs):
-        obs_tensor = torch.as_tensor(obs).unsqueeze(0)
-        with torch.no_grad():
-            action, value, log_prob = self.model.policy(obs_tensor)
+        if self.policy_handle is not None:
+            return self.policy_handle.predict(obs)
+        if self.numpy_policy is not None:
+            return self.numpy_policy.forward(obs, deterministic=self.deterministic), None, None
+        obs_tensor = self.torch.as_tensor(obs).unsqueeze(0)
+        with self.torch.no_grad():
+            action, value, log_prob = self.model.policy(obs_tensor, deterministic=self.deterministic)
         return action.cpu().numpy().flatten(), log_prob.cpu().numpy().flatten(), value.cpu().numpy().flatten()
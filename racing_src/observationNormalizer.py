@@ -0,0 +1,120 @@
+import io
+import zipfile
+import threading
+import numpy as np
+
+# Zip entry next to the policy in every checkpoint trained with normalized observations; PPO.load ignores it
+NORMALIZER_ENTRY = "observation_normalizer.npz"
+
+
+class ObservationNormalizer:
+    # Running per-entry mean and variance of the flattened observation (Welford, merged batch-wise with
+    # Chan's formula), applied as clip((obs - mean) / sqrt(var + epsilon), -clip, clip).
+    # observe() only copies the observation into a staging array; the statistics, and the float32 mean and
+    # scale normalize() uses, are updated once every update_every observations.
+    def __init__(self, size, clip=10.0, epsilon=1e-8, update_every=256):
+        self.size = size
+        self.clip = clip
+        self.epsilon = epsilon
+        self.count = 0
+        self.mean = np.zeros(size, dtype=np.float64)
+        self.m2 = np.zeros(size, dtype=np.float64)
+        self.staged = np.zeros((update_every, size), dtype=np.float32)
+        self.staged_count = 0
+        # Checkpoints are snapshotted from the learner thread while the game thread keeps updating
+        self.lock = threading.Lock()
+        self._refresh()
+
+    @property
+    def var(self):
+        return self.m2 / self.count if self.count > 0 else np.ones(self.size, dtype=np.float64)
+
+    def normalize(self, obs):
+        normalized = np.subtract(obs, self._mean, dtype=np.float32)
+        np.multiply(normalized, self._scale, out=normalized)
+        return np.clip(normalized, -self.clip, self.clip, out=normalized)
+
+    def observe(self, obs):
+        self.staged[self.staged_count] = obs
+        self.staged_count += 1
+        if self.staged_count == len(self.staged):
+            self.flush()
+
+    def flush(self):
+        if self.staged_count:
+            self.update_batch(self.staged[:self.staged_count])
+            self.staged_count = 0
+
+    def update_batch(self, batch):
+        batch = np.asarray(batch, dtype=np.float64).reshape(-1, self.size)
+        if len(batch) == 0:
+            return
+        batch_mean = batch.mean(axis=0)
+        batch_m2 = ((batch - batch_mean) ** 2).sum(axis=0)
+        with self.lock:
+            count = self.count + len(batch)
+            delta = batch_mean - self.mean
+            self.mean = self.mean + delta * (len(batch) / count)
+            self.m2 = self.m2 + batch_m2 + delta ** 2 * (self.count * len(batch) / count)
+            self.count = count
+            self._refresh()
+
+    def to_bytes(self):
+        with self.lock:
+            state = {"count": np.int64(self.count), "mean": self.mean, "m2": self.m2,
+                     "clip": np.float64(self.clip), "epsilon": np.float64(self.epsilon)}
+            buffer = io.BytesIO()
+            np.savez(buffer, **state)
+        return buffer.getvalue()
+
+    @classmethod
+    def from_bytes(cls, data, update_every=256):
+        state = np.load(io.BytesIO(data))
+        normalizer = cls(len(state["mean"]), clip=float(state["clip"]), epsilon=float(state["epsilon"]), update_every=update_every)
+        normalizer.count = int(state["count"])
+        normalizer.mean = state["mean"].astype(np.float64)
+        normalizer.m2 = state["m2"].astype(np.float64)
+        normalizer._refresh()
+        return normalizer
+
+    def _refresh(self):
+        self._mean = self.mean.astype(np.float32)
+        self._scale = (1.0 / np.sqrt(self.var + self.epsilon)).astype(np.float32)
+
+
+def load_observation_normalizer(model_path, update_every=256):
+    # The statistics saved in a checkpoint, or None if it was trained on raw observations
+    try:
+        with zipfile.ZipFile(model_path) as archive:
+            if NORMALIZER_ENTRY not in archive.namelist():
+                return None
+            return ObservationNormalizer.from_bytes(archive.read(NORMALIZER_ENTRY), update_every=update_every)
+    except (OSError, zipfile.BadZipFile):
+        return None
+
+
+def save_observation_normalizer(model_path, normalizer):
+    # Adds the statistics to a zip written by model.save
+    with zipfile.ZipFile(model_path, mode="a") as archive:
+        archive.writestr(NORMALIZER_ENTRY, normalizer.to_bytes())
+
+
+def create_observation_normalizer(normalization_config, size, model_path=None):
+    # A checkpoint saved with statistics keeps being normalized with them, whatever the config says;
+    # otherwise "enabled" starts fresh statistics
+    normalization_config = normalization_config or {}
+    update_every = normalization_config.get("update_every", 256)
+    normalizer = load_observation_normalizer(model_path, update_every) if model_path is not None else None
+    if normalizer is not None:
+        if normalizer.size != size:
+            raise ValueError(f"{model_path} normalizes {normalizer.size} observation entries, the game sends {size}")
+        print(f"Observation normalizer loaded from {model_path} ({normalizer.count} observations)")
+        return normalizer
+    if not normalization_config.get("enabled", False):
+        return None
+    return ObservationNormalizer(
+        size,
+        clip=normalization_config.get("clip", 10.0),
+        epsilon=normalization_config.get("epsilon", 1e-8),
+        update_every=update_every
+    )
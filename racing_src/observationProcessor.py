@@ -1,12 +1,87 @@
+import numpy as np
+from collections import namedtuple
+
+# offset: index of the field's first element in the flattened vector, shape/dtype: one value of the field.
+# Fields inside Lists and Grids repeat: repeat is (item_count,) or (grid_size, grid_size) and repeat_strides
+# the distance in elements between consecutive items, so a single strided view covers every item.
+FieldLayout = namedtuple("FieldLayout", ["offset", "shape", "dtype", "repeat", "repeat_strides"])
+
+ITEM_DTYPES = {"float": np.float32, "int": np.int32, "bool": np.bool_}
+VECTOR_SIZES = {"Vector3": 3, "Vector2": 2}
+
+
 class ObservationProcessor:
     def __init__(self, observation_structure):
         self.observation_structure = observation_structure
         self.observation_size = self._calculate_observation_size(observation_structure)
+        self.layout = {}
+        self.layout_size = self._compile_layout(observation_structure, 0, "", (), ())
         print(f"Observation size calculated: {self.observation_size}")
 
     def get_size(self):
         return self.observation_size
 
+    def view(self, flattened, key):
+        # Read-only view of one field by name ("target_position", "nearby_map_objects.relative_position", ...)
+        # for a single (size,) observation or a (..., size) batch; nothing is copied
+        field = self.layout[key]
+        flattened = np.asarray(flattened)
+        if flattened.shape[-1] < self.layout_size:
+            raise ValueError(f"Observation has {flattened.shape[-1]} values, the layout needs {self.layout_size}")
+        element = flattened.strides[-1]
+        return np.lib.stride_tricks.as_strided(
+            flattened[..., field.offset:],
+            shape=flattened.shape[:-1] + field.repeat + field.shape,
+            strides=flattened.strides[:-1] + tuple(stride * element for stride in field.repeat_strides) + (element,) * len(field.shape),
+            writeable=False
+        )
+
+    def value(self, flattened, key):
+        # Like view, but int and bool fields are converted the way the game's parser does (int() and > 0.5)
+        view = self.view(flattened, key)
+        dtype = self.layout[key].dtype
+        if dtype is np.bool_:
+            return view > 0.5
+        if dtype is np.int32:
+            return view.astype(np.int32)
+        return view
+
+    def views(self, flattened, keys=None):
+        return {key: self.view(flattened, key) for key in (keys or self.layout)}
+
+    def _compile_layout(self, items, offset, prefix, repeat, repeat_strides):
+        for item in items:
+            item_type = item.get("type", "")
+            item_key = item.get("key", "")
+            # The game's parser skips items without a key
+            if not item_key:
+                continue
+            name = prefix + item_key
+
+            if item_type in ITEM_DTYPES:
+                self.layout[name] = FieldLayout(offset, (), ITEM_DTYPES[item_type], repeat, repeat_strides)
+                offset += 1
+            elif item_type in VECTOR_SIZES or item_type == "Vector":
+                size = VECTOR_SIZES.get(item_type, item.get("vector_size", 0))
+                self.layout[name] = FieldLayout(offset, (size,), np.float32, repeat, repeat_strides)
+                offset += size
+            elif item_type == "List" or item_type == "Grid":
+                sub_items = item.get("items", [])
+                item_size = self._calculate_observation_size(sub_items)
+                if item_type == "List":
+                    # A List without item_count takes whatever is left; the observation space sizes it as one item
+                    item_repeat = (item.get("item_count", 0) or 1,)
+                    item_strides = (item_size,)
+                else:
+                    grid_size = item.get("grid_size", 0)
+                    item_repeat = (grid_size, grid_size)
+                    item_strides = (item_size * grid_size, item_size)
+                # The whole List/Grid is also addressable, one row of item_size values per item
+                self.layout[name] = FieldLayout(offset, (item_size,), np.float32, repeat + item_repeat, repeat_strides + item_strides)
+                self._compile_layout(sub_items, offset, name + ".", repeat + item_repeat, repeat_strides + item_strides)
+                offset += item_size * int(np.prod(item_repeat))
+        return offset
+
     def _calculate_observation_size(self, observation_structure):
         total_size = 0
 
@@ -22,6 +97,8 @@ class ObservationProcessor:
                 total_size += 3
             elif item_type == "Vector2":
                 total_size += 2
+            elif item_type == "Vector":
+                total_size += item.get("vector_size", 0)
             elif item_type == "float" or item_type == "int" or item_type == "bool":
                 total_size += 1
             elif item_type == "Grid":
@@ -39,4 +116,4 @@ class ObservationProcessor:
                 else:
                     total_size += sub_item_size
 
-        return total_size
\ No newline at end of file
+        return total_size
@@ -0,0 +1,155 @@
+import os
+import time
+import threading
+import numpy as np
+from modelWatcher import check_policy, create_model_watcher
+from observationNormalizer import create_observation_normalizer
+
+
+class PolicyServer:
+    def __init__(self, batch_wait=0.02, engine="sb3", deterministic=False, hot_reload=None):
+        self.batch_wait = batch_wait
+        self.engine = engine
+        self.deterministic = deterministic
+        self.hot_reload = hot_reload
+        self.groups = {}
+        self.lock = threading.Lock()
+
+    def register(self, model_path, observation_size):
+        key = os.path.normcase(os.path.abspath(model_path))
+        with self.lock:
+            group = self.groups.get(key)
+            if group is None:
+                group = ModelGroup(self._load_forward(model_path, observation_size), self.batch_wait)
+                # A reloaded model takes over at the next batch, for every player sharing it at once
+                group.model_watcher = create_model_watcher(
+                    self.hot_reload, model_path, lambda path: self._load_forward(path, observation_size),
+                    name=f"PolicyServer {os.path.basename(model_path)}")
+                self.groups[key] = group
+                print(f"Model loaded from {model_path}")
+            else:
+                print(f"Sharing already loaded model {model_path}")
+            return PolicyHandle(group, group.add_member())
+
+    def _load_forward(self, model_path, observation_size):
+        deterministic = self.deterministic
+        # Checkpoints trained on normalized observations carry their statistics; the whole batch is normalized at once
+        normalizer = create_observation_normalizer(None, observation_size, model_path)
+        normalize = normalizer.normalize if normalizer is not None else np.asarray
+        if self.engine == "numpy":
+            from numpyPolicy import load_numpy_policy
+            numpy_policy = load_numpy_policy(model_path)
+            check_policy(observation_size, numpy_policy=numpy_policy)
+
+            def forward(obs_batch):
+                return numpy_policy.forward(normalize(obs_batch), deterministic=deterministic), None, None
+            return forward
+
+        import torch
+        from stable_baselines3 import PPO
+        model = PPO.load(model_path)
+        check_policy(observation_size, model=model)
+
+        def forward(obs_batch):
+            with torch.no_grad():
+                actions, values, log_probs = model.policy(torch.as_tensor(normalize(obs_batch)), deterministic=deterministic)
+            return actions.cpu().numpy(), log_probs.cpu().numpy(), values.cpu().numpy()
+        return forward
+
+
+class PolicyHandle:
+    def __init__(self, group, member):
+        self.group = group
+        self.member = member
+
+    def predict(self, obs):
+        return self.group.predict(self.member, obs)
+
+    def skip(self):
+        self.group.skip(self.member)
+
+    def close(self):
+        self.group.remove_member(self.member)
+
+
+class ModelGroup:
+    # Collects the observations of every player sharing one model for the current tick and runs a
+    # single batched forward pass. GameRunner calls each player's update() on its own thread, so the
+    # last player to arrive runs the batch; if someone does not show up within batch_wait (finished
+    # player, slow reward code), the waiting players go ahead without it.
+    def __init__(self, forward, batch_wait):
+        self.forward = forward
+        self.batch_wait = batch_wait
+        self.members = []
+        self.next_member = 0
+        self.expected = set()
+        self.pending = {}
+        self.skipped = set()
+        self.results = {}
+        self.model_watcher = None
+        self.condition = threading.Condition()
+
+    def add_member(self):
+        with self.condition:
+            member = self.next_member
+            self.next_member += 1
+            self.members.append(member)
+            self.expected.add(member)
+            return member
+
+    def predict(self, member, obs):
+        with self.condition:
+            self.pending[member] = obs
+            if self.expected.issubset(self.skipped.union(self.pending)):
+                self._run_pending()
+            else:
+                deadline = time.perf_counter() + self.batch_wait
+                while member not in self.results:
+                    remaining = deadline - time.perf_counter()
+                    if remaining <= 0:
+                        self._run_pending()
+                        break
+                    self.condition.wait(remaining)
+            return self.results.pop(member)
+
+    def skip(self, member):
+        # The player repeats its last action this tick: it counts as arrived without adding to the batch,
+        # and stays expected for the next tick
+        with self.condition:
+            self.skipped.add(member)
+            if self.expected.issubset(self.skipped.union(self.pending)):
+                if self.pending:
+                    self._run_pending()
+                else:
+                    self.skipped.clear()
+
+    def remove_member(self, member):
+        # A player that left (end of a match) is no longer waited for; players already waiting on it go ahead now
+        with self.condition:
+            if member not in self.members:
+                return
+            self.members.remove(member)
+            self.expected.discard(member)
+            self.skipped.discard(member)
+            self.pending.pop(member, None)
+            self.results.pop(member, None)
+            if self.pending and self.expected.issubset(self.skipped.union(self.pending)):
+                self._run_pending()
+
+    def _run_pending(self):
+        if self.model_watcher is not None:
+            forward = self.model_watcher.take()
+            if forward is not None:
+                self.forward = forward
+        members = list(self.pending)
+        actions, log_probs, values = self.forward(np.stack([self.pending[member] for member in members]))
+        for i, member in enumerate(members):
+            self.results[member] = (
+                actions[i].flatten(),
+                log_probs[i].flatten() if log_probs is not None else None,
+                values[i].flatten() if values is not None else None
+            )
+        self.expected = self.skipped.union(members)
+        self.pending.clear()
+        self.skipped.clear()
+        self.condition.notify_all()
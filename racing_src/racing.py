@@ -1,18 +1,24 @@
+from startupProfile import startup_profile
 from mlPlay import MLPlay
-from mlgame3d.game_runner import GameRunner
-from mlgame3d.game_env import GameEnvironment
+from policyServer import PolicyServer
 from utils import get_config, dict_to_tuple_list
 
-def create_env(game_path, game_parameters: dict, count: int):
+# mlgame3d is imported once the runner count is chosen; with the sb3 engine torch and
+# stable_baselines3 are prefetched while the game launches
+PREFETCH_MODULES = ["torch", "stable_baselines3", "torch._dynamo"]
+
+def create_env(game_path, game_parameters: dict, count: int, worker_id=0, no_graphics=False, time_scale=1.0):
+    with startup_profile.phase("import mlgame3d"):
+        from mlgame3d.game_env import GameEnvironment
     # Create the environment with controlled players
     controlled_players = list(range(count))
     control_modes = ["mlplay"] * count
     env = GameEnvironment(
         file_name=game_path,  # Or None to connect to a running Unity editor
-        worker_id=0,
-        no_graphics=False,
+        worker_id=worker_id,  # Port offset, distinct per running game instance
+        no_graphics=no_graphics,
         fps=60,  # Target frames per second for rendering
-        time_scale=1.0,  # Time scale factor for simulation speed
+        time_scale=time_scale,  # Time scale factor for simulation speed
         decision_period=5,  # Number of FixedUpdate steps between AI decisions
         controlled_players=controlled_players,  # Control P1 to P{count}
         control_modes=control_modes,  # Control P1 to P{count} with MLPlay
@@ -20,17 +26,22 @@ def create_env(game_path, game_parameters: dict, count: int):
     )
     return env
 
-def get_mlplay(index, observation_structure, action_space_info, config):
+def get_mlplay(index, observation_structure, action_space_info, config, policy_server=None):
     # Create an MLPlay instance for the given index
     mlplay = MLPlay(
         observation_structure=observation_structure,
         action_space_info=action_space_info,
-        model_path=config[f"model_{index}"]
+        model_path=config[f"model_{index}"],
+        policy_server=policy_server,  # Players sharing a model file share one copy and one batched forward pass
+        profiling=config.get("profiling"),
+        name=f"MLPlay{index}",
+        decision_skipping=config.get("decision_skipping")
     )
 
     return mlplay
 
 def create_runner(mlplays: list, env, mlplay_to_behavior_map, game_parameters):
+    from mlgame3d.game_runner import GameRunner
     # Create a game runner
     runner = GameRunner(
         env=env,
@@ -53,8 +64,18 @@ def choose_runner():
 
 if __name__ == "__main__":
     config = get_config()
-    count = choose_runner()
-    env = create_env(config["game_path"], config["game_parameters"], count)
+    with startup_profile.phase("choose runners", waiting=True):
+        count = choose_runner()
+    if config.get("inference_engine", "sb3") != "numpy":
+        startup_profile.prefetch(PREFETCH_MODULES)
+    with startup_profile.phase("launch game"):
+        env = create_env(config["game_path"], config["game_parameters"], count)
+    policy_server = PolicyServer(
+        batch_wait=config.get("batch_wait", 0.02),
+        engine=config.get("inference_engine", "sb3"),  # "numpy" runs the actor network without torch
+        deterministic=config.get("deterministic", False),
+        hot_reload=config.get("hot_reload")  # Reloads each model file the players share when it changes
+    )
     mlplay_to_behavior_map = {}
     mlplays = []
     for i in range(count):
@@ -62,7 +83,8 @@ if __name__ == "__main__":
         observation_structure = env.get_observation_structure(behavior_name)
         action_space_info = env.get_action_space_info(behavior_name)
         mlplay_to_behavior_map[i] = behavior_name
-        mlplay = get_mlplay(i + 1, observation_structure, action_space_info, config)
+        with startup_profile.phase(f"create MLPlay{i + 1}"):
+            mlplay = get_mlplay(i + 1, observation_structure, action_space_info, config, policy_server)
         mlplays.append(mlplay)
 
     runner = create_runner(mlplays, env, mlplay_to_behavior_map, config["game_parameters"])
@@ -0,0 +1,332 @@
+import os
+import re
+import sys
+import json
+import queue
+import random
+import hashlib
+import argparse
+import itertools
+import multiprocessing as mp
+from utils import get_config
+
+SRC_DIR = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "src")
+CACHE_NAME = "tournament.json"
+
+
+def file_hash(path):
+    # Results are keyed by checkpoint content, so renamed or copied checkpoints keep their matches
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for block in iter(lambda: f.read(1 << 20), b""):
+            digest.update(block)
+    return digest.hexdigest()[:16]
+
+
+def natural_key(path):
+    # ppo_model_9.zip before ppo_model_10.zip
+    return [int(part) if part.isdigit() else part for part in re.split(r"(\d+)", path)]
+
+
+def find_checkpoints(checkpoint_dir):
+    paths = []
+    for root, _, files in os.walk(checkpoint_dir):
+        paths += [os.path.join(root, name) for name in files if name.endswith(".zip")]
+    return sorted(paths, key=lambda path: natural_key(os.path.relpath(path, checkpoint_dir)))
+
+
+def load_cache(cache_path):
+    if not os.path.exists(cache_path):
+        return {"checkpoints": {}, "matches": {}}
+    with open(cache_path, "r") as f:
+        return json.load(f)
+
+
+def save_cache(cache, cache_path):
+    with open(cache_path + ".tmp", "w") as f:
+        json.dump(cache, f, indent=2)
+    os.replace(cache_path + ".tmp", cache_path)
+
+
+def register_checkpoints(cache, checkpoint_dir):
+    # Checkpoints join in the order they are first seen, which fixes their place in the schedule.
+    # Returns {hash: path} for the checkpoints currently in the directory.
+    present = {}
+    for path in find_checkpoints(checkpoint_dir):
+        key = file_hash(path)
+        if key in present:
+            continue
+        present[key] = path
+        entry = cache["checkpoints"].setdefault(key, {"order": len(cache["checkpoints"])})
+        entry["name"] = os.path.relpath(path, checkpoint_dir)
+    return present
+
+
+def schedule_matches(order, rounds, players):
+    # Each checkpoint, once players - 1 checkpoints came before it, plays `rounds` matches against opponents
+    # drawn from those earlier checkpoints. The draw only depends on the checkpoint's hash, so adding
+    # checkpoints only adds matches and every match already played keeps its key.
+    matches = []
+    for i, newcomer in enumerate(order):
+        earlier = order[:i]
+        if len(earlier) < players - 1:
+            continue
+        for round_index in range(rounds):
+            rng = random.Random(f"{newcomer}:{round_index}")
+            seats = [newcomer] + rng.sample(earlier, players - 1)
+            rng.shuffle(seats)
+            matches.append(f"{round_index}:{','.join(seats)}")
+    return matches
+
+
+def match_seats(match_key):
+    return match_key.split(":", 1)[1].split(",")
+
+
+def assign_places(players):
+    # Finished players by finishing step, the rest by checkpoints reached; equal results share a place
+    def sort_key(player):
+        if player["finish_step"] is not None:
+            return (0, player["finish_step"])
+        return (1, -player["checkpoint"])
+
+    keys = [sort_key(player) for player in players]
+    for player, key in zip(players, keys):
+        player["place"] = 1 + sum(other < key for other in keys)
+    return players
+
+
+def compute_ratings(matches, cache, initial_rating, k_factor):
+    # Elo over every pair in a match (the better place scores 1, a shared place 0.5), applied once per match
+    # in schedule order; K is split across the opponents so a 4-player match moves ratings like one game
+    ratings = {}
+    stats = {}
+    for match_key in matches:
+        result = cache["matches"][match_key]["players"]
+        for player in result:
+            ratings.setdefault(player["hash"], initial_rating)
+            stat = stats.setdefault(player["hash"], {"matches": 0, "wins": 0, "places": 0, "finished": 0, "checkpoints": 0})
+            stat["matches"] += 1
+            stat["wins"] += player["place"] == 1
+            stat["places"] += player["place"]
+            stat["finished"] += player["finish_step"] is not None
+            stat["checkpoints"] += player["checkpoint"]
+
+        changes = {player["hash"]: 0.0 for player in result}
+        scale = k_factor / max(1, len(result) - 1)
+        for a, b in itertools.combinations(result, 2):
+            expected = 1.0 / (1.0 + 10.0 ** ((ratings[b["hash"]] - ratings[a["hash"]]) / 400.0))
+            score = 1.0 if a["place"] < b["place"] else 0.5 if a["place"] == b["place"] else 0.0
+            changes[a["hash"]] += scale * (score - expected)
+            changes[b["hash"]] -= scale * (score - expected)
+        for key, change in changes.items():
+            ratings[key] += change
+    return ratings, stats
+
+
+class MatchPlayer:
+    # Wraps a seat's MLPlay and keeps the checkpoint progress and the step it finished on
+    def __init__(self, mlplay, checkpoint_hash):
+        self.mlplay = mlplay
+        self.name = mlplay.name
+        self.checkpoint_hash = checkpoint_hash
+        self.steps = 0
+        self.checkpoint = 0
+        self.finish_step = None
+        self.health = None
+
+    def update(self, observations, done, info, keyboard=set(), *args, **kwargs):
+        self.steps += 1
+        self.checkpoint = max(self.checkpoint, int(observations["last_checkpoint_index"]))
+        self.health = float(observations["agent_health"])
+        if self.finish_step is None and bool(observations["reached_final_checkpoint"]):
+            self.finish_step = self.steps
+        return self.mlplay.update(observations, done, info, keyboard, *args, **kwargs)
+
+    def reset(self):
+        self.mlplay.reset()
+
+    def result(self):
+        return {"hash": self.checkpoint_hash, "checkpoint": self.checkpoint, "finish_step": self.finish_step,
+                "health": self.health}
+
+
+def run_worker(worker_index, match_queue, result_queue, options):
+    config = get_config()
+    players = options["players"]
+    worker_id = options["base_worker_id"] + worker_index
+    if options["stand_in"]:
+        sys.path.append(SRC_DIR)
+        from standInGame import StandInEnvironment, StandInRunner
+        env = StandInEnvironment(worker_id=worker_id, controlled_players=list(range(players)),
+                                 game_parameters=config["game_parameters"])
+        runner_class = StandInRunner
+    else:
+        from racing import create_env
+        from mlgame3d.game_runner import GameRunner
+        env = create_env(config["game_path"], config["game_parameters"], players, worker_id=worker_id,
+                         no_graphics=True, time_scale=options["time_scale"])
+        runner_class = GameRunner
+
+    try:
+        from mlPlay import MLPlay
+        from policyServer import PolicyServer
+        # Every seat in a match is a different checkpoint, so there is nothing to batch; the server only
+        # keeps each checkpoint loaded for the next match it plays in
+        policy_server = PolicyServer(
+            batch_wait=0.0,
+            engine=config.get("inference_engine", "sb3"),
+            deterministic=config.get("deterministic", False)
+        )
+        behavior_names = env.behavior_names[:players]
+        while True:
+            match = match_queue.get()
+            if match is None:
+                break
+            match_key, paths = match
+            seats = []
+            try:
+                for seat, (checkpoint_hash, path) in enumerate(zip(match_seats(match_key), paths)):
+                    behavior_name = behavior_names[seat]
+                    mlplay = MLPlay(
+                        observation_structure=env.get_observation_structure(behavior_name),
+                        action_space_info=env.get_action_space_info(behavior_name),
+                        model_path=path,
+                        policy_server=policy_server,
+                        name=f"MLPlay{seat + 1}"
+                    )
+                    seats.append(MatchPlayer(mlplay, checkpoint_hash))
+                runner = runner_class(
+                    env=env,
+                    mlplays=seats,
+                    max_episodes=1,
+                    render=False,
+                    mlplay_timeout=0.1,
+                    game_parameters=config["game_parameters"],
+                    mlplay_to_behavior_map=dict(enumerate(behavior_names))
+                )
+                runner.run()
+                runner.executor.shutdown()
+                result_queue.put(("result", match_key, {
+                    "players": assign_places([seat.result() for seat in seats]),
+                    "steps": max(seat.steps for seat in seats)
+                }))
+            except Exception as e:
+                result_queue.put(("error", match_key, str(e)))
+            finally:
+                # The next match's seats must not wait for this one's players in the shared model groups
+                for seat in seats:
+                    seat.mlplay.close()
+    finally:
+        env.close()
+        result_queue.put(("done", worker_index))
+
+
+def run_matches(pending, present, cache, cache_path, options):
+    context = mp.get_context("spawn")
+    match_queue = context.Queue()
+    result_queue = context.Queue()
+    for match_key in pending:
+        match_queue.put((match_key, [present[checkpoint_hash] for checkpoint_hash in match_seats(match_key)]))
+    workers = min(options["workers"], len(pending))
+    for _ in range(workers):
+        match_queue.put(None)
+
+    processes = []
+    for worker_index in range(workers):
+        process = context.Process(target=run_worker, args=(worker_index, match_queue, result_queue, options), daemon=True)
+        process.start()
+        processes.append(process)
+
+    running = workers
+    played = 0
+    try:
+        while running > 0:
+            try:
+                message = result_queue.get(timeout=1.0)
+            except queue.Empty:
+                if not any(process.is_alive() for process in processes):
+                    print("Error: every tournament worker exited early")
+                    break
+                continue
+            if message[0] == "result":
+                # Saved as they arrive, so an interrupted tournament resumes where it stopped
+                cache["matches"][message[1]] = message[2]
+                save_cache(cache, cache_path)
+                played += 1
+                places = ", ".join(f"{cache['checkpoints'][player['hash']]['name']} {player['place']}"
+                                   for player in sorted(message[2]["players"], key=lambda player: player["place"]))
+                print(f"Match {played}/{len(pending)} ({message[2]['steps']} steps): {places}")
+            elif message[0] == "error":
+                print(f"Error playing match {message[1]}: {message[2]}")
+            elif message[0] == "done":
+                running -= 1
+    finally:
+        for process in processes:
+            process.join(timeout=5)
+            if process.is_alive():
+                process.terminate()
+
+
+def print_ratings(ratings, stats, cache):
+    print(f"\n{'rank':>4} {'rating':>7} {'matches':>7} {'wins':>5} {'place':>6} {'finished':>8} {'checkpoints':>11}  checkpoint")
+    ranked = sorted(ratings, key=lambda key: ratings[key], reverse=True)
+    for rank, key in enumerate(ranked, 1):
+        stat = stats[key]
+        print(f"{rank:>4} {ratings[key]:7.1f} {stat['matches']:>7} {stat['wins']:>5} {stat['places'] / stat['matches']:6.2f} "
+              f"{stat['finished'] / stat['matches']:8.0%} {stat['checkpoints'] / stat['matches']:11.2f}  {cache['checkpoints'][key]['name']}")
+
+
+def run_tournament(checkpoint_dir, options):
+    cache_path = options["cache_path"] or os.path.join(checkpoint_dir, CACHE_NAME)
+    cache = load_cache(cache_path)
+    present = register_checkpoints(cache, checkpoint_dir)
+    if len(present) < options["players"]:
+        raise ValueError(f"A tournament needs at least {options['players']} distinct checkpoints, found {len(present)} in {checkpoint_dir}")
+
+    order = sorted(present, key=lambda key: cache["checkpoints"][key]["order"])
+    matches = schedule_matches(order, options["rounds"], options["players"])
+    pending = [match_key for match_key in matches if match_key not in cache["matches"]]
+    print(f"{len(present)} checkpoints, {len(matches)} matches scheduled, {len(matches) - len(pending)} already played")
+    save_cache(cache, cache_path)
+
+    if pending and not options["dry_run"]:
+        run_matches(pending, present, cache, cache_path, options)
+
+    played = [match_key for match_key in matches if match_key in cache["matches"]]
+    ratings, stats = compute_ratings(played, cache, options["initial_rating"], options["k_factor"])
+    cache["ratings"] = {key: round(rating, 1) for key, rating in ratings.items()}
+    save_cache(cache, cache_path)
+    if ratings:
+        print_ratings(ratings, stats, cache)
+    print(f"Results cached in {cache_path}")
+
+
+if __name__ == "__main__":
+    config = get_config()
+    tournament_config = config.get("tournament", {})
+    parser = argparse.ArgumentParser(description="Rank a directory of checkpoints with parallel headless 4-player races")
+    parser.add_argument("checkpoint_dir", nargs="?", default=tournament_config.get("checkpoint_dir"),
+                        help="Directory searched for *.zip checkpoints (default: tournament.checkpoint_dir, else model_1's directory)")
+    parser.add_argument("--rounds", type=int, default=tournament_config.get("rounds", 3), help="Matches each checkpoint enters with")
+    parser.add_argument("--players", type=int, default=tournament_config.get("players", 4))
+    parser.add_argument("--workers", type=int, default=tournament_config.get("workers", max(1, (os.cpu_count() or 2) // 2)))
+    parser.add_argument("--base-worker-id", type=int, default=tournament_config.get("base_worker_id", 20))
+    parser.add_argument("--time-scale", type=float, default=tournament_config.get("time_scale", 1.0))
+    parser.add_argument("--cache", default=tournament_config.get("cache_path"), help=f"Result cache (default: <checkpoint_dir>/{CACHE_NAME})")
+    parser.add_argument("--dry-run", action="store_true", help="Only print the schedule and the current ratings")
+    parser.add_argument("--stand-in", action="store_true", help="Use the synthetic stand-in game instead of Proly")
+    args = parser.parse_args()
+
+    run_tournament(args.checkpoint_dir or os.path.dirname(os.path.abspath(config["model_1"])), {
+        "rounds": args.rounds,
+        "players": args.players,
+        "workers": args.workers,
+        "base_worker_id": args.base_worker_id,
+        "time_scale": args.time_scale,
+        "cache_path": args.cache,
+        "dry_run": args.dry_run,
+        "stand_in": args.stand_in,
+        "initial_rating": tournament_config.get("initial_rating", 1500.0),
+        "k_factor": tournament_config.get("k_factor", 32.0)
+    })
@@ -3,143 +3,357 @@ import time
 import torch
 import numpy as np
 from RLPlay import RLPlay
-from utils import get_config
+from utils import get_config, ActionSpaceSpec
 from envWrapper import EnvWrapper
+from asyncLearner import AsyncLearner
+from latencyProfiler import create_profiler
+from trajectoryRecorder import create_recorder
+from checkpointWriter import create_checkpoint_writer
+from startupProfile import startup_profile
+from decisionSkipper import create_decision_skipper
+from episodeMetrics import create_episode_metrics
+from observationNormalizer import create_observation_normalizer, NORMALIZER_ENTRY
+from compactRolloutBuffer import create_rollout_buffer, describe_rollout_buffer, store_observation
+from fastPPOUpdate import create_ppo_update
 from stable_baselines3 import PPO
 from stable_baselines3.common.utils import safe_mean
+from stable_baselines3.common.logger import TensorBoardOutputFormat, CSVOutputFormat
 from RlplayRewardCalculator import RlplayRewardCalculator
 
 
 class MLPlay:
     def __init__(self, observation_structure, action_space_info, name, *args, **kwargs):
-        self.rlplayRewardCalculator = RlplayRewardCalculator()
+        # main.py passes the config it already parsed
+        config = kwargs.get("config") or get_config()
+        self.env_wrapper = EnvWrapper(observation_structure, action_space_info)
+        self.rlplayRewardCalculator = RlplayRewardCalculator(self.env_wrapper.observation_processor)
         self.rlplayRewardCalculator.reset()
-        self.RLPlay = RLPlay(self.rlplayRewardCalculator)
+        self.RLPlay = RLPlay(self.rlplayRewardCalculator, config.get("reward"))
         self.name = name or "MLPlay"
 
-        self.env_wrapper = EnvWrapper(observation_structure, action_space_info)
-        config = get_config()
-        self.params = config["model"]["params"]
-        self.params["policy_kwargs"]["activation_fn"] = torch.nn.Tanh
+        self.params = dict(config["model"]["params"])
+        self.params["policy_kwargs"] = dict(self.params["policy_kwargs"], activation_fn=torch.nn.Tanh)
 
         self.prev_observation = None
         self.prev_action = None
         self.prev_log_prob = None
         self.prev_value = None
-        self.episode_rewards = []
+        self.prev_env_action = None
+        self.held_reward = 0.0
+        self.held_steps = 0
+        self.pending_transitions = []
         self.total_steps = 0
         self.episode_count = 1
         self.update_count = 0
         self.start_time = time.strftime("%Y%m%d_%H%M%S")
         self.model_save_dir = config["model"]["dir"] + '/' + self.start_time
         self.model_path = config["model"]["path"]
+        self.progress_csv = config["model"].get("progress_csv")
+        self.normalization_config = config["model"].get("observation_normalization")
+        self.compact_rollout_config = config["model"].get("compact_rollout")
+        self.fast_update_config = config["model"].get("fast_update")
+        self.async_learner = None
+        self.decision_skipper = create_decision_skipper(config.get("decision_skipping"))
+        self.profiler = create_profiler(
+            config.get("profiling"),
+            ["reward", "policy", "rollout", "compute_returns", "create_action", "reset", "train", "save_model"],
+            default_summary_path=f"{self.model_save_dir}/latency.jsonl",
+            name=self.name
+        )
+        self.recorder = create_recorder(
+            config.get("recording"),
+            observation_structure,
+            self.env_wrapper.observation_space.shape[0],
+            self.env_wrapper.action_space,
+            default_path=f"{self.model_save_dir}/trajectories",
+            metadata={
+                "action_space_info": ActionSpaceSpec.from_action_space_info(action_space_info).to_dict(),
+                "reward_weights": self.RLPlay.weights
+            }
+        )
+
+        self.episode_metrics = create_episode_metrics(
+            config.get("metrics"),
+            default_path=f"{self.model_save_dir}/episodes",
+            mud_threshold=self.RLPlay.weights["mud"]["threshold"],
+            tensorboard_writer=self._tensorboard_writer
+        )
 
         os.makedirs(self.model_save_dir, exist_ok=True)
+        # Created before the AsyncLearner so that at exit the learner finishes (and saves) first
+        self.checkpoint_writer = create_checkpoint_writer(config.get("checkpoint"), self.model_path, self.model_save_dir)
 
         self._initialize_model()
-        print(f"PPO initialized in training mode")
+        self._init_hot_path()
+        if config["model"].get("async_update", False):
+            self.async_learner = AsyncLearner(self.model, self._update_policy, self._create_rollout_buffer)
+            print(f"PPO initialized in training mode (asynchronous updates)")
+        else:
+            print(f"PPO initialized in training mode")
+        print(describe_rollout_buffer(self.model.rollout_buffer) + (", one of two" if self.async_learner is not None else ""))
+
+    @property
+    def rollout_buffer(self):
+        if self.async_learner is not None:
+            return self.async_learner.collect_buffer
+        return self.model.rollout_buffer
+
+    @property
+    def policy(self):
+        if self.async_learner is not None:
+            return self.async_learner.acting_policy
+        return self.model.policy
 
     def reset(self):
-        if self.episode_rewards:
-                total_reward = sum(self.episode_rewards)
-                print(f"Episode {self.episode_count}: Total Reward = {total_reward:.2f}, Steps = {len(self.episode_rewards)}")
-                self.episode_rewards = []
+        episode = self.episode_count
+        with self.profiler.timed("reset"):
+            skipped = self.decision_skipper.reset() if self.decision_skipper is not None else None
+            row = self.episode_metrics.end_episode(episode)
+            if row is not None:
+                    print(f"Episode {episode}: Total Reward = {row['return']:.2f}, Steps = {row['length']}, "
+                          f"Checkpoints = {row['checkpoints']}, Mean Reward (last {self.episode_metrics.window}) = "
+                          f"{self.episode_metrics.rolling()['return_mean']:.2f}"
+                          + (f", Skipped Forward Passes = {skipped[0]}/{skipped[1]}" if skipped is not None else ""))
+
+            # GameRunner never calls update() with done=True, so the rewards of the steps the last decision
+            # was repeated for (a checkpoint, the finish, a death) are only stored here
+            if self.held_steps and self.prev_observation is not None:
+                self._store_transition(
+                    obs=self.prev_observation,
+                    action=self.prev_action,
+                    reward=self.held_reward,
+                    done=True,
+                    value=self.prev_value,
+                    log_prob=self.prev_log_prob,
+                    next_value=self.prev_value
+                )
 
-        self._update_policy()
+            if self.async_learner is not None:
+                self.async_learner.swap_policy()
+            else:
+                self._update_policy()
+                self._flush_pending_transitions()
 
-        self.prev_observation = None
-        self.prev_action = None
-        self.prev_log_prob = None
-        self.prev_value = None
-        self.episode_count += 1
+            self.prev_observation = None
+            self.prev_action = None
+            self.prev_log_prob = None
+            self.prev_value = None
+            self.prev_env_action = None
+            self.held_reward = 0.0
+            self.held_steps = 0
+            self.episode_count += 1
 
-        self.rlplayRewardCalculator.reset()
-        self.RLPlay.reset()
+            self.rlplayRewardCalculator.reset()
+            self.RLPlay.reset()
+            self.recorder.end_episode()
+        self.profiler.flush_episode(episode, self._tensorboard_writer())
 
     def update(self, observations, done, info, keyboard=set(), *args, **kwargs):
+        self.profiler.start()
+        if self.async_learner is not None:
+            self.async_learner.swap_policy()
+
         self.rlplayRewardCalculator.update(observations)
         observation = observations["flattened"]
+        if self.env_wrapper.observation_normalizer is not None:
+            self.env_wrapper.observation_normalizer.observe(observation)
 
         reward, not_used_for_training = self.RLPlay.update()
-        action, log_prob, value = self._predict_with_info(observation)
-
+        self.profiler.mark("reward")
         if self.prev_observation is not None:
-            self.episode_rewards.append(reward)
+            self.episode_metrics.step(reward, self.rlplayRewardCalculator.features)
 
-            if not not_used_for_training and not self.model.rollout_buffer.full:
-                self._add_to_rollout_buffer(
-                    obs=self.prev_observation,
-                    action=self.prev_action,
-                    reward=reward,
-                    done=done,
-                    value=self.prev_value,
-                    log_prob=self.prev_log_prob
-                )
-                if self.model.rollout_buffer.full:
-                    done_tensor = np.array([done])
-                    value_tensor = torch.as_tensor(value).unsqueeze(0) if value.ndim == 0 else torch.as_tensor(value)
-                    self.model.rollout_buffer.compute_returns_and_advantage(last_values=value_tensor, dones=done_tensor)
+        if self.decision_skipper is not None and self.prev_action is not None and self.decision_skipper.should_reuse(observation, done):
+            # The repeated action stays one decision: its transition is stored at the next forward pass
+            # with the rewards of every step it was held for
+            self.held_reward += reward
+            self.held_steps += 1
+            self.recorder.record(observations, self.prev_action, reward, done)
+            self.profiler.mark("rollout")
+            self.total_steps += 1
+            self.profiler.stop()
+            return self.prev_env_action
+
+        # The decision skipper and the recorder see the raw observation, the policy and the rollout the normalized one
+        policy_observation = self.env_wrapper.normalize_observation(observation)
+        action, log_prob, value = self._predict_with_info(policy_observation)
+        self.profiler.mark("policy")
+        self.recorder.record(observations, action, reward, done)
 
-        self.prev_observation = observation
+        if self.prev_observation is not None and not not_used_for_training:
+            self._store_transition(
+                obs=self.prev_observation,
+                action=self.prev_action,
+                reward=self.held_reward + reward,
+                done=done,
+                value=self.prev_value,
+                log_prob=self.prev_log_prob,
+                next_value=value
+            )
+        self.held_reward = 0.0
+        self.held_steps = 0
+        if self.decision_skipper is not None:
+            self.decision_skipper.decided(observation)
+        self.profiler.mark("rollout")
+
+        self.prev_observation = policy_observation
         self.prev_action = action
         self.prev_log_prob = log_prob
         self.prev_value = value
         self.total_steps += 1
 
-        return self.env_wrapper.action_processor.create_action(action)
+        env_action = self.env_wrapper.action_processor.create_action(action)
+        self.prev_env_action = env_action
+        self.profiler.mark("create_action")
+        self.profiler.stop()
+        startup_profile.first_action()
+        return env_action
 
     def _initialize_model(self):
         print(f"Initializing PPO model...")
-        if os.path.exists(self.model_path):
-            try:
-                self.model = PPO.load(self.model_path, env=self.env_wrapper, **self.params, verbose=1)
-                print(f"Model loaded from {self.model_path}")
-            except Exception as e:
-                print(f"Error loading model from {self.model_path}: {e}")
-                print("Creating new model...")
-                self.model = PPO("MlpPolicy", env=self.env_wrapper, **self.params, verbose=1)
-        else:
-            print(f"No pre-trained model found at {self.model_path}. Creating new model...")
-            self.model = PPO("MlpPolicy", env=self.env_wrapper, **self.params, verbose=1)
-        self.model.learn(total_timesteps=0, tb_log_name=f"PPO_{self.start_time}")
+        env = self._model_env()
+        loaded_path = None
+        with startup_profile.phase("load model"):
+            if os.path.exists(self.model_path):
+                try:
+                    self.model = PPO.load(self.model_path, env=env, **self.params, verbose=1)
+                    loaded_path = self.model_path
+                    print(f"Model loaded from {self.model_path}")
+                except Exception as e:
+                    print(f"Error loading model from {self.model_path}: {e}")
+                    print("Creating new model...")
+                    self.model = PPO("MlpPolicy", env=env, **self.params, verbose=1)
+            else:
+                print(f"No pre-trained model found at {self.model_path}. Creating new model...")
+                self.model = PPO("MlpPolicy", env=env, **self.params, verbose=1)
+        if (self.compact_rollout_config or {}).get("enabled", False):
+            # PPO built a float32 RolloutBuffer; nothing has been written to it yet
+            self.model.rollout_buffer = self._create_rollout_buffer()
+        # None trains with SB3's PPO.train
+        self.ppo_update = create_ppo_update(self.fast_update_config, self.model)
+        obs_size = self.env_wrapper.observation_space.shape[0]
+        self.env_wrapper.observation_normalizer = create_observation_normalizer(self.normalization_config, obs_size, loaded_path)
+        if self.env_wrapper.observation_normalizer is not None and loaded_path is not None and self.env_wrapper.observation_normalizer.count == 0:
+            print(f"Warning: {loaded_path} was trained on raw observations, its policy now sees normalized ones")
+        # The rollout buffer already exists; _setup_learn resets the counters and configures the logger
+        # the same way learn(total_timesteps=0) did, without running the callbacks and the empty training loop
+        with startup_profile.phase("set up logger"):
+            self.model._setup_learn(total_timesteps=0, tb_log_name=f"PPO_{self.start_time}")
+            # Optional CSV copy of everything logged per update (train/mean_reward, train/loss, ...), read by sweep.py
+            if self.progress_csv:
+                self.model.logger.output_formats.append(CSVOutputFormat(self.progress_csv))
+
+    def _model_env(self):
+        # The env PPO is built on; its num_envs sets the rollout buffer's n_envs
+        return self.env_wrapper
 
-    def _save_model(self):
+    def _save_model(self, score=None):
+        # Only the in-memory snapshot happens here, the zip is written and published in the background
         if self.model is not None:
-            self.model.save(self.model_path)
-            print(f"Model saved to {self.model_path}")
+            normalizer = self.env_wrapper.observation_normalizer
+            extra_files = {NORMALIZER_ENTRY: normalizer.to_bytes()} if normalizer is not None else None
+            self.checkpoint_writer.save(self.model, self.update_count, score=score, extra_files=extra_files)
 
-            update_path = f"{self.model_save_dir}/ppo_model_{self.update_count}.zip"
-            self.model.save(update_path)
-            print(f"Model saved to {update_path}")
+    def _init_hot_path(self):
+        # Reused every step: the observation is copied into a preallocated (pinned on CUDA) tensor
+        # through a NumPy view, the policy's outputs are copied out into preallocated arrays, and the
+        # end-of-rollout bootstrap value goes into fixed arrays. Only the forward pass itself still
+        # allocates its intermediate tensors.
+        obs_size = self.model.observation_space.shape[0]
+        self._obs_tensor = torch.zeros((1, obs_size), dtype=torch.float32)
+        if self.model.device.type == "cuda":
+            self._obs_tensor = self._obs_tensor.pin_memory()
+        self._obs_array = self._obs_tensor.numpy()[0]
+        self._last_value_tensor = torch.zeros(1, device=self.model.device)
+        self._last_done_array = np.zeros(1, dtype=np.float32)
+        # Two sets of (action, log_prob, value) used in turn, so the previous step's stay valid until its
+        # transition is stored; allocated at the first forward pass, which gives their sizes and dtypes
+        self._outputs = None
+        self._output_slot = 0
+
+    def _allocate_outputs(self, outputs):
+        tensors = [torch.empty(output.numel(), dtype=output.dtype) for output in outputs]
+        if self.model.device.type == "cuda":
+            tensors = [tensor.pin_memory() for tensor in tensors]
+        return tensors, tuple(tensor.numpy() for tensor in tensors)
 
     def _predict_with_info(self, obs):
-        obs_tensor = torch.as_tensor(obs).unsqueeze(0)
+        np.copyto(self._obs_array, obs)
+        obs_tensor = self._obs_tensor.to(self.model.device, non_blocking=True)
         with torch.no_grad():
-            action, value, log_prob = self.model.policy(obs_tensor)
-        return action.cpu().numpy().flatten(), log_prob.cpu().numpy().flatten(), value.cpu().numpy().flatten()
+            action, value, log_prob = self.policy(obs_tensor)
+            outputs = (action, log_prob, value)
+            if self._outputs is None:
+                self._outputs = [self._allocate_outputs(outputs) for _ in range(2)]
+            self._output_slot = 1 - self._output_slot
+            tensors, arrays = self._outputs[self._output_slot]
+            for tensor, output in zip(tensors, outputs):
+                tensor.copy_(output.view(-1))
+        return arrays
+
+    def _store_transition(self, obs, action, reward, done, value, log_prob, next_value):
+        # Steps collected while the buffer waits for the next update are kept and added afterwards
+        if self.rollout_buffer.full:
+            # The action, value and log-prob arrays are reused two forward passes later
+            self.pending_transitions.append((obs, action.copy(), reward, done, value.copy(), log_prob.copy(), next_value.copy()))
+            return
+
+        self._add_to_rollout_buffer(obs=obs, action=action, reward=reward, done=done, value=value, log_prob=log_prob)
+        if self.rollout_buffer.full:
+            self._last_done_array[0] = done
+            self._last_value_tensor[0] = float(next_value[0])
+            with self.profiler.timed("compute_returns"):
+                self.rollout_buffer.compute_returns_and_advantage(last_values=self._last_value_tensor, dones=self._last_done_array)
+            if self.async_learner is not None:
+                self.async_learner.submit()
+
+    def _flush_pending_transitions(self):
+        pending_transitions = self.pending_transitions
+        self.pending_transitions = []
+        for transition in pending_transitions:
+            self._store_transition(*transition)
+
+    def _tensorboard_writer(self):
+        for output_format in self.model.logger.output_formats:
+            if isinstance(output_format, TensorBoardOutputFormat):
+                return output_format.writer
+        return None
+
+    def _create_rollout_buffer(self):
+        return create_rollout_buffer(self.compact_rollout_config, self.model)
 
     def _add_to_rollout_buffer(self, obs, action, reward, done, value, log_prob):
-        if not self.model.rollout_buffer.full:
-            self.model.rollout_buffer.add(
-                obs=torch.as_tensor(obs).unsqueeze(0),
-                action=torch.as_tensor(action).unsqueeze(0),
-                reward=torch.as_tensor([reward]),
-                episode_start=torch.as_tensor([done]),
-                value=torch.as_tensor(value).unsqueeze(0) if value.ndim == 0 else torch.as_tensor(value),
-                log_prob=torch.as_tensor(log_prob).unsqueeze(0) if log_prob.ndim == 0 else torch.as_tensor(log_prob)
-            )
+        # Same bookkeeping as RolloutBuffer.add (single env, Box observations), written in place
+        rollout_buffer = self.rollout_buffer
+        if rollout_buffer.full:
+            return
+        pos = rollout_buffer.pos
+        store_observation(rollout_buffer, pos, 0, obs)
+        rollout_buffer.actions[pos, 0] = action
+        rollout_buffer.rewards[pos, 0] = reward
+        rollout_buffer.episode_starts[pos, 0] = done
+        rollout_buffer.values[pos, 0] = value[0]
+        rollout_buffer.log_probs[pos, 0] = log_prob[0]
+        rollout_buffer.pos += 1
+        if rollout_buffer.pos == rollout_buffer.buffer_size:
+            rollout_buffer.full = True
 
     def _update_policy(self):
         if self.model.rollout_buffer.size() == 0 or not self.model.rollout_buffer.full:
             return
 
-        print(f"Updating PPO policy with {self.model.rollout_buffer.size()} experiences...")
+        print(f"Updating PPO policy with {self.model.rollout_buffer.size() * self.model.n_envs} experiences...")
 
-        self.model.num_timesteps += self.model.rollout_buffer.size()
-        self.model.train()
+        self.model.num_timesteps += self.model.rollout_buffer.size() * self.model.n_envs
+        with self.profiler.timed("train"):
+            if self.ppo_update is not None:
+                self.ppo_update.train()
+            else:
+                self.model.train()
         self.update_count += 1
 
-        self.model.logger.record("train/mean_reward", safe_mean(self.model.rollout_buffer.rewards))
+        mean_reward = safe_mean(self.model.rollout_buffer.rewards)
+        self.model.logger.record("train/mean_reward", mean_reward)
         self.model.logger.record("param/n_steps", self.model.n_steps)
         self.model.logger.record("param/batch_size", self.model.batch_size)
         self.model.logger.record("param/n_epochs", self.model.n_epochs)
@@ -148,9 +362,12 @@ class MLPlay:
         self.model.logger.record("param/ent_coef", self.model.ent_coef)
         self.model.logger.record("param/vf_coef", self.model.vf_coef)
         self.model.logger.record("param/max_grad_norm", self.model.max_grad_norm)
+        if self.decision_skipper is not None:
+            self.model.logger.record("rollout/skipped_forward_passes", self.decision_skipper.skip_fraction())
         self.model._dump_logs(self.update_count)
 
         self.model.rollout_buffer.reset()
         print("PPO policy updated successfully")
 
-        self._save_model()
+        with self.profiler.timed("save_model"):
+            self._save_model(score=mean_reward)
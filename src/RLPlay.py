@@ -1,19 +1,140 @@
+DEFAULT_REWARD_WEIGHTS = {
+    "checkpoint": {"weight": 100.0},
+    "finish_game": {"weight": 500.0},
+    "distance": {"close_weight": 2.0, "leave_weight": -1.0},
+    "health": {"death_weight": -200.0, "increase_weight": 0, "decrease_weight": 0},
+    "mud": {"threshold": 2.0, "leave_weight": 50.0, "close_weight": -70.0, "stay_weight": -30.0},
+    "time": {"time_penalty": -1}
+}
+
+# RlplayRewardCalculator's "nearest" feature is keyed by object type; mud pits are type 1
+MUD_OBJECT_TYPE = 1
+
+
+def merge_reward_weights(*weights):
+    # Each argument (config.json's "reward" section, a sweep override, ...) only needs the terms/parameters
+    # that differ from DEFAULT_REWARD_WEIGHTS; later ones win
+    merged = {term: dict(params) for term, params in DEFAULT_REWARD_WEIGHTS.items()}
+    for overrides in weights:
+        for term, params in (overrides or {}).items():
+            if term not in merged:
+                raise ValueError(f"Unknown reward term '{term}', expected one of {list(merged)}")
+            for param, value in params.items():
+                if param not in merged[term]:
+                    raise ValueError(f"Unknown parameter '{param}' for reward term '{term}', expected one of {list(merged[term])}")
+                merged[term][param] = value
+    return merged
+
+
+def _literal(value):
+    value = float(value)
+    if value != value or value in (float("inf"), float("-inf")):
+        raise ValueError(f"Reward weights and thresholds must be finite, got {value}")
+    return repr(value)
+
+
+def _branches(chain, indent):
+    # chain: [(condition or None for else, weight, expression)]. Trailing zero-weight branches are dropped and
+    # inner ones become pass, so the remaining branches are taken in exactly the same cases as before.
+    while chain and chain[-1][1] == 0:
+        chain = chain[:-1]
+    lines = []
+    for i, (condition, weight, expression) in enumerate(chain):
+        keyword = "if" if i == 0 else "elif"
+        lines.append(f"{indent}{keyword} {condition}:" if condition is not None else f"{indent}else:")
+        lines.append(f"{indent}    reward += {expression}" if weight != 0 else f"{indent}    pass")
+    return lines
+
+
+def generate_reward_source(weights):
+    # Python source for reward_function(prev, features), the sum of the terms in DEFAULT_REWARD_WEIGHTS order
+    # over RlplayRewardCalculator's feature dicts. Weights are inlined and terms that can only add 0 are left out.
+    w = weights
+    indent = " " * 8
+    body = []
+
+    checkpoint = w["checkpoint"]["weight"]
+    if checkpoint != 0:
+        body += _branches([("prev_checkpoint < checkpoint", checkpoint, f"{_literal(checkpoint)} * (checkpoint - prev_checkpoint)")], indent)
+
+    finish = w["finish_game"]["weight"]
+    if finish != 0:
+        body += _branches([('not prev["finished"] and features["finished"]', finish, _literal(finish))], indent)
+
+    close, leave = w["distance"]["close_weight"], w["distance"]["leave_weight"]
+    if close != 0 or leave != 0:
+        body.append(f"{indent}if prev_checkpoint == checkpoint:")
+        body.append(f'{indent}    prev_distance = prev["target_distance"]')
+        body.append(f'{indent}    distance = features["target_distance"]')
+        body += _branches([
+            ("distance <= prev_distance", close, f"{_literal(close)} * (prev_distance - distance)"),
+            (None, leave, f"{_literal(leave)} * (distance - prev_distance)")
+        ], indent + "    ")
+
+    health = w["health"]
+    if any(health[param] != 0 for param in ("death_weight", "increase_weight", "decrease_weight")):
+        body.append(f'{indent}prev_health = prev["health"]')
+        body.append(f"{indent}if not prev_health <= 0.0:")
+        body.append(f'{indent}    health = features["health"]')
+        body += _branches([
+            ("health <= 0.0", health["death_weight"], _literal(health["death_weight"])),
+            ("health >= prev_health", health["increase_weight"], f"{_literal(health['increase_weight'])} * (health - prev_health)"),
+            (None, health["decrease_weight"], f"{_literal(health['decrease_weight'])} * (prev_health - health)")
+        ], indent + "    ")
+
+    mud = w["mud"]
+    if any(mud[param] != 0 for param in ("leave_weight", "close_weight", "stay_weight")):
+        threshold = _literal(mud["threshold"])
+        body.append(f'{indent}prev_mud = prev["nearest"].get({MUD_OBJECT_TYPE})')
+        body.append(f'{indent}mud = features["nearest"].get({MUD_OBJECT_TYPE})')
+        body.append(f"{indent}if prev_mud is not None and mud is not None:")
+        body += _branches([
+            (f"prev_mud > {threshold} and mud > {threshold}", 0, None),
+            (f"prev_mud <= {threshold} and mud > {threshold}", mud["leave_weight"], f"{_literal(mud['leave_weight'])} * (mud - prev_mud)"),
+            (f"prev_mud > {threshold} and mud <= {threshold}", mud["close_weight"], f"{_literal(mud['close_weight'])} * (prev_mud - mud)"),
+            (f"prev_mud <= {threshold} and mud <= {threshold}", mud["stay_weight"], _literal(mud["stay_weight"]))
+        ], indent + "    ")
+
+    lines = ["def reward_function(prev, features):", "    reward = 0.0"]
+    if body:
+        lines.append("    if prev is not None:")
+        if checkpoint != 0 or close != 0 or leave != 0:
+            lines.append(f'{indent}prev_checkpoint = prev["checkpoint"]')
+            lines.append(f'{indent}checkpoint = features["checkpoint"]')
+        lines += body
+    time_penalty = w["time"]["time_penalty"]
+    if time_penalty != 0:
+        lines.append(f"    reward += {_literal(time_penalty)}")
+    lines.append("    return reward")
+    return "\n".join(lines) + "\n"
+
+
+def compile_reward_function(weights=None):
+    source = generate_reward_source(merge_reward_weights(weights))
+    namespace = {}
+    exec(compile(source, "<reward spec>", "exec"), namespace)
+    return namespace["reward_function"], source
+
+
 class RLPlay:
-    def __init__(self, reward_calculator):
+    # weights: config.json's "reward" section; it is compiled once into a single function over the
+    # previous and current features RlplayRewardCalculator keeps
+    def __init__(self, reward_calculator, weights=None):
         self.reward_calculator = reward_calculator
+        self.weights = merge_reward_weights(weights)
+        self.reward_function, self.reward_source = compile_reward_function(self.weights)
         self.step_count = 0
 
     def update(self):
         self.step_count += 1
-        reward = 0.0
-        reward += self.reward_calculator.calculate_checkpoint_reward(weight=100.0)
-        reward += self.reward_calculator.calculate_finish_game_reward(weight=500.0)
-        reward += self.reward_calculator.calculate_distance_reward(close_weight=2.0, leave_weight=-1.0)
-        reward += self.reward_calculator.calculate_health_reward(death_weight=-200.0, increase_weight=0, decrease_weight=0)
-        reward += self.reward_calculator.calculate_mud_reward(threshold=2.0, leave_weight=50.0, close_weight=-70.0, stay_weight=-30.0)
-        reward += self.reward_calculator.calculate_time_reward(time_penalty=-1)
+        reward = self.reward_function(self.reward_calculator.prev_features, self.reward_calculator.features)
         not_used_for_training = (self.step_count < 10)
         return reward, not_used_for_training
 
     def reset(self):
-        self.step_count = 0
\ No newline at end of file
+        self.step_count = 0
+
+
+if __name__ == "__main__":
+    from utils import get_config
+    print(compile_reward_function(get_config().get("reward"))[1])
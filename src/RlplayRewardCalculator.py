@@ -1,84 +1,60 @@
 import numpy as np
 
 class RlplayRewardCalculator:
-    def __init__(self):
+    def __init__(self, observation_processor=None):
+        # With an ObservationProcessor the features are gathered straight from the flattened vector: viewing
+        # an arange through the compiled layout gives the flattened indices of each field once, up front
+        self.target_index = None
+        if observation_processor is not None and all(
+            key in observation_processor.layout for key in ("target_position", "nearby_map_objects.object_type", "nearby_map_objects.relative_position")
+        ):
+            indices = np.arange(observation_processor.layout_size)
+            self.target_index = observation_processor.view(indices, "target_position")[:2].copy()
+            self.object_type_index = observation_processor.view(indices, "nearby_map_objects.object_type").reshape(-1).copy()
+            positions = observation_processor.view(indices, "nearby_map_objects.relative_position")
+            self.object_position_index = positions.reshape(-1, positions.shape[-1]).copy()
         self.prev_observation = None
         self.observation = None
+        self.prev_features = None
+        self.features = None
 
     def update(self, observation):
+        # Each observation's features are computed once and carried forward as the previous ones
         self.prev_observation = self.observation
         self.observation = observation
+        self.prev_features = self.features
+        self.features = self.compute_features(observation)
 
     def reset(self):
         self.prev_observation = None
         self.observation = None
-
-    def calculate_checkpoint_reward(self, weight):
-        if self.prev_observation is None or self.observation is None:
-            return 0.0
-        if self.prev_observation["last_checkpoint_index"] < self.observation["last_checkpoint_index"]:
-            return weight * (self.observation["last_checkpoint_index"] - self.prev_observation["last_checkpoint_index"])
-        return 0.0
-    
-    def calculate_finish_game_reward(self, weight):
-        if self.prev_observation is None or self.observation is None:
-            return 0.0
-        if not self.prev_observation["reached_final_checkpoint"] and self.observation["reached_final_checkpoint"]:
-            return weight
-        return 0.0
-
-    def calculate_distance_reward(self, close_weight, leave_weight):
-        if self.prev_observation is None or self.observation is None:
-            return 0.0
-        if self.prev_observation["last_checkpoint_index"] != self.observation["last_checkpoint_index"]:
-            return 0.0
-        prev_distance = np.linalg.norm(np.array([
-            self.prev_observation["target_position"][0],
-            self.prev_observation["target_position"][1]
-        ]))
-        current_distance = np.linalg.norm(np.array([
-            self.observation["target_position"][0],
-            self.observation["target_position"][1]
-        ]))
-        if current_distance <= prev_distance:
-            return close_weight * (prev_distance - current_distance)
-        else:
-            return leave_weight * (current_distance - prev_distance)
-
-    def calculate_health_reward(self, death_weight, increase_weight, decrease_weight):
-        if self.prev_observation is None or self.observation is None:
-            return 0.0
-        if self.prev_observation["agent_health"] <= 0.0:
-            return 0.0
-        if self.observation["agent_health"] <= 0.0:
-            return death_weight
-        if self.observation["agent_health"] >= self.prev_observation["agent_health"]:
-            return increase_weight * (self.observation["agent_health"] - self.prev_observation["agent_health"])
+        self.prev_features = None
+        self.features = None
+
+    def compute_features(self, observation):
+        if self.target_index is not None and "flattened" in observation:
+            flattened = observation["flattened"]
+            target = flattened[self.target_index]
+            object_types = flattened[self.object_type_index].astype(np.int64)
+            object_positions = flattened[self.object_position_index]
         else:
-            return decrease_weight * (self.prev_observation["agent_health"] - self.observation["agent_health"])
-
-    def calculate_mud_reward(self, threshold, leave_weight, close_weight, stay_weight):
-        if self.prev_observation is None or self.observation is None:
-            return 0.0
-        prev_nearby_obects = self.prev_observation["nearby_map_objects"]
-        nearby_obects = self.observation["nearby_map_objects"]
-        prev_muds = [obj for obj in prev_nearby_obects if obj["object_type"] == 1]
-        muds = [obj for obj in nearby_obects if obj["object_type"] == 1]
-        if not prev_muds or not muds:
-            return 0.0
-        prev_nearest_mud = min(prev_muds, key=lambda x: np.linalg.norm(np.array(x["relative_position"])))
-        nearest_mud = min(muds, key=lambda x: np.linalg.norm(np.array(x["relative_position"])))
-        prev_distance = np.linalg.norm(np.array(prev_nearest_mud["relative_position"]))
-        distance = np.linalg.norm(np.array(nearest_mud["relative_position"]))
-        if prev_distance > threshold and distance > threshold:
-            return 0.0 # didn't interact with mud
-        elif prev_distance <= threshold and distance > threshold:
-            return leave_weight*(distance - prev_distance) # left mud
-        elif prev_distance > threshold and distance <= threshold:
-            return close_weight*(prev_distance - distance) # got into mud
-        elif prev_distance <= threshold and distance <= threshold:
-            return stay_weight # stayed in mud
-
-    def calculate_time_reward(self, time_penalty):
-        return time_penalty
-    
\ No newline at end of file
+            target = np.ascontiguousarray(observation["target_position"][:2])
+            nearby_objects = observation["nearby_map_objects"]
+            object_types = np.array([obj["object_type"] for obj in nearby_objects], dtype=np.int64)
+            object_positions = np.array([obj["relative_position"] for obj in nearby_objects]) if nearby_objects else np.zeros((0, 3))
+
+        # matmul runs the same dot product np.linalg.norm uses, so distances match it bit for bit. The features
+        # are plain Python numbers: RLPlay's compiled reward function does all its arithmetic in double precision.
+        distances = np.sqrt(np.matmul(object_positions[:, None, :], object_positions[:, :, None])[:, 0, 0]).tolist()
+        nearest = {}
+        for object_type, distance in zip(object_types.tolist(), distances):
+            if object_type not in nearest or distance < nearest[object_type]:
+                nearest[object_type] = distance
+
+        return {
+            "target_distance": float(np.sqrt(target.dot(target))),
+            "nearest": nearest,
+            "health": float(observation["agent_health"]),
+            "checkpoint": int(observation["last_checkpoint_index"]),
+            "finished": bool(observation["reached_final_checkpoint"])
+        }
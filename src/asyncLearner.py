@@ -0,0 +1,98 @@
+import copy
+import queue
+import atexit
+import threading
+
+
+class AsyncLearner:
+    def __init__(self, model, train_fn, buffer_factory):
+        self.model = model
+        self.train_fn = train_fn
+
+        # Two rollout buffers: the game thread collects into one while the learner trains on the other
+        self.buffers = [model.rollout_buffer, buffer_factory()]
+        self.buffer_versions = [0, 0]
+        self.free = [threading.Event(), threading.Event()]
+        for event in self.free:
+            event.set()
+        self.collect_index = 0
+
+        # The game thread only ever runs forward passes on the acting copy; the learner
+        # writes new weights into the standby copy and the two are swapped at a step boundary
+        self.acting_policy = copy.deepcopy(model.policy)
+        self.standby_policy = copy.deepcopy(model.policy)
+        self.acting_policy.set_training_mode(False)
+        self.standby_policy.set_training_mode(False)
+        self.acting_version = 0
+        self.learner_version = 0
+        self.pending_version = None
+        self.lock = threading.Lock()
+
+        self.queue = queue.Queue()
+        self.thread = threading.Thread(target=self._run, name="AsyncLearner", daemon=True)
+        self.thread.start()
+        # Let an in-flight update finish saving before the interpreter exits
+        atexit.register(self.close)
+
+    @property
+    def collect_buffer(self):
+        return self.buffers[self.collect_index]
+
+    def submit(self):
+        index = self.collect_index
+        self.free[index].clear()
+        self.queue.put(index)
+
+        next_index = 1 - index
+        if not self.free[next_index].is_set():
+            print("Learner is still training on the previous rollout, waiting for it to finish...")
+            self.free[next_index].wait()
+        self.buffer_versions[next_index] = self.acting_version
+        self.collect_index = next_index
+
+    def swap_policy(self):
+        if self.pending_version is None:
+            return False
+        # Never block the game thread: if the learner is publishing right now, try again next step
+        if not self.lock.acquire(blocking=False):
+            return False
+        try:
+            self.acting_policy, self.standby_policy = self.standby_policy, self.acting_policy
+            self.acting_version = self.pending_version
+            self.pending_version = None
+        finally:
+            self.lock.release()
+        print(f"Swapped in policy version {self.acting_version}")
+        return True
+
+    def close(self):
+        if self.thread.is_alive():
+            self.queue.put(None)
+            self.thread.join()
+
+    def _run(self):
+        while True:
+            index = self.queue.get()
+            if index is None:
+                break
+
+            buffer = self.buffers[index]
+            policy_lag = self.learner_version - self.buffer_versions[index]
+            try:
+                self.model.rollout_buffer = buffer
+                self.model.logger.record("async/policy_lag", policy_lag)
+                self.train_fn()
+                self.learner_version += 1
+                print(f"Policy version {self.learner_version} trained on a rollout collected with "
+                      f"version {self.buffer_versions[index]} (lag {policy_lag})")
+                self._publish()
+            except Exception as e:
+                print(f"Error updating policy in the background: {e}")
+                buffer.reset()
+            finally:
+                self.free[index].set()
+
+    def _publish(self):
+        with self.lock:
+            self.standby_policy.load_state_dict(self.model.policy.state_dict())
+            self.pending_version = self.learner_version
@@ -0,0 +1,170 @@
+import os
+import time
+import argparse
+import numpy as np
+import torch
+from gymnasium import spaces
+from stable_baselines3 import PPO
+from utils import get_config, ActionSpaceSpec
+from envWrapper import EnvWrapper
+from trajectoryRecorder import TrajectoryReader
+from observationNormalizer import create_observation_normalizer, save_observation_normalizer
+
+
+def load_demonstrations(paths):
+    episodes = []
+    observation_structure = None
+    action_space_info = None
+    for path in paths:
+        reader = TrajectoryReader(path)
+        if "action_space_info" not in reader.meta:
+            raise ValueError(f"{path} does not record the action space; record it with demonstration.py or MLPlay")
+        if observation_structure is None:
+            observation_structure = reader.meta["observation_structure"]
+            action_space_info = reader.meta["action_space_info"]
+        elif reader.meta["observation_structure"] != observation_structure or reader.meta["action_space_info"] != action_space_info:
+            raise ValueError(f"{path} was recorded with a different observation structure or action space")
+        for episode in reader:
+            episodes.append((np.asarray(episode.flattened), np.asarray(episode.actions)))
+        print(f"Loaded {len(reader)} episodes ({reader.total_steps} steps) from {path}")
+    if not episodes:
+        raise ValueError("No finished demonstration episodes found")
+    return observation_structure, ActionSpaceSpec.from_dict(action_space_info), episodes
+
+
+def split_episodes(episodes, validation_fraction, seed):
+    # Hold out whole episodes so validation steps are not near-duplicates of training steps
+    order = np.random.default_rng(seed).permutation(len(episodes))
+    validation_count = int(len(episodes) * validation_fraction) if len(episodes) > 1 else 0
+    validation = [episodes[i] for i in order[:validation_count]]
+    train = [episodes[i] for i in order[validation_count:]]
+
+    def stack(selected):
+        if not selected:
+            return None
+        return np.concatenate([obs for obs, _ in selected]), np.concatenate([actions for _, actions in selected])
+    return stack(train), stack(validation)
+
+
+def create_model(config, env_wrapper, init_path=None):
+    params = config["model"]["params"]
+    params["policy_kwargs"]["activation_fn"] = torch.nn.Tanh
+    if init_path is not None:
+        print(f"Initializing from {init_path}")
+        return PPO.load(init_path, env=env_wrapper, **params)
+    return PPO("MlpPolicy", env=env_wrapper, **params)
+
+
+def to_tensors(data, policy):
+    obs, actions = data
+    obs_tensor = torch.as_tensor(obs, dtype=torch.float32, device=policy.device)
+    actions_tensor = torch.as_tensor(actions, device=policy.device)
+    if isinstance(policy.action_space, spaces.Discrete):
+        actions_tensor = actions_tensor.long().flatten()
+    elif isinstance(policy.action_space, spaces.MultiDiscrete):
+        actions_tensor = actions_tensor.long()
+    else:
+        actions_tensor = actions_tensor.float()
+    return obs_tensor, actions_tensor
+
+
+def evaluate(policy, obs, actions, batch_size):
+    losses = []
+    errors = []
+    with torch.no_grad():
+        for start in range(0, len(obs), batch_size):
+            obs_batch = obs[start:start + batch_size]
+            action_batch = actions[start:start + batch_size]
+            _, log_prob, _ = policy.evaluate_actions(obs_batch, action_batch)
+            predicted = policy.get_distribution(obs_batch).mode()
+            losses.append(-log_prob.sum().item())
+            if isinstance(policy.action_space, spaces.Box):
+                errors.append((predicted - action_batch).abs().mean(dim=-1).sum().item())
+            else:
+                errors.append((predicted.reshape(action_batch.shape) != action_batch).float().reshape(len(obs_batch), -1).mean(dim=-1).sum().item())
+    return sum(losses) / len(obs), sum(errors) / len(obs)
+
+
+def behavior_cloning(policy, train, validation, epochs, batch_size, learning_rate, seed, train_log_std=False):
+    # Maximum likelihood of the demonstrated actions under the PPO policy distribution. log_std is kept
+    # as initialized by default so PPO still explores afterwards; the value head is left to PPO.
+    generator = torch.Generator().manual_seed(seed)
+    parameters = [p for name, p in policy.named_parameters() if train_log_std or name != "log_std"]
+    optimizer = torch.optim.Adam(parameters, lr=learning_rate)
+    obs, actions = to_tensors(train, policy)
+    validation_tensors = to_tensors(validation, policy) if validation is not None else None
+    error_name = "mean abs error" if isinstance(policy.action_space, spaces.Box) else "mismatch rate"
+
+    policy.set_training_mode(True)
+    for epoch in range(1, epochs + 1):
+        start_time = time.perf_counter()
+        order = torch.randperm(len(obs), generator=generator).to(policy.device)
+        total_loss = 0.0
+        for start in range(0, len(obs), batch_size):
+            indices = order[start:start + batch_size]
+            _, log_prob, _ = policy.evaluate_actions(obs[indices], actions[indices])
+            loss = -log_prob.mean()
+            optimizer.zero_grad()
+            loss.backward()
+            torch.nn.utils.clip_grad_norm_(parameters, 0.5)
+            optimizer.step()
+            total_loss += loss.item() * len(indices)
+        message = f"Epoch {epoch}/{epochs}: train NLL {total_loss / len(obs):.4f}"
+        if validation_tensors is not None:
+            policy.set_training_mode(False)
+            validation_loss, validation_error = evaluate(policy, *validation_tensors, batch_size=4096)
+            policy.set_training_mode(True)
+            message += f", validation NLL {validation_loss:.4f}, {error_name} {validation_error:.4f}"
+        print(f"{message} ({time.perf_counter() - start_time:.2f}s)")
+    policy.set_training_mode(False)
+
+
+if __name__ == "__main__":
+    config = get_config()
+    parser = argparse.ArgumentParser(description="Pretrain the PPO policy on recorded keyboard demonstrations")
+    parser.add_argument("demonstrations", nargs="*", help="Demonstration directories (defaults to the model dir's demonstrations)")
+    parser.add_argument("--output", default=config["model"]["path"], help="Where to save the pretrained PPO model")
+    parser.add_argument("--init", default=None, help="Start from an existing PPO model instead of a fresh one")
+    parser.add_argument("--epochs", type=int, default=20)
+    parser.add_argument("--batch-size", type=int, default=256)
+    parser.add_argument("--learning-rate", type=float, default=1e-3)
+    parser.add_argument("--validation-fraction", type=float, default=0.1)
+    parser.add_argument("--train-log-std", action="store_true", help="Also fit the Gaussian log std to the demonstrations")
+    parser.add_argument("--threads", type=int, default=os.cpu_count() or 1, help="CPU threads used by torch")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--overwrite", action="store_true", help="Replace an existing model at --output")
+    args = parser.parse_args()
+
+    if os.path.exists(args.output) and not args.overwrite:
+        raise SystemExit(f"{args.output} already exists; pass --overwrite to replace it or choose another --output")
+    torch.set_num_threads(args.threads)
+    torch.manual_seed(args.seed)
+
+    paths = args.demonstrations or [os.path.join(config["model"]["dir"], "demonstrations")]
+    observation_structure, action_space_info, episodes = load_demonstrations(paths)
+    train, validation = split_episodes(episodes, args.validation_fraction, args.seed)
+    print(f"Training on {len(train[0])} steps, validating on {len(validation[0]) if validation is not None else 0} steps "
+          f"with {args.threads} threads")
+
+    env_wrapper = EnvWrapper(observation_structure, action_space_info)
+    model = create_model(config, env_wrapper, args.init)
+    # With observation normalization the statistics are fitted on the demonstrations in one batch (on top of
+    # --init's own, if it has them) and saved with the pretrained model, which MLPlay then keeps updating
+    normalizer = create_observation_normalizer(config["model"].get("observation_normalization"),
+                                               env_wrapper.observation_space.shape[0], args.init)
+    if normalizer is not None:
+        normalizer.update_batch(train[0])
+        train = (normalizer.normalize(train[0]), train[1])
+        if validation is not None:
+            validation = (normalizer.normalize(validation[0]), validation[1])
+    behavior_cloning(model.policy, train, validation, args.epochs, args.batch_size, args.learning_rate, args.seed,
+                     train_log_std=args.train_log_std)
+
+    os.makedirs(os.path.dirname(os.path.abspath(args.output)), exist_ok=True)
+    # Written next to the output and moved over it, so a reader (or a hot-reloading inference) never sees half a zip
+    tmp_path = args.output + ".tmp.zip"
+    model.save(tmp_path)
+    if normalizer is not None:
+        save_observation_normalizer(tmp_path, normalizer)
+    os.replace(tmp_path, args.output)
+    print(f"Pretrained model saved to {args.output}")
@@ -0,0 +1,120 @@
+import time
+import argparse
+import numpy as np
+from utils import ActionSpaceSpec
+from actionProcessor import ActionProcessor
+
+
+# The per-element loops ActionProcessor used before vectorizing, kept as the reference behaviour
+def loop_continuous_to_discrete(discrete_branches, continuous_values):
+    discrete_actions = []
+    value_idx = 0
+    for branch_size in discrete_branches:
+        discrete_action = 0
+        max_continuous_val = float("-inf")
+        for i in range(branch_size):
+            if value_idx + i < len(continuous_values):
+                continuous_val = continuous_values[value_idx + i]
+                if continuous_val > max_continuous_val:
+                    discrete_action = i
+                    max_continuous_val = continuous_val
+        discrete_actions.append(discrete_action)
+        value_idx += branch_size
+    return np.array(discrete_actions, dtype=np.int32)
+
+
+def loop_discrete_to_continuous(discrete_branches, discrete_values):
+    continuous_actions = []
+    value_idx = 0
+    for branch_size in discrete_branches:
+        if value_idx < len(discrete_values):
+            discrete_val = discrete_values[value_idx]
+            for i in range(branch_size):
+                if i == discrete_val:
+                    continuous_actions.append(1.0)
+                else:
+                    continuous_actions.append(-1.0)
+        value_idx += 1
+    return np.array(continuous_actions, dtype=np.float32)
+
+
+def random_outputs(rng, count, size):
+    outputs = rng.normal(size=(count, size)).astype(np.float32)
+    # Ties, NaN and infinities are where a segmented argmax most easily drifts from the loop
+    outputs[rng.random(outputs.shape) < 0.05] = np.nan
+    outputs[rng.random(outputs.shape) < 0.02] = -np.inf
+    outputs[rng.random(outputs.shape) < 0.02] = np.inf
+    outputs[rng.random(outputs.shape) < 0.1] = 0.0
+    return outputs
+
+
+def check_equal(processor, rng, count):
+    branches = processor.discrete_branches
+    outputs = random_outputs(rng, count, processor.action_size)
+    discrete_part = outputs[:, processor.continuous_size:]
+    batch = processor.create_actions(outputs)[1]
+    for i in range(count):
+        expected = loop_continuous_to_discrete(branches, discrete_part[i])
+        if not np.array_equal(processor._continuous_to_discrete(discrete_part[i]), expected) or not np.array_equal(batch[i], expected):
+            return False
+        # Truncated inputs skip the missing columns
+        cut = rng.integers(0, len(discrete_part[i]) + 1)
+        if not np.array_equal(processor._continuous_to_discrete(discrete_part[i][:cut]), loop_continuous_to_discrete(branches, discrete_part[i][:cut])):
+            return False
+
+    choices = np.stack([rng.integers(-1, branch + 1, size=count) for branch in branches], axis=1)
+    batch = processor._discrete_to_continuous_batch(choices)
+    for i in range(count):
+        expected = loop_discrete_to_continuous(branches, choices[i])
+        if not np.array_equal(processor._discrete_to_continuous(choices[i]), expected) or not np.array_equal(batch[i], expected):
+            return False
+        cut = rng.integers(0, len(branches) + 1)
+        if not np.array_equal(processor._discrete_to_continuous(choices[i][:cut]), loop_discrete_to_continuous(branches, choices[i][:cut])):
+            return False
+    return True
+
+
+def best_time(fn, repeats):
+    best = float("inf")
+    for _ in range(repeats):
+        start = time.perf_counter()
+        fn()
+        best = min(best, time.perf_counter() - start)
+    return best
+
+
+def benchmark(branches, count, repeats, rng):
+    processor = ActionProcessor(ActionSpaceSpec(continuous_size=2, discrete_branches=branches))
+    outputs = random_outputs(rng, count, processor.action_size)
+    discrete_part = outputs[:, processor.continuous_size:]
+    choices = processor.create_actions(outputs)[1]
+    timings = {
+        "to_discrete loop": best_time(lambda: [loop_continuous_to_discrete(branches, row) for row in discrete_part], repeats),
+        "to_discrete single": best_time(lambda: [processor._continuous_to_discrete(row) for row in discrete_part], repeats),
+        "to_discrete batch": best_time(lambda: processor.create_actions(outputs), repeats),
+        "to_continuous loop": best_time(lambda: [loop_discrete_to_continuous(branches, row) for row in choices], repeats),
+        "to_continuous single": best_time(lambda: [processor._discrete_to_continuous(row) for row in choices], repeats),
+        "to_continuous batch": best_time(lambda: processor._discrete_to_continuous_batch(choices), repeats)
+    }
+    print(f"Branches {len(branches)} x up to {max(branches)} ({processor.discrete_size} outputs), {count} actions:")
+    for name, seconds in timings.items():
+        print(f"  {name:>20}: {seconds / count * 1e6:9.2f} us/action")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Check the vectorized ActionProcessor against the loop version and time both")
+    parser.add_argument("--count", type=int, default=2000)
+    parser.add_argument("--repeats", type=int, default=3)
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+    rng = np.random.default_rng(args.seed)
+
+    configurations = [(2,), (3, 3), (2, 5, 3, 7), tuple(rng.integers(2, 10, size=16)), (64,) * 32, tuple(rng.integers(1, 256, size=64))]
+    for branches in configurations:
+        processor = ActionProcessor(ActionSpaceSpec(continuous_size=2, discrete_branches=branches))
+        if not check_equal(processor, rng, 200):
+            print(f"Mismatch with the loop version for branches {branches}")
+            raise SystemExit(1)
+    print("Vectorized conversions match the loop version on all configurations")
+    for branches in configurations:
+        benchmark(branches, args.count, args.repeats, rng)
@@ -0,0 +1,116 @@
+import time
+import argparse
+import torch
+import numpy as np
+from MLPlay import MLPlay
+from utils import get_config, ActionSpaceSpec
+from envWrapper import EnvWrapper
+from latencyProfiler import NullProfiler
+from standInGame import STAND_IN_OBSERVATION_STRUCTURE
+from stable_baselines3 import PPO
+
+
+# The per-step path MLPlay used before preallocating: fresh tensors for every forward pass and insert
+def legacy_predict(policy, obs):
+    obs_tensor = torch.as_tensor(obs).unsqueeze(0)
+    with torch.no_grad():
+        action, value, log_prob = policy(obs_tensor)
+    return action.cpu().numpy().flatten(), log_prob.cpu().numpy().flatten(), value.cpu().numpy().flatten()
+
+
+def legacy_store(rollout_buffer, obs, action, reward, done, value, log_prob, next_value):
+    rollout_buffer.add(
+        obs=torch.as_tensor(obs).unsqueeze(0),
+        action=torch.as_tensor(action).unsqueeze(0),
+        reward=torch.as_tensor([reward]),
+        episode_start=torch.as_tensor([done]),
+        value=torch.as_tensor(value).unsqueeze(0) if value.ndim == 0 else torch.as_tensor(value),
+        log_prob=torch.as_tensor(log_prob).unsqueeze(0) if log_prob.ndim == 0 else torch.as_tensor(log_prob)
+    )
+    if rollout_buffer.full:
+        done_tensor = np.array([done])
+        value_tensor = torch.as_tensor(next_value).unsqueeze(0) if next_value.ndim == 0 else torch.as_tensor(next_value)
+        rollout_buffer.compute_returns_and_advantage(last_values=value_tensor, dones=done_tensor)
+
+
+def run_legacy(model, observations, rewards):
+    prev = None
+    for obs, reward in zip(observations, rewards):
+        action, log_prob, value = legacy_predict(model.policy, obs)
+        if prev is not None:
+            legacy_store(model.rollout_buffer, prev[0], prev[1], reward, False, prev[3], prev[2], value)
+            if model.rollout_buffer.full:
+                model.rollout_buffer.reset()
+        prev = (obs, action, log_prob, value)
+
+
+def run_fast(play, observations, rewards):
+    prev = None
+    for obs, reward in zip(observations, rewards):
+        action, log_prob, value = play._predict_with_info(obs)
+        if prev is not None:
+            play._store_transition(prev[0], prev[1], reward, False, prev[3], prev[2], value)
+            if play.rollout_buffer.full:
+                play.rollout_buffer.reset()
+        prev = (obs, action, log_prob, value)
+
+
+def create_hot_path(model):
+    # Only the pieces of MLPlay the per-step path touches, without a game or model files
+    play = MLPlay.__new__(MLPlay)
+    play.model = model
+    play.async_learner = None
+    play.pending_transitions = []
+    play.profiler = NullProfiler()
+    play._init_hot_path()
+    return play
+
+
+def benchmark(steps, repeats, device):
+    config = get_config()
+    params = dict(config["model"]["params"])
+    params.pop("tensorboard_log", None)
+    params["policy_kwargs"] = dict(params["policy_kwargs"], activation_fn=torch.nn.Tanh)
+    env_wrapper = EnvWrapper(STAND_IN_OBSERVATION_STRUCTURE, ActionSpaceSpec(continuous_size=2, discrete_branches=(2,)))
+    model = PPO("MlpPolicy", env=env_wrapper, **params, device=device)
+    model._setup_learn(total_timesteps=0)
+    play = create_hot_path(model)
+
+    rng = np.random.default_rng(0)
+    observations = rng.normal(0.0, 5.0, size=(steps, env_wrapper.observation_space.shape[0])).astype(np.float32)
+    rewards = rng.normal(size=steps).astype(np.float32)
+
+    # Both paths must leave identical rollout contents behind
+    model.rollout_buffer.reset()
+    torch.manual_seed(0)
+    run_legacy(model, observations[:model.n_steps], rewards)
+    expected = [getattr(model.rollout_buffer, key).copy() for key in ("observations", "actions", "rewards", "values", "log_probs")]
+    model.rollout_buffer.reset()
+    torch.manual_seed(0)
+    run_fast(play, observations[:model.n_steps], rewards)
+    actual = [getattr(model.rollout_buffer, key) for key in ("observations", "actions", "rewards", "values", "log_probs")]
+    matches = all(np.array_equal(a, b) for a, b in zip(expected, actual))
+    print(f"Rollout contents identical: {matches}")
+
+    results = {}
+    for name, run, target in (("legacy", run_legacy, model), ("fast", run_fast, play)):
+        best = float("inf")
+        for _ in range(repeats):
+            model.rollout_buffer.reset()
+            start = time.perf_counter()
+            run(target, observations, rewards)
+            best = min(best, time.perf_counter() - start)
+        results[name] = steps / best
+        print(f"{name:>6}: {results[name]:,.0f} steps/s")
+    print(f"Speedup: {results['fast'] / results['legacy']:.2f}x")
+    return matches
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Compare MLPlay's per-step predict/insert path with the previous one")
+    parser.add_argument("--steps", type=int, default=5000)
+    parser.add_argument("--repeats", type=int, default=3)
+    parser.add_argument("--device", default="cpu")
+    args = parser.parse_args()
+    if not benchmark(args.steps, args.repeats, args.device):
+        raise SystemExit(1)
@@ -0,0 +1,87 @@
+import time
+import argparse
+import torch
+import numpy as np
+from utils import get_config, ActionSpaceSpec
+from envWrapper import EnvWrapper
+from fastPPOUpdate import FastPPOUpdate
+from standInGame import STAND_IN_OBSERVATION_STRUCTURE
+from stable_baselines3 import PPO
+
+
+def create_model(params, seed, device):
+    torch.manual_seed(seed)
+    env_wrapper = EnvWrapper(STAND_IN_OBSERVATION_STRUCTURE, ActionSpaceSpec(continuous_size=2, discrete_branches=(2,)))
+    model = PPO("MlpPolicy", env=env_wrapper, **params, seed=seed, device=device)
+    model._setup_learn(total_timesteps=0)
+    return model
+
+
+def fill_rollout(model, seed):
+    # A rollout collected by the model's own policy on synthetic observations, the same for every model
+    rng = np.random.default_rng(seed)
+    rollout_buffer = model.rollout_buffer
+    rollout_buffer.reset()
+    obs = rng.normal(0.0, 5.0, size=(rollout_buffer.buffer_size, model.observation_space.shape[0])).astype(np.float32)
+    with torch.no_grad():
+        actions, values, log_probs = model.policy(torch.as_tensor(obs))
+    rollout_buffer.observations[:, 0] = obs
+    rollout_buffer.actions[:, 0] = actions.numpy()
+    rollout_buffer.rewards[:, 0] = np.tanh(obs[:, 0]) + rng.normal(0.0, 0.5, size=len(obs))
+    rollout_buffer.episode_starts[:, 0] = rng.random(len(obs)) < 0.002
+    rollout_buffer.values[:, 0] = values.numpy().flatten()
+    rollout_buffer.log_probs[:, 0] = log_probs.numpy()
+    rollout_buffer.pos = rollout_buffer.buffer_size
+    rollout_buffer.full = True
+    rollout_buffer.compute_returns_and_advantage(last_values=torch.zeros(1), dones=np.zeros(1, dtype=np.float32))
+
+
+def train_once(model, train, seed):
+    fill_rollout(model, seed)
+    np.random.seed(seed)
+    start = time.perf_counter()
+    train()
+    return time.perf_counter() - start
+
+
+def parameters(model):
+    return torch.cat([parameter.detach().flatten() for parameter in model.policy.parameters()]).numpy().copy()
+
+
+def benchmark(updates, batch_sizes, threads, device, seed=0):
+    config = get_config()
+    params = dict(config["model"]["params"])
+    params.pop("tensorboard_log", None)
+    params["policy_kwargs"] = dict(params["policy_kwargs"], activation_fn=torch.nn.Tanh)
+
+    # The fast path at the model's batch_size must make the same update as PPO.train
+    reference = create_model(params, seed, device)
+    initial = parameters(reference)
+    train_once(reference, reference.train, seed)
+    fast = create_model(params, seed, device)
+    train_once(fast, FastPPOUpdate(fast, threads=threads).train, seed)
+    update = parameters(reference) - initial
+    drift = float(np.linalg.norm(parameters(fast) - parameters(reference)) / np.linalg.norm(update))
+    losses = [model.logger.name_to_value["train/loss"] for model in (reference, fast)]
+    print(f"Same update as PPO.train: relative parameter difference {drift:.2e}, loss {losses[0]:.6f} vs {losses[1]:.6f}")
+
+    variants = [("PPO.train", None)] + [(f"fast, batch {batch_size or params['batch_size']}", batch_size) for batch_size in batch_sizes]
+    results = {}
+    for name, batch_size in variants:
+        model = create_model(params, seed, device)
+        train = model.train if name == "PPO.train" else FastPPOUpdate(model, batch_size=batch_size, threads=threads).train
+        results[name] = min(train_once(model, train, seed + i) for i in range(updates))
+    baseline = results["PPO.train"]
+    for name, seconds in results.items():
+        print(f"{name:<20} {seconds:7.3f} s per update  {baseline / seconds:5.2f}x")
+    return drift
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Compare FastPPOUpdate with PPO.train on the config's PPO parameters")
+    parser.add_argument("--updates", type=int, default=3, help="Updates per variant, the fastest one counts")
+    parser.add_argument("--batch-sizes", type=int, nargs="*", default=[0, 256, 512], help="0 keeps the config's batch_size")
+    parser.add_argument("--threads", type=int, default=None)
+    parser.add_argument("--device", default="cpu")
+    args = parser.parse_args()
+    benchmark(args.updates, [batch_size or None for batch_size in args.batch_sizes], args.threads, args.device)
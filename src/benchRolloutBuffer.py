@@ -0,0 +1,114 @@
+import time
+import argparse
+import multiprocessing as mp
+import numpy as np
+from benchmark import peak_rss_mb
+
+# Stand-in Grid-style observations: small non-negative cell values plus a few continuous features
+CONTINUOUS_FEATURES = 32
+
+
+def make_env(obs_size):
+    import gymnasium as gym
+    from gymnasium import spaces
+
+    class GridEnv(gym.Env):
+        observation_space = spaces.Box(low=-np.inf, high=np.inf, shape=(obs_size,), dtype=np.float32)
+        action_space = spaces.MultiDiscrete([3, 3, 2])
+
+        def reset(self, seed=None, options=None):
+            return np.zeros(obs_size, dtype=np.float32), {}
+
+        def step(self, action):
+            return np.zeros(obs_size, dtype=np.float32), 0.0, False, False, {}
+
+    return GridEnv()
+
+
+def fill_rollout(model, rollout_buffer, seed, chunk=1024):
+    # The same synthetic rollout for every variant, generated a chunk at a time so that only the buffer stays resident
+    import torch
+    from compactRolloutBuffer import store_observation
+    obs_size = model.observation_space.shape[0]
+    for start in range(0, rollout_buffer.buffer_size, chunk):
+        rng = np.random.default_rng([seed, start])
+        rows = min(chunk, rollout_buffer.buffer_size - start)
+        obs = rng.integers(0, 5, size=(rows, obs_size)).astype(np.float32)
+        obs[:, :CONTINUOUS_FEATURES] = rng.normal(0.0, 20.0, size=(rows, CONTINUOUS_FEATURES))
+        with torch.no_grad():
+            actions, values, log_probs = model.policy(torch.as_tensor(obs))
+        # Rewards that depend on the observation, so the update has something to learn
+        rewards = (np.tanh(obs[:, 0] / 20.0) + 0.1 * obs[:, CONTINUOUS_FEATURES] + rng.normal(0.0, 0.5, size=rows)).astype(np.float32)
+        dones = rng.random(rows) < 0.002
+        for i in range(rows):
+            pos = start + i
+            store_observation(rollout_buffer, pos, 0, obs[i])
+            rollout_buffer.actions[pos, 0] = actions[i].numpy()
+            rollout_buffer.rewards[pos, 0] = rewards[i]
+            rollout_buffer.episode_starts[pos, 0] = dones[i]
+            rollout_buffer.values[pos, 0] = values[i, 0].item()
+            rollout_buffer.log_probs[pos, 0] = log_probs[i].item()
+    rollout_buffer.pos = rollout_buffer.buffer_size
+    rollout_buffer.full = True
+    rollout_buffer.compute_returns_and_advantage(last_values=torch.zeros(1), dones=np.zeros(1, dtype=np.float32))
+
+
+def run_variant(observations, obs_size, n_steps, batch_size, epochs, seed):
+    import torch
+    from stable_baselines3 import PPO
+    from compactRolloutBuffer import create_rollout_buffer, rollout_buffer_nbytes
+    torch.manual_seed(seed)
+    model = PPO("MlpPolicy", make_env(obs_size), n_steps=n_steps, batch_size=batch_size, n_epochs=epochs, seed=seed,
+                policy_kwargs={"net_arch": [64, 64], "activation_fn": torch.nn.Tanh})
+    model._setup_learn(total_timesteps=0)
+    # "compact_float32" runs CompactRolloutBuffer without reducing precision, to check it against RolloutBuffer;
+    # "reshuffled" is float32 with other minibatches, the drift any change to the update already causes
+    dtype = observations.replace("compact_", "").replace("reshuffled", "float32")
+    compact_config = {"enabled": observations not in ("float32", "reshuffled"), "observations": dtype}
+    model.rollout_buffer = create_rollout_buffer(compact_config, model)
+    initial = torch.cat([parameter.detach().flatten() for parameter in model.policy.parameters()]).numpy().copy()
+    fill_rollout(model, model.rollout_buffer, seed)
+    np.random.seed(seed + 1 if observations == "reshuffled" else seed)
+    start = time.perf_counter()
+    model.train()
+    seconds = time.perf_counter() - start
+    parameters = torch.cat([parameter.detach().flatten() for parameter in model.policy.parameters()]).numpy()
+    return {
+        "observations": observations,
+        "buffer_mb": rollout_buffer_nbytes(model.rollout_buffer) / 2 ** 20,
+        "peak_rss_mb": peak_rss_mb(),
+        "train_seconds": seconds,
+        "loss": model.logger.name_to_value["train/loss"],
+        "parameters": parameters,
+        "update": parameters - initial
+    }
+
+
+def compare(variants, obs_size, n_steps, batch_size, epochs, seed):
+    # Each variant trains in a fresh process so that its peak RSS is its own
+    context = mp.get_context("spawn")
+    results = []
+    for observations in ["float32", "reshuffled"] + variants:
+        with context.Pool(1) as pool:
+            results.append(pool.apply(run_variant, (observations, obs_size, n_steps, batch_size, epochs, seed)))
+    baseline = results[0]
+    print(f"{n_steps} steps x {obs_size} observation entries, batch_size {batch_size}, {epochs} epochs")
+    # update drift: how far the variant's parameter update lands from float32's, relative to the update's size
+    print(f"{'observations':<16} {'buffer':>9} {'peak RSS':>9} {'train':>8} {'loss':>10} {'update drift':>13}")
+    for result in results:
+        drift = float(np.linalg.norm(result["update"] - baseline["update"]) / np.linalg.norm(baseline["update"]))
+        print(f"{result['observations']:<16} {result['buffer_mb']:7.1f}MB {result['peak_rss_mb']:7.0f}MB "
+              f"{result['train_seconds']:7.2f}s {result['loss']:10.5f} {drift:13.2e}")
+    return results
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Compare the compact rollout buffer with SB3's float32 one on one PPO update")
+    parser.add_argument("variants", nargs="*", default=["float16", "uint8"], help="float16, uint8 or compact_float32")
+    parser.add_argument("--obs-size", type=int, default=2048)
+    parser.add_argument("--n-steps", type=int, default=16384)
+    parser.add_argument("--batch-size", type=int, default=256)
+    parser.add_argument("--epochs", type=int, default=2)
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+    compare(args.variants, args.obs_size, args.n_steps, args.batch_size, args.epochs, args.seed)
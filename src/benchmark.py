@@ -0,0 +1,325 @@
+import os
+import sys
+import json
+import time
+import shutil
+import argparse
+import platform
+import tempfile
+import subprocess
+import numpy as np
+from concurrent.futures import ThreadPoolExecutor
+
+SRC_DIR = os.path.dirname(os.path.abspath(__file__))
+REPO_DIR = os.path.dirname(SRC_DIR)
+RACING_DIR = os.path.join(REPO_DIR, "racing_src")
+
+# Each target runs in its own process against the stand-in game. "dir" is the source directory its flat
+# imports resolve to, "model" / "racing" are merged into the config.json / racing_config.json it sees.
+TARGETS = {
+    "train": {"dir": SRC_DIR, "module": "MLPlay", "players": 1, "train": True, "model": {"async_update": False}},
+    "train_async": {"dir": SRC_DIR, "module": "MLPlay", "players": 1, "train": True, "model": {"async_update": True}},
+    "inference": {"dir": SRC_DIR, "module": "inference", "players": 1, "model": {"inference_engine": "sb3"}},
+    "inference_numpy": {"dir": SRC_DIR, "module": "inference", "players": 1, "model": {"inference_engine": "numpy"}},
+    "racing": {"dir": RACING_DIR, "module": "mlPlay", "players": 4, "racing": {"inference_engine": "sb3"}},
+    "racing_numpy": {"dir": RACING_DIR, "module": "mlPlay", "players": 4, "racing": {"inference_engine": "numpy"}},
+}
+
+
+def peak_rss_mb():
+    try:
+        import resource
+    except ImportError:
+        return _windows_peak_rss_mb()
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # ru_maxrss is in bytes on macOS and in kilobytes elsewhere
+    return peak / 2 ** 20 if sys.platform == "darwin" else peak / 2 ** 10
+
+
+def _windows_peak_rss_mb():
+    import ctypes
+    from ctypes import wintypes
+
+    class ProcessMemoryCounters(ctypes.Structure):
+        _fields_ = [("cb", wintypes.DWORD), ("PageFaultCount", wintypes.DWORD)] + [
+            (name, ctypes.c_size_t) for name in (
+                "PeakWorkingSetSize", "WorkingSetSize", "QuotaPeakPagedPoolUsage", "QuotaPagedPoolUsage",
+                "QuotaPeakNonPagedPoolUsage", "QuotaNonPagedPoolUsage", "PagefileUsage", "PeakPagefileUsage"
+            )
+        ]
+
+    counters = ProcessMemoryCounters()
+    counters.cb = ctypes.sizeof(counters)
+    get_current_process = ctypes.windll.kernel32.GetCurrentProcess
+    get_current_process.restype = wintypes.HANDLE
+    get_process_memory_info = ctypes.windll.psapi.GetProcessMemoryInfo
+    get_process_memory_info.argtypes = [wintypes.HANDLE, ctypes.POINTER(ProcessMemoryCounters), wintypes.DWORD]
+    if not get_process_memory_info(get_current_process(), ctypes.byref(counters), counters.cb):
+        return None
+    return counters.PeakWorkingSetSize / 2 ** 20
+
+
+def latency_summary(seconds):
+    if not seconds:
+        return {"count": 0}
+    milliseconds = np.asarray(seconds) * 1000.0
+    return {
+        "count": len(milliseconds),
+        "mean": float(milliseconds.mean()),
+        "p50": float(np.percentile(milliseconds, 50)),
+        "p99": float(np.percentile(milliseconds, 99)),
+        "max": float(milliseconds.max())
+    }
+
+
+def create_mlplays(target, env, config):
+    names = env.behavior_names
+    if target["dir"] == RACING_DIR:
+        from racing import get_mlplay
+        from policyServer import PolicyServer
+        policy_server = PolicyServer(
+            batch_wait=config.get("batch_wait", 0.02),
+            engine=config.get("inference_engine", "sb3"),
+            deterministic=config.get("deterministic", False)
+        )
+        return [get_mlplay(i + 1, env.get_observation_structure(name), env.get_action_space_info(name), config, policy_server)
+                for i, name in enumerate(names)]
+
+    import importlib
+    module = importlib.import_module(target["module"])
+    return [module.MLPlay(env.get_observation_structure(name), env.get_action_space_info(name), f"MLPlay{i + 1}", config=config)
+            for i, name in enumerate(names)]
+
+
+def time_training(mlplay, train_times):
+    # Wraps the train method _update_policy calls, FastPPOUpdate's when it is enabled and PPO.train otherwise,
+    # so every PPO update is timed, whichever thread runs it
+    trainer = getattr(mlplay, "ppo_update", None) or mlplay.model
+    train = trainer.train
+
+    def timed_train():
+        start = time.perf_counter()
+        train()
+        train_times.append(time.perf_counter() - start)
+    trainer.train = timed_train
+
+
+def run_target(name, steps, seed, result_path):
+    target = TARGETS[name]
+    sys.path.insert(0, target["dir"])
+    from utils import get_config
+    from standInGame import StandInEnvironment
+
+    config = get_config()
+    start = time.perf_counter()
+    env = StandInEnvironment(controlled_players=list(range(target["players"])),
+                             game_parameters=config["game_parameters"], seed=seed)
+    mlplays = create_mlplays(target, env, config)
+    startup = time.perf_counter() - start
+    train_times = []
+    if target.get("train"):
+        for mlplay in mlplays:
+            time_training(mlplay, train_times)
+
+    executor = ThreadPoolExecutor(max_workers=len(mlplays))
+    update_times = []
+    reset_times = []
+    observations = env.reset()
+    done = False
+    info = {}
+    start = time.perf_counter()
+    for _ in range(steps):
+        step_start = time.perf_counter()
+        # Like StandInRunner: players update concurrently, the step waits for the slowest one
+        if len(mlplays) == 1:
+            behavior_name = env.behavior_names[0]
+            actions = {behavior_name: [mlplays[0].update(observations[behavior_name], done, info, env.keyboard)]}
+        else:
+            futures = [(behavior_name, executor.submit(mlplay.update, observations[behavior_name], done, info, env.keyboard))
+                       for mlplay, behavior_name in zip(mlplays, env.behavior_names)]
+            actions = {behavior_name: [future.result()] for behavior_name, future in futures}
+        update_times.append(time.perf_counter() - step_start)
+
+        observations, _, done, info = env.step(actions)
+        if done:
+            reset_start = time.perf_counter()
+            for mlplay in mlplays:
+                mlplay.reset()
+            reset_times.append(time.perf_counter() - reset_start)
+            observations = env.reset()
+            done = False
+    elapsed = time.perf_counter() - start
+    executor.shutdown()
+
+    # Background updates and checkpoint writes still in flight are finished but not counted as step time
+    for mlplay in mlplays:
+        if getattr(mlplay, "async_learner", None) is not None:
+            mlplay.async_learner.close()
+        if getattr(mlplay, "checkpoint_writer", None) is not None:
+            mlplay.checkpoint_writer.close()
+
+    result = {
+        "steps": steps,
+        "players": len(mlplays),
+        "elapsed": elapsed,
+        "steps_per_second": steps / elapsed,
+        "startup_seconds": startup,
+        "update_ms": latency_summary(update_times),
+        "reset_ms": latency_summary(reset_times),
+        "train_ms": latency_summary(train_times),
+        "peak_rss_mb": peak_rss_mb()
+    }
+    with open(result_path, "w") as f:
+        json.dump(result, f)
+
+
+def git_commit():
+    try:
+        commit = subprocess.run(["git", "rev-parse", "HEAD"], cwd=REPO_DIR, capture_output=True, text=True, check=True).stdout.strip()
+        dirty = bool(subprocess.run(["git", "status", "--porcelain", "--untracked-files=no"], cwd=REPO_DIR,
+                                    capture_output=True, text=True, check=True).stdout.strip())
+        return commit, dirty
+    except (OSError, subprocess.CalledProcessError):
+        return None, None
+
+
+def create_initial_model(config, path, seed):
+    # Every training and inference target starts from the same untrained model
+    import torch
+    from stable_baselines3 import PPO
+    from envWrapper import EnvWrapper
+    from standInGame import StandInEnvironment
+    env = StandInEnvironment()
+    behavior_name = env.behavior_names[0]
+    env_wrapper = EnvWrapper(env.get_observation_structure(behavior_name), env.get_action_space_info(behavior_name))
+    params = dict(config["model"]["params"], tensorboard_log=None, seed=seed)
+    params["policy_kwargs"] = dict(params["policy_kwargs"], activation_fn=torch.nn.Tanh)
+    PPO("MlpPolicy", env=env_wrapper, **params).save(path)
+
+
+def write_target_config(name, work_dir, base_config, racing_base_config, initial_model, n_steps):
+    target = TARGETS[name]
+    target_dir = os.path.join(work_dir, name)
+    os.makedirs(target_dir, exist_ok=True)
+    model_path = os.path.join(target_dir, "model.zip")
+    shutil.copyfile(initial_model, model_path)
+
+    if target["dir"] == RACING_DIR:
+        config = dict(racing_base_config, profiling={"enabled": False})
+        config.update({f"model_{i + 1}": model_path for i in range(target["players"])})
+        config.update(target.get("racing", {}))
+    else:
+        model = dict(base_config["model"], dir=target_dir, path=model_path)
+        model["params"] = dict(model["params"], n_steps=n_steps, tensorboard_log=None)
+        model.update(target.get("model", {}))
+        config = dict(base_config, model=model, profiling={"enabled": False}, recording={"enabled": False})
+    config_path = os.path.join(target_dir, "config.json")
+    with open(config_path, "w") as f:
+        json.dump(config, f, indent=2)
+    return config_path
+
+
+def run_in_subprocess(name, config_path, steps, seed, timeout):
+    result_path = os.path.join(os.path.dirname(config_path), "result.json")
+    log_path = os.path.join(os.path.dirname(config_path), "output.log")
+    command = [sys.executable, os.path.abspath(__file__), "--child", name, "--steps", str(steps),
+               "--seed", str(seed), "--result", result_path]
+    with open(log_path, "w") as log:
+        try:
+            completed = subprocess.run(command, env=dict(os.environ, RLPROLY_CONFIG=config_path),
+                                       stdout=log, stderr=subprocess.STDOUT, timeout=timeout)
+            returncode = completed.returncode
+        except subprocess.TimeoutExpired:
+            returncode = "timeout"
+    if returncode != 0 or not os.path.exists(result_path):
+        with open(log_path) as f:
+            tail = f.read()[-2000:]
+        print(f"{name} failed ({returncode}):\n{tail}")
+        return {"error": str(returncode)}
+    with open(result_path) as f:
+        return json.load(f)
+
+
+def load_previous(output, commit):
+    # The latest earlier record from another commit, to compare against
+    if not os.path.exists(output):
+        return None
+    previous = None
+    with open(output) as f:
+        for line in f:
+            record = json.loads(line)
+            if record.get("commit") != commit or commit is None:
+                previous = record
+    return previous
+
+
+def print_report(record, previous):
+    print(f"\nBenchmark at {record['commit'] or 'unknown commit'}{' (dirty)' if record['dirty'] else ''}")
+    print(f"{'target':<16} {'steps/s':>9} {'update p50':>11} {'update p99':>11} {'train mean':>11} {'peak RSS':>9}  vs previous")
+    for name, result in record["targets"].items():
+        if "error" in result:
+            print(f"{name:<16} failed: {result['error']}")
+            continue
+        change = ""
+        before = (previous or {}).get("targets", {}).get(name, {})
+        if "steps_per_second" in before:
+            change = f"{result['steps_per_second'] / before['steps_per_second']:.2f}x steps/s"
+        train = result["train_ms"]
+        print(f"{name:<16} {result['steps_per_second']:9.0f} {result['update_ms']['p50']:9.3f}ms {result['update_ms']['p99']:9.3f}ms "
+              f"{(str(round(train['mean'])) + 'ms') if train['count'] else '-':>11} {result['peak_rss_mb']:7.0f}MB  {change}")
+
+
+def benchmark(names, steps, n_steps, seed, output, timeout):
+    from utils import get_config
+    base_config = get_config()
+    with open(os.path.join(REPO_DIR, "racing_config.json")) as f:
+        racing_base_config = json.load(f)
+
+    commit, dirty = git_commit()
+    record = {
+        "commit": commit,
+        "dirty": dirty,
+        "time": time.strftime("%Y-%m-%dT%H:%M:%S"),
+        "platform": platform.platform(),
+        "python": platform.python_version(),
+        "settings": {"steps": steps, "n_steps": n_steps, "seed": seed},
+        "targets": {}
+    }
+    work_dir = tempfile.mkdtemp(prefix="rlproly_benchmark_")
+    try:
+        initial_model = os.path.join(work_dir, "initial_model.zip")
+        create_initial_model(base_config, initial_model, seed)
+        for name in names:
+            print(f"Running {name}...")
+            config_path = write_target_config(name, work_dir, base_config, racing_base_config, initial_model, n_steps)
+            record["targets"][name] = run_in_subprocess(name, config_path, steps, seed, timeout)
+    finally:
+        shutil.rmtree(work_dir, ignore_errors=True)
+
+    previous = load_previous(output, commit)
+    with open(output, "a") as f:
+        f.write(json.dumps(record) + "\n")
+    print_report(record, previous)
+    print(f"Results appended to {output}")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Run MLPlay, inference and racing against the stand-in game and record throughput")
+    parser.add_argument("targets", nargs="*", help=f"Targets to run: {', '.join(TARGETS)} (default: all)")
+    parser.add_argument("--steps", type=int, default=5000, help="Game steps per target")
+    parser.add_argument("--n-steps", type=int, default=512, help="Rollout length for the training targets")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--timeout", type=float, default=1800, help="Seconds before a target is abandoned")
+    parser.add_argument("--output", default=os.path.join(REPO_DIR, "benchmark_results.jsonl"), help="JSON lines file the results are appended to")
+    parser.add_argument("--child", help=argparse.SUPPRESS)
+    parser.add_argument("--result", help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    unknown = [name for name in args.targets + [args.child or "train"] if name not in TARGETS]
+    if unknown:
+        parser.error(f"unknown target(s): {', '.join(unknown)}")
+
+    if args.child:
+        run_target(args.child, args.steps, args.seed, args.result)
+    else:
+        benchmark(args.targets or list(TARGETS), args.steps, args.n_steps, args.seed, args.output, args.timeout)
@@ -0,0 +1,184 @@
+import os
+import json
+import math
+import time
+import queue
+import atexit
+import shutil
+import zipfile
+import threading
+import torch
+import stable_baselines3
+from stable_baselines3.common.utils import get_system_info
+from stable_baselines3.common.save_util import data_to_json, recursive_getattr
+
+CHECKPOINT_INDEX = "checkpoints.json"
+
+
+def to_cpu(value):
+    # Detached CPU copies of every tensor in a (nested) state dict, so training can keep changing the originals
+    if isinstance(value, torch.Tensor):
+        return value.detach().to("cpu", copy=True)
+    if isinstance(value, dict):
+        copied = type(value)((key, to_cpu(item)) for key, item in value.items())
+        if hasattr(value, "_metadata"):
+            copied._metadata = value._metadata
+        return copied
+    if isinstance(value, (list, tuple)):
+        return type(value)(to_cpu(item) for item in value)
+    return value
+
+
+def snapshot_model(model):
+    # Everything BaseAlgorithm.save writes, captured in memory on the calling thread
+    data = model.__dict__.copy()
+    exclude = set(model._excluded_save_params())
+    state_dicts_names, torch_variable_names = model._get_torch_save_params()
+    for torch_var in state_dicts_names + torch_variable_names:
+        exclude.add(torch_var.split(".")[0])
+    for param_name in exclude:
+        data.pop(param_name, None)
+
+    pytorch_variables = {name: to_cpu(recursive_getattr(model, name)) for name in torch_variable_names}
+    params = {name: to_cpu(state_dict) for name, state_dict in model.get_parameters().items()}
+    return data_to_json(data), params, pytorch_variables
+
+
+def write_model_zip(path, snapshot, compress=True, system_info=None, extra_files=None):
+    # Same entries as stable_baselines3.common.save_util.save_to_zip_file, so PPO.load reads it as usual;
+    # extra_files ({name: bytes}, e.g. the observation normalizer) are added next to them
+    serialized_data, params, pytorch_variables = snapshot
+    compression = zipfile.ZIP_DEFLATED if compress else zipfile.ZIP_STORED
+    with zipfile.ZipFile(path, mode="w", compression=compression) as archive:
+        archive.writestr("data", serialized_data)
+        with archive.open("pytorch_variables.pth", mode="w", force_zip64=True) as param_file:
+            torch.save(pytorch_variables, param_file)
+        for file_name, dict_ in params.items():
+            with archive.open(file_name + ".pth", mode="w", force_zip64=True) as param_file:
+                torch.save(dict_, param_file)
+        archive.writestr("_stable_baselines3_version", stable_baselines3.__version__)
+        archive.writestr("system_info.txt", system_info or get_system_info(print_info=False)[1])
+        for file_name, data in (extra_files or {}).items():
+            archive.writestr(file_name, data)
+
+
+def replace(source, destination, attempts=20, delay=0.05):
+    # os.replace is atomic, but on Windows it fails while another process has the destination open
+    for attempt in range(attempts):
+        try:
+            os.replace(source, destination)
+            return
+        except PermissionError:
+            if attempt == attempts - 1:
+                raise
+            time.sleep(delay)
+
+
+class CheckpointWriter:
+    # MLPlay hands every update's model over with save(); the state dicts are copied to CPU right away and a
+    # background thread writes ppo_model_<update>.zip to save_dir, then publishes it to model_path.
+    # Both files appear through os.replace, so a reader sees either the previous zip or the new one, never half of one.
+    # Retention (applied to save_dir after each write, None/0 disables a rule):
+    #   keep_last   the newest K checkpoints; None keeps every checkpoint
+    #   keep_best   the K with the highest score (MLPlay passes the rollout's mean reward)
+    #   keep_every  every Nth update
+    def __init__(self, model_path, save_dir, compress=True, keep_last=None, keep_best=0, keep_every=0):
+        self.model_path = model_path
+        self.save_dir = save_dir
+        self.compress = compress
+        self.keep_last = keep_last
+        self.keep_best = keep_best or 0
+        self.keep_every = keep_every or 0
+        self.checkpoints = []
+        self.system_info = None
+
+        self.queue = queue.Queue()
+        self.thread = threading.Thread(target=self._run, name="CheckpointWriter", daemon=True)
+        self.thread.start()
+        # Pending checkpoints are still written when the interpreter exits
+        atexit.register(self.close)
+
+    def save(self, model, update, score=None, extra_files=None):
+        # A rollout without rewards has a NaN mean; such checkpoints are never the best
+        score = float(score) if score is not None and math.isfinite(score) else None
+        self.queue.put((update, score, snapshot_model(model), extra_files))
+
+    def wait(self):
+        self.queue.join()
+
+    def close(self):
+        if self.thread.is_alive():
+            self.queue.put(None)
+            self.thread.join()
+
+    def _run(self):
+        while True:
+            job = self.queue.get()
+            try:
+                if job is None:
+                    break
+                self._write(*job)
+            except Exception as e:
+                print(f"Error writing checkpoint {job[0]}: {e}")
+            finally:
+                self.queue.task_done()
+
+    def _write(self, update, score, snapshot, extra_files=None):
+        start = time.perf_counter()
+        if self.system_info is None:
+            self.system_info = get_system_info(print_info=False)[1]
+
+        update_path = os.path.join(self.save_dir, f"ppo_model_{update}.zip")
+        write_model_zip(update_path + ".tmp", snapshot, self.compress, self.system_info, extra_files)
+        replace(update_path + ".tmp", update_path)
+
+        model_dir = os.path.dirname(os.path.abspath(self.model_path))
+        os.makedirs(model_dir, exist_ok=True)
+        # A copy, not a hard link: whatever later writes model_path in place (behaviorCloning.py, a zip copied
+        # over it to trigger a hot reload) must not rewrite the retained checkpoint with it
+        publish_path = self.model_path + ".tmp"
+        shutil.copyfile(update_path, publish_path)
+        replace(publish_path, self.model_path)
+
+        self.checkpoints.append({"update": update, "path": update_path, "score": score})
+        self._apply_retention()
+        print(f"Model saved to {update_path} and published to {self.model_path} "
+              f"({(time.perf_counter() - start) * 1000:.0f} ms in the background)")
+
+    def _apply_retention(self):
+        if self.keep_last is None:
+            kept = self.checkpoints
+        else:
+            keep = set(range(max(len(self.checkpoints) - self.keep_last, 0), len(self.checkpoints)))
+            scored = [i for i, checkpoint in enumerate(self.checkpoints) if checkpoint["score"] is not None]
+            scored.sort(key=lambda i: self.checkpoints[i]["score"], reverse=True)
+            keep.update(scored[:self.keep_best])
+            if self.keep_every > 0:
+                keep.update(i for i, checkpoint in enumerate(self.checkpoints) if checkpoint["update"] % self.keep_every == 0)
+
+            kept = []
+            for i, checkpoint in enumerate(self.checkpoints):
+                if i in keep:
+                    kept.append(checkpoint)
+                else:
+                    try:
+                        os.remove(checkpoint["path"])
+                    except OSError as e:
+                        print(f"Could not remove old checkpoint {checkpoint['path']}: {e}")
+            self.checkpoints = kept
+
+        with open(os.path.join(self.save_dir, CHECKPOINT_INDEX + ".tmp"), "w") as f:
+            json.dump(kept, f, indent=2)
+        replace(os.path.join(self.save_dir, CHECKPOINT_INDEX + ".tmp"), os.path.join(self.save_dir, CHECKPOINT_INDEX))
+
+
+def create_checkpoint_writer(checkpoint_config, model_path, save_dir):
+    checkpoint_config = checkpoint_config or {}
+    return CheckpointWriter(
+        model_path,
+        save_dir,
+        compress=checkpoint_config.get("compress", True),
+        keep_last=checkpoint_config.get("keep_last"),
+        keep_best=checkpoint_config.get("keep_best", 0),
+        keep_every=checkpoint_config.get("keep_every", 0)
+    )
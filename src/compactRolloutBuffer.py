@@ -0,0 +1,193 @@
+import numpy as np
+from gymnasium import spaces
+from stable_baselines3.common.buffers import RolloutBuffer
+from stable_baselines3.common.type_aliases import RolloutBufferSamples
+
+OBSERVATION_DTYPES = {"float32": np.float32, "float16": np.float16, "uint8": np.uint8}
+
+
+class CompactRolloutBuffer(RolloutBuffer):
+    # RolloutBuffer with observations kept as float16 or uint8 and discrete actions as int8/int16, widened to
+    # float32 one minibatch at a time in _get_samples. The arrays are allocated once and reused by every
+    # rollout, and get() indexes them in place instead of swapping and flattening copies of them.
+    #   float16  about 3 significant digits, |x| up to 65504
+    #   uint8    per-feature affine codes over the range seen so far, error up to (high - low) / 510 per feature.
+    #            An observation outside the range widens it (with headroom) and requantizes that feature's codes.
+    def __init__(self, buffer_size, observation_space, action_space, device="auto", gae_lambda=1, gamma=0.99,
+                 n_envs=1, observation_dtype="float16", range_headroom=0.25):
+        if observation_dtype not in OBSERVATION_DTYPES:
+            raise ValueError(f"Unsupported rollout observation dtype: {observation_dtype}")
+        self.observation_dtype = OBSERVATION_DTYPES[observation_dtype]
+        self.range_headroom = range_headroom
+        self.low = None
+        self.high = None
+        self.scale = None
+        self.inverse_scale = None
+        self.requantizations = 0
+        # Rows written since the last reset; only those are requantized when the range widens
+        self.rows = 0
+        super().__init__(buffer_size, observation_space, action_space, device=device, gae_lambda=gae_lambda,
+                         gamma=gamma, n_envs=n_envs)
+
+    @property
+    def quantized(self):
+        return self.observation_dtype is np.uint8
+
+    def action_dtype(self):
+        if isinstance(self.action_space, spaces.Discrete):
+            largest = self.action_space.n
+        elif isinstance(self.action_space, spaces.MultiDiscrete):
+            largest = int(np.max(self.action_space.nvec))
+        else:
+            return self.action_space.dtype
+        return np.int8 if largest <= np.iinfo(np.int8).max else np.int16
+
+    def reset(self):
+        # Every entry is written again before the buffer is full, so a reset only rewinds it
+        if getattr(self, "observations", None) is None:
+            shape = (self.buffer_size, self.n_envs)
+            self.observations = np.zeros((*shape, *self.obs_shape), dtype=self.observation_dtype)
+            self.actions = np.zeros((*shape, self.action_dim), dtype=self.action_dtype())
+            self.rewards = np.zeros(shape, dtype=np.float32)
+            self.returns = np.zeros(shape, dtype=np.float32)
+            self.episode_starts = np.zeros(shape, dtype=np.float32)
+            self.values = np.zeros(shape, dtype=np.float32)
+            self.log_probs = np.zeros(shape, dtype=np.float32)
+            self.advantages = np.zeros(shape, dtype=np.float32)
+        self.generator_ready = False
+        self.pos = 0
+        self.full = False
+        self.rows = 0
+
+    def store_observation(self, pos, env, obs):
+        if not self.quantized:
+            self.observations[pos, env] = obs
+            return
+        if self.low is None or (obs < self.low).any() or (obs > self.high).any():
+            self._widen_range(obs)
+        self.observations[pos, env] = np.rint((obs - self.low) * self.inverse_scale)
+        self.rows = max(self.rows, pos + 1)
+
+    def add(self, obs, action, reward, episode_start, value, log_prob):
+        if not self.quantized:
+            super().add(obs, action, reward, episode_start, value, log_prob)
+            return
+        # RolloutBuffer.add would cast raw floats straight to uint8
+        pos = self.pos
+        obs = np.asarray(obs, dtype=np.float32).reshape((self.n_envs, *self.obs_shape))
+        super().add(obs, action, reward, episode_start, value, log_prob)
+        for env in range(self.n_envs):
+            self.store_observation(pos, env, obs[env])
+
+    def widen_observations(self, observations):
+        if self.quantized:
+            return observations.astype(np.float32) * self.scale + self.low
+        return observations.astype(np.float32)
+
+    def get(self, batch_size=None):
+        assert self.full, ""
+        # Same permutation and minibatches as RolloutBuffer.get
+        indices = np.random.permutation(self.buffer_size * self.n_envs)
+        if batch_size is None:
+            batch_size = self.buffer_size * self.n_envs
+        for start in range(0, len(indices), batch_size):
+            yield self._get_samples(indices[start:start + batch_size])
+
+    def _get_samples(self, batch_inds, env=None):
+        # Flat index i is step i % buffer_size of env i // buffer_size, the order swap_and_flatten produces
+        steps = batch_inds % self.buffer_size
+        envs = batch_inds // self.buffer_size
+        data = (
+            self.widen_observations(self.observations[steps, envs]),
+            self.actions[steps, envs].astype(np.float32),
+            self.values[steps, envs],
+            self.log_probs[steps, envs],
+            self.advantages[steps, envs],
+            self.returns[steps, envs]
+        )
+        return RolloutBufferSamples(*tuple(map(self.to_torch, data)))
+
+    def float32_nbytes(self):
+        # What RolloutBuffer keeps for the same rollout
+        entries = self.buffer_size * self.n_envs
+        return 4 * entries * (int(np.prod(self.obs_shape)) + self.action_dim + 6)
+
+    def _widen_range(self, obs):
+        obs = np.asarray(obs, dtype=np.float32)
+        if self.low is None:
+            self.low = obs.copy()
+            self.high = obs.copy()
+            self._update_scale()
+            return
+        below = obs < self.low
+        above = obs > self.high
+        old_low = self.low.copy()
+        old_scale = self.scale.copy()
+        low = np.minimum(self.low, obs)
+        high = np.maximum(self.high, obs)
+        # Headroom keeps a slowly drifting feature from requantizing on every step
+        headroom = (high - low) * self.range_headroom
+        self.low = np.where(below, low - headroom, self.low).astype(np.float32)
+        self.high = np.where(above, high + headroom, self.high).astype(np.float32)
+        self._update_scale()
+        features = np.flatnonzero(below | above)
+        old_low, old_scale = old_low[features], old_scale[features]
+        low, inverse_scale = self.low[features], self.inverse_scale[features]
+        # A chunk of rows at a time, so requantizing a long rollout needs no float32 copy of it
+        for start in range(0, self.rows, 1024):
+            rows = self.observations[start:min(start + 1024, self.rows)]
+            values = rows[..., features].astype(np.float32) * old_scale + old_low
+            rows[..., features] = np.rint((values - low) * inverse_scale)
+        self.requantizations += 1
+
+    def _update_scale(self):
+        span = np.maximum(self.high - self.low, np.float32(1e-6))
+        self.scale = (span / 255.0).astype(np.float32)
+        self.inverse_scale = (255.0 / span).astype(np.float32)
+
+
+def store_observation(rollout_buffer, pos, env, obs):
+    # Writes one observation into either kind of rollout buffer
+    if isinstance(rollout_buffer, CompactRolloutBuffer):
+        rollout_buffer.store_observation(pos, env, obs)
+    else:
+        rollout_buffer.observations[pos, env] = obs
+
+
+def create_rollout_buffer(compact_config, model):
+    compact_config = compact_config or {}
+    if not compact_config.get("enabled", False):
+        return RolloutBuffer(
+            model.n_steps,
+            model.observation_space,
+            model.action_space,
+            device=model.device,
+            gamma=model.gamma,
+            gae_lambda=model.gae_lambda,
+            n_envs=model.n_envs
+        )
+    return CompactRolloutBuffer(
+        model.n_steps,
+        model.observation_space,
+        model.action_space,
+        device=model.device,
+        gamma=model.gamma,
+        gae_lambda=model.gae_lambda,
+        n_envs=model.n_envs,
+        observation_dtype=compact_config.get("observations", "float16"),
+        range_headroom=compact_config.get("range_headroom", 0.25)
+    )
+
+
+def rollout_buffer_nbytes(rollout_buffer):
+    return sum(array.nbytes for array in (
+        rollout_buffer.observations, rollout_buffer.actions, rollout_buffer.rewards, rollout_buffer.returns,
+        rollout_buffer.episode_starts, rollout_buffer.values, rollout_buffer.log_probs, rollout_buffer.advantages))
+
+
+def describe_rollout_buffer(rollout_buffer):
+    description = (f"Rollout buffer: {rollout_buffer_nbytes(rollout_buffer) / 2 ** 20:.2f} MB, "
+                   f"{rollout_buffer.observations.dtype.name} observations and {rollout_buffer.actions.dtype.name} actions")
+    if isinstance(rollout_buffer, CompactRolloutBuffer):
+        description += f" (float32 would take {rollout_buffer.float32_nbytes() / 2 ** 20:.2f} MB)"
+    return description
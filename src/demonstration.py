@@ -0,0 +1,93 @@
+import os
+import numpy as np
+from RLPlay import RLPlay
+from utils import get_config, ActionSpaceSpec
+from envWrapper import EnvWrapper
+from trajectoryRecorder import TrajectoryRecorder
+from RlplayRewardCalculator import RlplayRewardCalculator
+
+# key -> [continuous index, value] or [discrete branch, value]; key names are compared case-insensitively
+DEFAULT_KEY_MAP = {
+    "continuous": {
+        "W": [1, 1.0], "S": [1, -1.0], "A": [0, -1.0], "D": [0, 1.0],
+        "UpArrow": [1, 1.0], "DownArrow": [1, -1.0], "LeftArrow": [0, -1.0], "RightArrow": [0, 1.0]
+    },
+    "discrete": {
+        "Space": [0, 1]
+    }
+}
+
+
+class MLPlay:
+    # Lets a human drive with the keyboard and records the (observation, action) pairs for behaviorCloning.py
+    def __init__(self, observation_structure, action_space_info, name, *args, **kwargs):
+        config = kwargs.get("config") or get_config()
+        demonstration_config = config.get("demonstration", {})
+        self.name = name or "MLPlay"
+        self.env_wrapper = EnvWrapper(observation_structure, action_space_info)
+        self.action_space_info = action_space_info
+
+        key_map = demonstration_config.get("key_map") or DEFAULT_KEY_MAP
+        self.continuous_keys = {key.lower(): (int(index), float(value)) for key, (index, value) in key_map.get("continuous", {}).items()}
+        self.discrete_keys = {key.lower(): (int(branch), int(value)) for key, (branch, value) in key_map.get("discrete", {}).items()}
+        self.discrete_default = np.asarray(
+            key_map.get("discrete_default") or [0] * len(action_space_info.discrete_branches), dtype=np.int32
+        )
+
+        self.rlplayRewardCalculator = RlplayRewardCalculator(self.env_wrapper.observation_processor)
+        self.RLPlay = RLPlay(self.rlplayRewardCalculator, config.get("reward"))
+        self.episode_rewards = []
+        self.episode_count = 1
+
+        path = demonstration_config.get("dir") or os.path.join(config["model"]["dir"], "demonstrations")
+        self.recorder = TrajectoryRecorder(
+            path,
+            observation_structure,
+            self.env_wrapper.observation_space.shape[0],
+            self.env_wrapper.action_space,
+            chunk_steps=demonstration_config.get("chunk_steps", 100000),
+            metadata={
+                "action_space_info": ActionSpaceSpec.from_action_space_info(action_space_info).to_dict(),
+                "reward_weights": self.RLPlay.weights
+            }
+        )
+        print(f"Recording demonstrations to {path}")
+
+    def reset(self):
+        if self.episode_rewards:
+            print(f"Demonstration {self.episode_count}: Total Reward = {sum(self.episode_rewards):.2f}, Steps = {len(self.episode_rewards)}")
+        self.episode_rewards = []
+        self.episode_count += 1
+        self.recorder.end_episode()
+        self.rlplayRewardCalculator.reset()
+        self.RLPlay.reset()
+
+    def update(self, observations, done, info, keyboard=set(), *args, **kwargs):
+        self.rlplayRewardCalculator.update(observations)
+        reward, _ = self.RLPlay.update()
+        self.episode_rewards.append(reward)
+
+        env_action = self._keyboard_to_action(keyboard)
+        network_output = self.env_wrapper.action_processor.action_to_network_output(env_action)
+        self.recorder.record(observations, network_output, reward, done)
+        return env_action
+
+    def _keyboard_to_action(self, keyboard):
+        continuous = np.zeros(self.action_space_info.continuous_size, dtype=np.float32)
+        discrete = self.discrete_default.copy()
+        for key in keyboard:
+            key = key.lower()
+            if key in self.continuous_keys:
+                index, value = self.continuous_keys[key]
+                continuous[index] += value
+            if key in self.discrete_keys:
+                branch, value = self.discrete_keys[key]
+                discrete[branch] = value
+        np.clip(continuous, -1.0, 1.0, out=continuous)
+
+        action_type = self.env_wrapper.action_processor.action_type
+        if action_type == "continuous":
+            return continuous
+        elif action_type == "discrete":
+            return discrete
+        return (continuous, discrete)
@@ -0,0 +1,414 @@
+import os
+import time
+import queue
+import argparse
+import multiprocessing as mp
+from collections import deque
+from multiprocessing import shared_memory
+import numpy as np
+from RLPlay import RLPlay
+from envWrapper import EnvWrapper
+from RlplayRewardCalculator import RlplayRewardCalculator
+from observationNormalizer import ObservationNormalizer, create_observation_normalizer, NORMALIZER_ENTRY
+from utils import get_config, ActionSpaceSpec
+
+
+class SharedParameters:
+    # Flat float32 copy of the policy weights in shared memory, guarded by a sequence counter:
+    # the counter is odd while the learner is writing, so actors can detect and skip torn reads.
+    # With observation normalization the normalizer's float32 mean and scale follow the weights,
+    # so every policy version is published together with the statistics it was trained on.
+    def __init__(self, size, name=None):
+        self.size = size
+        self.shm = shared_memory.SharedMemory(name=name, create=name is None, size=8 + 4 * size)
+        self.sequence = np.ndarray((1,), dtype=np.int64, buffer=self.shm.buf, offset=0)
+        self.values = np.ndarray((size,), dtype=np.float32, buffer=self.shm.buf, offset=8)
+        if name is None:
+            self.sequence[0] = 0
+
+    @property
+    def name(self):
+        return self.shm.name
+
+    def publish(self, policy, normalizer=None):
+        import torch
+        with torch.no_grad():
+            vector = torch.nn.utils.parameters_to_vector(policy.parameters()).cpu().numpy()
+        self.sequence[0] += 1
+        self.values[:len(vector)] = vector
+        if normalizer is not None:
+            self.values[len(vector):] = np.concatenate([normalizer._mean, normalizer._scale])
+        self.sequence[0] += 1
+        return int(self.sequence[0]) // 2
+
+    def pull(self, policy, known_version, normalizer=None):
+        import torch
+        sequence = int(self.sequence[0])
+        if sequence % 2 == 1 or sequence // 2 == known_version:
+            return known_version
+        vector = self.values.copy()
+        if int(self.sequence[0]) != sequence:
+            return known_version
+        if normalizer is not None:
+            split = [len(vector) - 2 * normalizer.size, len(vector) - normalizer.size]
+            vector, normalizer._mean, normalizer._scale = np.split(vector, split)
+        with torch.no_grad():
+            torch.nn.utils.vector_to_parameters(torch.from_numpy(vector), policy.parameters())
+        return sequence // 2
+
+    def close(self, unlink=False):
+        self.sequence = None
+        self.values = None
+        self.shm.close()
+        if unlink:
+            self.shm.unlink()
+
+
+class ActorPlay:
+    def __init__(self, observation_structure, action_space_info, actor_id, policy, parameters, transition_queue, chunk_steps,
+                 reward_weights=None, normalizer_clip=None):
+        import torch
+        from stable_baselines3.common.preprocessing import get_action_dim
+        self.torch = torch
+        self.name = f"Actor{actor_id}"
+        self.actor_id = actor_id
+        self.env_wrapper = EnvWrapper(observation_structure, action_space_info)
+        self.rlplayRewardCalculator = RlplayRewardCalculator(self.env_wrapper.observation_processor)
+        self.rlplayRewardCalculator.reset()
+        self.RLPlay = RLPlay(self.rlplayRewardCalculator, reward_weights)
+        self.policy = policy
+        self.parameters = parameters
+        obs_size = self.env_wrapper.observation_space.shape[0]
+        # The learner owns the statistics; this copy only normalizes with the ones published with the weights
+        if normalizer_clip is not None:
+            self.env_wrapper.observation_normalizer = ObservationNormalizer(obs_size, clip=normalizer_clip, update_every=1)
+        self.version = parameters.pull(policy, -1, self.env_wrapper.observation_normalizer)
+        self.transition_queue = transition_queue
+
+        action_dim = get_action_dim(self.env_wrapper.action_space)
+        self.chunk_steps = chunk_steps
+        self.chunk = {
+            "observations": np.zeros((chunk_steps, obs_size), dtype=np.float32),
+            "actions": np.zeros((chunk_steps, action_dim), dtype=np.float32),
+            "rewards": np.zeros(chunk_steps, dtype=np.float32),
+            "episode_starts": np.zeros(chunk_steps, dtype=np.float32),
+            "values": np.zeros(chunk_steps, dtype=np.float32),
+            "log_probs": np.zeros(chunk_steps, dtype=np.float32)
+        }
+        if normalizer_clip is not None:
+            # The learner updates its statistics from the raw observations
+            self.chunk["raw_observations"] = np.zeros((chunk_steps, obs_size), dtype=np.float32)
+        self.chunk_version = self.version
+        self.pos = 0
+        self.dropped_chunks = 0
+
+        self.prev_observation = None
+        self.prev_raw_observation = None
+        self.prev_action = None
+        self.prev_log_prob = None
+        self.prev_value = None
+        self.episode_reward = 0.0
+        self.episode_steps = 0
+
+    def reset(self):
+        if self.episode_steps:
+            self._send(("episode", self.actor_id, self.episode_reward, self.episode_steps, self.dropped_chunks))
+        self.episode_reward = 0.0
+        self.episode_steps = 0
+        self.prev_observation = None
+        self.prev_action = None
+        self.prev_log_prob = None
+        self.prev_value = None
+        self.rlplayRewardCalculator.reset()
+        self.RLPlay.reset()
+
+    def update(self, observations, done, info, keyboard=set(), *args, **kwargs):
+        self.version = self.parameters.pull(self.policy, self.version, self.env_wrapper.observation_normalizer)
+        self.rlplayRewardCalculator.update(observations)
+        raw_observation = observations["flattened"]
+        observation = self.env_wrapper.normalize_observation(raw_observation)
+
+        reward, not_used_for_training = self.RLPlay.update()
+        action, log_prob, value = self._predict_with_info(observation)
+
+        if self.prev_observation is not None:
+            self.episode_reward += reward
+            self.episode_steps += 1
+            if not not_used_for_training:
+                self._store_transition(reward, done, value)
+
+        self.prev_observation = observation
+        self.prev_raw_observation = raw_observation
+        self.prev_action = action
+        self.prev_log_prob = log_prob
+        self.prev_value = value
+        return self.env_wrapper.action_processor.create_action(action)
+
+    def _store_transition(self, reward, done, next_value):
+        if self.pos == 0:
+            self.chunk_version = self.version
+        self.chunk["observations"][self.pos] = self.prev_observation
+        if "raw_observations" in self.chunk:
+            self.chunk["raw_observations"][self.pos] = self.prev_raw_observation
+        self.chunk["actions"][self.pos] = self.prev_action
+        self.chunk["rewards"][self.pos] = reward
+        self.chunk["episode_starts"][self.pos] = done
+        self.chunk["values"][self.pos] = self.prev_value[0]
+        self.chunk["log_probs"][self.pos] = self.prev_log_prob[0]
+        self.pos += 1
+
+        if self.pos == self.chunk_steps:
+            chunk = {key: value.copy() for key, value in self.chunk.items()}
+            chunk["last_value"] = float(next_value[0])
+            chunk["last_done"] = float(done)
+            chunk["version"] = self.chunk_version
+            if not self._send(("rollout", self.actor_id, chunk)):
+                self.dropped_chunks += 1
+            self.pos = 0
+
+    def _send(self, message):
+        # update() must never wait for a learner that is still training: past mlplay_timeout the game steps
+        # on with actions that are not in the chunk. A full queue drops the message; a dropped rollout would
+        # have been too old by the time the learner got to it anyway.
+        try:
+            self.transition_queue.put_nowait(message)
+            return True
+        except queue.Full:
+            return False
+
+    def _predict_with_info(self, obs):
+        obs_tensor = self.torch.as_tensor(obs).unsqueeze(0)
+        with self.torch.no_grad():
+            action, value, log_prob = self.policy(obs_tensor)
+        return action.cpu().numpy().flatten(), log_prob.cpu().numpy().flatten(), value.cpu().numpy().flatten()
+
+
+class Learner:
+    def __init__(self, config, observation_structure, action_space_info, num_actors, chunk_steps, max_policy_lag=None):
+        import torch
+        from stable_baselines3 import PPO
+        from stable_baselines3.common.buffers import RolloutBuffer
+        from checkpointWriter import create_checkpoint_writer
+        self.torch = torch
+        self.env_wrapper = EnvWrapper(observation_structure, action_space_info)
+        self.params = dict(config["model"]["params"])
+        self.params["policy_kwargs"] = dict(self.params["policy_kwargs"], activation_fn=torch.nn.Tanh)
+        self.num_actors = num_actors
+        self.max_policy_lag = max_policy_lag
+        self.dropped_chunks = 0
+        self.update_count = 0
+        self.start_time = time.strftime("%Y%m%d_%H%M%S")
+        self.model_save_dir = config["model"]["dir"] + '/' + self.start_time
+        self.model_path = config["model"]["path"]
+        os.makedirs(self.model_save_dir, exist_ok=True)
+        self.checkpoint_writer = create_checkpoint_writer(config.get("checkpoint"), self.model_path, self.model_save_dir)
+
+        loaded_path = None
+        if os.path.exists(self.model_path):
+            self.model = PPO.load(self.model_path, env=self.env_wrapper, **self.params, verbose=1)
+            loaded_path = self.model_path
+            print(f"Model loaded from {self.model_path}")
+        else:
+            print(f"No pre-trained model found at {self.model_path}. Creating new model...")
+            self.model = PPO("MlpPolicy", env=self.env_wrapper, **self.params, verbose=1)
+        obs_size = self.env_wrapper.observation_space.shape[0]
+        self.normalizer = create_observation_normalizer(config["model"].get("observation_normalization"), obs_size, loaded_path)
+        if self.normalizer is not None and loaded_path is not None and self.normalizer.count == 0:
+            print(f"Warning: {loaded_path} was trained on raw observations, its policy now sees normalized ones")
+        # Resets the counters and configures the logger without running the callbacks and the empty training loop
+        self.model._setup_learn(total_timesteps=0, tb_log_name=f"PPO_distributed_{self.start_time}")
+        self.model.rollout_buffer = RolloutBuffer(
+            chunk_steps,
+            self.model.observation_space,
+            self.model.action_space,
+            device=self.model.device,
+            gamma=self.model.gamma,
+            gae_lambda=self.model.gae_lambda,
+            n_envs=num_actors
+        )
+
+        size = sum(parameter.numel() for parameter in self.model.policy.parameters())
+        if self.normalizer is not None:
+            size += 2 * obs_size
+        self.parameters = SharedParameters(size)
+        self.version = self.parameters.publish(self.model.policy, self.normalizer)
+        self.chunks = [deque() for _ in range(num_actors)]
+
+    @property
+    def normalizer_clip(self):
+        return self.normalizer.clip if self.normalizer is not None else None
+
+    def add_chunk(self, actor_id, chunk):
+        if self.normalizer is not None:
+            # Dropped rollouts still count towards the statistics
+            self.normalizer.update_batch(chunk["raw_observations"])
+        if self._stale(chunk):
+            self._drop(actor_id, chunk)
+            return
+        self.chunks[actor_id].append(chunk)
+        if all(self.chunks):
+            self._update_policy([chunks.popleft() for chunks in self.chunks])
+            # Chunks still waiting for a slower actor are one version older now
+            for actor_id, chunks in enumerate(self.chunks):
+                while chunks and self._stale(chunks[0]):
+                    self._drop(actor_id, chunks.popleft())
+
+    def _stale(self, chunk):
+        return self.max_policy_lag is not None and self.version - chunk["version"] > self.max_policy_lag
+
+    def _drop(self, actor_id, chunk):
+        self.dropped_chunks += 1
+        print(f"Dropped a rollout from actor {actor_id}: policy lag {self.version - chunk['version']} "
+              f"is over {self.max_policy_lag}")
+
+    def _update_policy(self, chunks):
+        from stable_baselines3.common.utils import safe_mean
+        rollout_buffer = self.model.rollout_buffer
+        rollout_buffer.reset()
+        for actor_id, chunk in enumerate(chunks):
+            rollout_buffer.observations[:, actor_id] = chunk["observations"]
+            rollout_buffer.actions[:, actor_id] = chunk["actions"]
+            rollout_buffer.rewards[:, actor_id] = chunk["rewards"]
+            rollout_buffer.episode_starts[:, actor_id] = chunk["episode_starts"]
+            rollout_buffer.values[:, actor_id] = chunk["values"]
+            rollout_buffer.log_probs[:, actor_id] = chunk["log_probs"]
+        rollout_buffer.pos = rollout_buffer.buffer_size
+        rollout_buffer.full = True
+        last_values = self.torch.as_tensor([chunk["last_value"] for chunk in chunks])
+        dones = np.array([chunk["last_done"] for chunk in chunks])
+        rollout_buffer.compute_returns_and_advantage(last_values=last_values, dones=dones)
+
+        policy_lag = [self.version - chunk["version"] for chunk in chunks]
+        experiences = rollout_buffer.buffer_size * rollout_buffer.n_envs
+        print(f"Updating PPO policy with {experiences} experiences from {self.num_actors} actors "
+              f"(policy lag {min(policy_lag)}-{max(policy_lag)})...")
+
+        self.model.num_timesteps += experiences
+        self.model.train()
+        self.update_count += 1
+
+        mean_reward = safe_mean(rollout_buffer.rewards)
+        self.model.logger.record("train/mean_reward", mean_reward)
+        self.model.logger.record("distributed/actors", self.num_actors)
+        self.model.logger.record("distributed/mean_policy_lag", float(np.mean(policy_lag)))
+        self.model.logger.record("distributed/dropped_chunks", self.dropped_chunks)
+        self.model._dump_logs(self.update_count)
+
+        self.version = self.parameters.publish(self.model.policy, self.normalizer)
+        rollout_buffer.reset()
+        print(f"PPO policy updated successfully, published weights version {self.version}")
+
+        extra_files = {NORMALIZER_ENTRY: self.normalizer.to_bytes()} if self.normalizer is not None else None
+        self.checkpoint_writer.save(self.model, self.update_count, score=mean_reward, extra_files=extra_files)
+
+    def close(self):
+        self.checkpoint_writer.close()
+        self.parameters.close(unlink=True)
+
+
+def run_actor(actor_id, connection, transition_queue, options):
+    config = get_config()
+    worker_id = options["base_worker_id"] + actor_id
+    if options["stand_in"]:
+        from standInGame import StandInEnvironment, StandInRunner
+        env = StandInEnvironment(worker_id=worker_id, game_parameters=config["game_parameters"])
+        runner_class = StandInRunner
+    else:
+        from main import create_env
+        from mlgame3d.game_runner import GameRunner
+        env = create_env(config["game_path"], config["game_parameters"], worker_id=worker_id,
+                         no_graphics=True, time_scale=options["time_scale"])
+        runner_class = GameRunner
+
+    try:
+        behavior_name = env.behavior_names[0]
+        observation_structure = env.get_observation_structure(behavior_name)
+        action_space_info = ActionSpaceSpec.from_action_space_info(env.get_action_space_info(behavior_name))
+        connection.send(("hello", observation_structure, action_space_info.to_dict()))
+        _, parameters_name, parameters_size, normalizer_clip = connection.recv()
+
+        import torch
+        from stable_baselines3.common.policies import ActorCriticPolicy
+        policy_kwargs = dict(config["model"]["params"]["policy_kwargs"], activation_fn=torch.nn.Tanh)
+        env_wrapper = EnvWrapper(observation_structure, action_space_info)
+        policy = ActorCriticPolicy(env_wrapper.observation_space, env_wrapper.action_space, lambda _: 0.0, **policy_kwargs)
+        policy.set_training_mode(False)
+        parameters = SharedParameters(parameters_size, name=parameters_name)
+
+        actor = ActorPlay(observation_structure, action_space_info, actor_id, policy, parameters,
+                          transition_queue, options["chunk_steps"], config.get("reward"), normalizer_clip)
+        runner = runner_class(
+            env=env,
+            mlplays=[actor],
+            max_episodes=options["max_episodes"],
+            render=False,
+            mlplay_timeout=0.1,
+            game_parameters=config["game_parameters"],
+            mlplay_to_behavior_map={0: behavior_name}
+        )
+        runner.run()
+        parameters.close()
+    finally:
+        env.close()
+        transition_queue.put(("done", actor_id))
+
+
+def run_learner(num_actors, options):
+    config = get_config()
+    distributed_config = config.get("distributed", {})
+    options["chunk_steps"] = max(1, config["model"]["params"]["n_steps"] // num_actors)
+    context = mp.get_context("spawn")
+    # Bounded, so actors drop rollouts while the learner is busy training instead of piling up stale ones
+    transition_queue = context.Queue(maxsize=num_actors * distributed_config.get("queue_size_per_actor", 4))
+    connections = []
+    processes = []
+    for actor_id in range(num_actors):
+        parent_connection, child_connection = context.Pipe()
+        process = context.Process(target=run_actor, args=(actor_id, child_connection, transition_queue, options), daemon=True)
+        process.start()
+        connections.append(parent_connection)
+        processes.append(process)
+
+    learner = None
+    try:
+        for connection in connections:
+            _, observation_structure, action_space_info = connection.recv()
+            if learner is None:
+                learner = Learner(config, observation_structure, ActionSpaceSpec.from_dict(action_space_info),
+                                  num_actors, options["chunk_steps"], distributed_config.get("max_policy_lag", 2))
+            connection.send(("parameters", learner.parameters.name, learner.parameters.size, learner.normalizer_clip))
+        print(f"Distributed training started with {num_actors} actors, {options['chunk_steps']} steps per actor rollout")
+
+        running = num_actors
+        while running > 0:
+            message = transition_queue.get()
+            if message[0] == "rollout":
+                learner.add_chunk(message[1], message[2])
+            elif message[0] == "episode":
+                print(f"Actor {message[1]}: Total Reward = {message[2]:.2f}, Steps = {message[3]}, "
+                      f"Rollouts Dropped on a Full Queue = {message[4]}")
+            elif message[0] == "done":
+                running -= 1
+    finally:
+        for process in processes:
+            process.join(timeout=5)
+            if process.is_alive():
+                process.terminate()
+        if learner is not None:
+            learner.close()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Train one PPO learner from several headless Proly actors")
+    parser.add_argument("--actors", type=int, default=max(1, (os.cpu_count() or 2) - 1))
+    parser.add_argument("--max-episodes", type=int, default=3000)
+    parser.add_argument("--time-scale", type=float, default=1.0)
+    parser.add_argument("--base-worker-id", type=int, default=1)
+    parser.add_argument("--stand-in", action="store_true", help="Use the synthetic stand-in game instead of Proly")
+    args = parser.parse_args()
+    run_learner(args.actors, {
+        "max_episodes": args.max_episodes,
+        "time_scale": args.time_scale,
+        "base_worker_id": args.base_worker_id,
+        "stand_in": args.stand_in
+    })
@@ -17,6 +17,13 @@ class EnvWrapper(gym.Env):
         )
         self.action_space = self.action_processor.get_gym_action_space()
         self.step_count = 0
+        # An ObservationNormalizer when the policy is trained on normalized observations
+        self.observation_normalizer = None
+
+    def normalize_observation(self, observation):
+        if self.observation_normalizer is None:
+            return observation
+        return self.observation_normalizer.normalize(observation)
 
     def reset(self, seed=None, options=None):
         super().reset(seed=seed)
@@ -0,0 +1,210 @@
+import os
+import json
+import math
+import queue
+import atexit
+import argparse
+import threading
+import numpy as np
+from RLPlay import MUD_OBJECT_TYPE
+
+# One binary file per column, one value per finished episode
+COLUMNS = [["episode", "<i4"], ["return", "<f4"], ["length", "<i4"], ["checkpoints", "<i4"],
+           ["finished", "u1"], ["died", "u1"], ["mud_steps", "<i4"]]
+
+
+class RunningStats:
+    # Welford's online mean and variance, plus the extremes
+    def __init__(self):
+        self.count = 0
+        self.mean = 0.0
+        self.m2 = 0.0
+        self.min = math.inf
+        self.max = -math.inf
+
+    def add(self, value):
+        self.count += 1
+        delta = value - self.mean
+        self.mean += delta / self.count
+        self.m2 += delta * (value - self.mean)
+        self.min = min(self.min, value)
+        self.max = max(self.max, value)
+
+    @property
+    def std(self):
+        return math.sqrt(self.m2 / (self.count - 1)) if self.count > 1 else 0.0
+
+
+class RingBuffer:
+    # The last `size` values
+    def __init__(self, size):
+        self.values = np.zeros(size, dtype=np.float64)
+        self.count = 0
+
+    def add(self, value):
+        self.values[self.count % len(self.values)] = value
+        self.count += 1
+
+    def mean(self):
+        return float(self.values[:min(self.count, len(self.values))].mean()) if self.count else math.nan
+
+
+class EpisodeMetrics:
+    # Per-episode return, length, checkpoints reached, finish, death and steps spent in mud, kept with constant
+    # memory: running statistics over the whole run and ring buffers over the last `window` episodes.
+    # Finished episodes are handed to a background thread that adds them to TensorBoard (tensorboard_writer
+    # returns the writer, or None before there is one) and appends them to the column files under `path`.
+    def __init__(self, path=None, window=100, mud_threshold=2.0, tensorboard_writer=None, tag="episode"):
+        self.path = path
+        self.tag = tag
+        self.window = window
+        self.mud_threshold = mud_threshold
+        self.tensorboard_writer = tensorboard_writer
+        self.stats = {name: RunningStats() for name, _ in COLUMNS[1:]}
+        self.recent = {name: RingBuffer(window) for name, _ in COLUMNS[1:]}
+        self._reset_episode()
+
+        self.closed = False
+        self.files = None
+        if path is not None:
+            os.makedirs(path, exist_ok=True)
+            with open(os.path.join(path, "meta.json"), "w") as f:
+                json.dump({"columns": COLUMNS, "window": window, "mud_threshold": mud_threshold}, f, indent=4)
+            self.files = {name: open(os.path.join(path, f"{name}.bin"), "ab") for name, _ in COLUMNS}
+
+        self.queue = None
+        if self.files is not None or tensorboard_writer is not None:
+            self.queue = queue.Queue()
+            self.thread = threading.Thread(target=self._run, name="EpisodeMetrics", daemon=True)
+            self.thread.start()
+        atexit.register(self.close)
+
+    def step(self, reward, features):
+        self.episode_return += reward
+        self.episode_length += 1
+        mud = features["nearest"].get(MUD_OBJECT_TYPE)
+        if mud is not None and mud <= self.mud_threshold:
+            self.mud_steps += 1
+        # Kept per step: the game ends the episode without MLPlay seeing the observation that ended it
+        self.checkpoints = max(self.checkpoints, features["checkpoint"])
+        self.finished = self.finished or features["finished"]
+        self.died = self.died or features["health"] <= 0.0
+
+    def end_episode(self, episode):
+        # Returns the finished episode's row, or None if no step was counted
+        if self.episode_length == 0:
+            self._reset_episode()
+            return None
+        row = {
+            "episode": episode,
+            "return": self.episode_return,
+            "length": self.episode_length,
+            "checkpoints": self.checkpoints,
+            "finished": int(self.finished),
+            "died": int(self.died),
+            "mud_steps": self.mud_steps
+        }
+        for name, value in row.items():
+            if name in self.stats:
+                self.stats[name].add(value)
+                self.recent[name].add(value)
+        self._reset_episode()
+        if self.queue is not None:
+            self.queue.put((row, self.rolling()))
+        return row
+
+    def rolling(self):
+        # Means over the last `window` episodes
+        return {
+            "return_mean": self.recent["return"].mean(),
+            "length_mean": self.recent["length"].mean(),
+            "checkpoints_mean": self.recent["checkpoints"].mean(),
+            "finish_rate": self.recent["finished"].mean(),
+            "death_rate": self.recent["died"].mean(),
+            "mud_steps_mean": self.recent["mud_steps"].mean()
+        }
+
+    def summary(self):
+        return {name: {"mean": stats.mean, "std": stats.std, "min": stats.min, "max": stats.max}
+                for name, stats in self.stats.items() if stats.count}
+
+    def close(self):
+        if self.closed:
+            return
+        self.closed = True
+        if self.queue is not None and self.thread.is_alive():
+            self.queue.put(None)
+            self.thread.join()
+        if self.files is not None:
+            for f in self.files.values():
+                f.close()
+        if self.stats["return"].count:
+            label = "Episode metrics" if self.tag == "episode" else f"Episode metrics ({self.tag})"
+            print(f"{label} over {self.stats['return'].count} episodes: " + ", ".join(
+                f"{name} {stats['mean']:.2f} ± {stats['std']:.2f}" for name, stats in self.summary().items()))
+
+    def _reset_episode(self):
+        self.episode_return = 0.0
+        self.episode_length = 0
+        self.mud_steps = 0
+        self.checkpoints = 0
+        self.finished = False
+        self.died = False
+
+    def _run(self):
+        while True:
+            job = self.queue.get()
+            if job is None:
+                break
+            try:
+                self._write(*job)
+            except Exception as e:
+                print(f"Error writing episode metrics: {e}")
+
+    def _write(self, row, rolling):
+        if self.files is not None:
+            for name, dtype in COLUMNS:
+                self.files[name].write(np.asarray(row[name], dtype=dtype).tobytes())
+            for f in self.files.values():
+                f.flush()
+        writer = self.tensorboard_writer() if self.tensorboard_writer is not None else None
+        if writer is not None:
+            episode = row["episode"]
+            for name, value in row.items():
+                if name != "episode":
+                    writer.add_scalar(f"{self.tag}/{name}", value, episode)
+            for name, value in rolling.items():
+                writer.add_scalar(f"{self.tag}/{name}_last_{self.window}", value, episode)
+
+
+def load_episode_metrics(path):
+    # {column: array}, cut to the episodes every column file has completely
+    columns = {name: np.fromfile(os.path.join(path, f"{name}.bin"), dtype=dtype) for name, dtype in COLUMNS}
+    count = min(len(values) for values in columns.values())
+    return {name: values[:count] for name, values in columns.items()}
+
+
+def create_episode_metrics(metrics_config, default_path=None, mud_threshold=2.0, tensorboard_writer=None, tag="episode"):
+    metrics_config = metrics_config or {}
+    return EpisodeMetrics(
+        path=(metrics_config.get("dir") or default_path) if metrics_config.get("columnar", True) else None,
+        window=metrics_config.get("window", 100),
+        mud_threshold=mud_threshold,
+        tensorboard_writer=tensorboard_writer if metrics_config.get("tensorboard", True) else None,
+        tag=tag
+    )
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Summarize the episode metrics MLPlay wrote")
+    parser.add_argument("path")
+    parser.add_argument("--window", type=int, default=100)
+    args = parser.parse_args()
+    columns = load_episode_metrics(args.path)
+    count = len(columns["episode"])
+    print(f"{count} episodes")
+    if count:
+        for name, _ in COLUMNS[1:]:
+            values = columns[name].astype(np.float64)
+            print(f"  {name:<12} mean {values.mean():10.3f}  std {values.std():10.3f}  "
+                  f"last {min(args.window, count)} {values[-args.window:].mean():10.3f}")
@@ -0,0 +1,206 @@
+import math
+import time
+import numpy as np
+import torch
+import torch.nn.functional as F
+from gymnasium import spaces
+from stable_baselines3.common.distributions import (
+    DiagGaussianDistribution, CategoricalDistribution, MultiCategoricalDistribution
+)
+from stable_baselines3.common.utils import explained_variance
+from compactRolloutBuffer import CompactRolloutBuffer
+
+LOG_SQRT_2PI = math.log(math.sqrt(2 * math.pi))
+
+
+class FastPPOUpdate:
+    # PPO.train's clipped objective, value loss, entropy bonus, gradient clipping and target_kl early stop, specialized
+    # for MlpPolicy. The rollout is moved into flat tensors once per update; minibatches are index_select'ed from them in
+    # RolloutBuffer.get's order and with its np.random permutation. The Gaussian or categorical log-probabilities and
+    # entropies are computed directly instead of through distribution objects. Minibatch statistics stay on the
+    # device until the epoch ends, where PPO.train reads four of them back per minibatch.
+    #   batch_size  minibatch size for this path; None keeps the model's (the same update as PPO.train)
+    #   threads     torch intra-op threads for the whole process; None leaves torch's default
+    #   foreach     Adam's multi-tensor implementation, one kernel per step for all parameters
+    def __init__(self, model, batch_size=None, threads=None, foreach=True):
+        self.model = model
+        self.batch_size = batch_size or model.batch_size
+        policy = model.policy
+        self.kind = None
+        if not policy.use_sde and not policy.squash_output:
+            if isinstance(policy.action_dist, DiagGaussianDistribution):
+                self.kind = "gaussian"
+            elif isinstance(policy.action_dist, (CategoricalDistribution, MultiCategoricalDistribution)):
+                self.kind = "categorical"
+                self.branches = list(policy.action_dist.action_dims) if isinstance(
+                    policy.action_dist, MultiCategoricalDistribution) else [policy.action_dist.action_dim]
+        if threads:
+            torch.set_num_threads(threads)
+        if foreach:
+            for group in policy.optimizer.param_groups:
+                group["foreach"] = True
+        # policy.parameters() walks every module on each call
+        self.parameters = list(policy.parameters())
+        self.epoch_seconds = []
+
+    def train(self):
+        model = self.model
+        policy = model.policy
+        device = model.device
+        policy.set_training_mode(True)
+        model._update_learning_rate(policy.optimizer)
+        clip_range = model.clip_range(model._current_progress_remaining)
+        clip_range_vf = model.clip_range_vf(model._current_progress_remaining) if model.clip_range_vf is not None else None
+        rollout = self._rollout_tensors(model.rollout_buffer)
+        size = rollout["advantages"].shape[0]
+
+        # Sums over every minibatch of every epoch: policy gradient loss, value loss, entropy loss, clip fraction
+        totals = torch.zeros(4, device=device)
+        batches = 0
+        self.epoch_seconds = []
+        continue_training = True
+        for epoch in range(model.n_epochs):
+            start = time.perf_counter()
+            approx_kl_sum = torch.zeros((), device=device)
+            epoch_batches = 0
+            indices = torch.from_numpy(np.random.permutation(size)).to(device)
+            for batch_start in range(0, size, self.batch_size):
+                batch = indices[batch_start:batch_start + self.batch_size]
+                old_log_prob = rollout["log_probs"][batch]
+                values, log_prob, entropy = self._evaluate(self._observations(rollout, batch), rollout["actions"][batch])
+
+                advantages = rollout["advantages"][batch]
+                if model.normalize_advantage and len(advantages) > 1:
+                    advantages = (advantages - advantages.mean()) / (advantages.std() + 1e-8)
+                log_ratio = log_prob - old_log_prob
+                ratio = torch.exp(log_ratio)
+                policy_loss = -torch.min(advantages * ratio, advantages * torch.clamp(ratio, 1 - clip_range, 1 + clip_range)).mean()
+
+                if clip_range_vf is None:
+                    values_pred = values
+                else:
+                    old_values = rollout["values"][batch]
+                    values_pred = old_values + torch.clamp(values - old_values, -clip_range_vf, clip_range_vf)
+                value_loss = F.mse_loss(rollout["returns"][batch], values_pred)
+                entropy_loss = -torch.mean(-log_prob) if entropy is None else -torch.mean(entropy)
+                loss = policy_loss + model.ent_coef * entropy_loss + model.vf_coef * value_loss
+
+                with torch.no_grad():
+                    clip_fraction = torch.mean((torch.abs(ratio - 1) > clip_range).float())
+                    totals += torch.stack([policy_loss, value_loss, entropy_loss, clip_fraction])
+                    approx_kl = torch.mean((ratio - 1) - log_ratio)
+                    approx_kl_sum += approx_kl
+                batches += 1
+                epoch_batches += 1
+
+                if model.target_kl is not None and approx_kl.item() > 1.5 * model.target_kl:
+                    continue_training = False
+                    if model.verbose >= 1:
+                        print(f"Early stopping at step {epoch} due to reaching max kl: {approx_kl.item():.2f}")
+                    break
+
+                policy.optimizer.zero_grad()
+                loss.backward()
+                torch.nn.utils.clip_grad_norm_(self.parameters, model.max_grad_norm)
+                policy.optimizer.step()
+
+            model._n_updates += 1
+            approx_kl_mean = (approx_kl_sum / epoch_batches).item()
+            self.epoch_seconds.append(time.perf_counter() - start)
+            if not continue_training:
+                break
+
+        means = (totals / batches).tolist()
+        explained_var = explained_variance(model.rollout_buffer.values.flatten(), model.rollout_buffer.returns.flatten())
+        model.logger.record("train/entropy_loss", means[2])
+        model.logger.record("train/policy_gradient_loss", means[0])
+        model.logger.record("train/value_loss", means[1])
+        model.logger.record("train/approx_kl", approx_kl_mean)
+        model.logger.record("train/clip_fraction", means[3])
+        model.logger.record("train/loss", loss.item())
+        model.logger.record("train/explained_variance", explained_var)
+        if hasattr(policy, "log_std"):
+            model.logger.record("train/std", torch.exp(policy.log_std).mean().item())
+        model.logger.record("train/n_updates", model._n_updates, exclude="tensorboard")
+        model.logger.record("train/clip_range", clip_range)
+        if clip_range_vf is not None:
+            model.logger.record("train/clip_range_vf", clip_range_vf)
+        model.logger.record("train/update_seconds", sum(self.epoch_seconds))
+        print(f"PPO update: {len(self.epoch_seconds)} epochs of {math.ceil(size / self.batch_size)} minibatches "
+              f"({self.batch_size}) in {sum(self.epoch_seconds):.2f} s, per epoch "
+              + " ".join(f"{seconds * 1000:.0f}" for seconds in self.epoch_seconds) + " ms")
+
+    def _rollout_tensors(self, rollout_buffer):
+        # The rollout flattened in RolloutBuffer.get's order. On the CPU float32 arrays are shared rather than copied;
+        # compact observations stay compact and are widened per minibatch.
+        device = self.model.device
+
+        def flat(array):
+            return torch.as_tensor(np.ascontiguousarray(rollout_buffer.swap_and_flatten(array)), device=device)
+
+        rollout = {name: flat(getattr(rollout_buffer, name)).flatten()
+                   for name in ("values", "log_probs", "advantages", "returns")}
+        rollout["observations"] = flat(rollout_buffer.observations)
+        rollout["low"] = rollout["scale"] = None
+        if isinstance(rollout_buffer, CompactRolloutBuffer) and rollout_buffer.quantized:
+            rollout["low"] = torch.as_tensor(rollout_buffer.low, device=device)
+            rollout["scale"] = torch.as_tensor(rollout_buffer.scale, device=device)
+        actions = flat(rollout_buffer.actions)
+        if self.kind == "categorical":
+            rollout["actions"] = actions.long()
+        elif isinstance(self.model.action_space, spaces.Discrete):
+            rollout["actions"] = actions.long().flatten()
+        else:
+            rollout["actions"] = actions.float()
+        return rollout
+
+    def _observations(self, rollout, batch):
+        observations = rollout["observations"][batch]
+        if rollout["scale"] is not None:
+            return observations.float() * rollout["scale"] + rollout["low"]
+        return observations.float()
+
+    def _evaluate(self, obs, actions):
+        policy = self.model.policy
+        if self.kind is None:
+            values, log_prob, entropy = policy.evaluate_actions(obs, actions)
+            return values.flatten(), log_prob, entropy
+
+        features = policy.extract_features(obs)
+        if policy.share_features_extractor:
+            latent_pi, latent_vf = policy.mlp_extractor(features)
+        else:
+            pi_features, vf_features = features
+            latent_pi = policy.mlp_extractor.forward_actor(pi_features)
+            latent_vf = policy.mlp_extractor.forward_critic(vf_features)
+        values = policy.value_net(latent_vf).flatten()
+        params = policy.action_net(latent_pi)
+
+        if self.kind == "gaussian":
+            # torch.distributions.Normal's formulas, summed over the action dimensions
+            std = policy.log_std.exp()
+            log_scale = std.log()
+            log_prob = (-((actions - params) ** 2) / (2 * std ** 2) - log_scale - LOG_SQRT_2PI).sum(dim=1)
+            entropy = (0.5 + LOG_SQRT_2PI + log_scale).sum().expand(len(obs))
+            return values, log_prob, entropy
+
+        log_prob = 0
+        entropy = 0
+        for i, logits in enumerate(torch.split(params, self.branches, dim=1)):
+            log_probs = logits - logits.logsumexp(dim=1, keepdim=True)
+            log_prob = log_prob + log_probs.gather(1, actions[:, i:i + 1]).squeeze(1)
+            entropy = entropy - (log_probs.exp() * log_probs).sum(dim=1)
+        return values, log_prob, entropy
+
+
+def create_ppo_update(fast_update_config, model):
+    # None keeps SB3's PPO.train
+    fast_update_config = fast_update_config or {}
+    if not fast_update_config.get("enabled", False):
+        return None
+    return FastPPOUpdate(
+        model,
+        batch_size=fast_update_config.get("batch_size"),
+        threads=fast_update_config.get("threads"),
+        foreach=fast_update_config.get("foreach", True)
+    )
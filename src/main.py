@@ -1,42 +1,62 @@
-from mlgame3d.game_runner import GameRunner
-from mlgame3d.game_env import GameEnvironment
+from startupProfile import startup_profile
 from utils import get_config, dict_to_tuple_list
-from mlgame3d.mlplay_loader import create_mlplay_from_file
 
-def create_env(game_path, game_parameters: dict):
+# mlgame3d, torch and stable_baselines3 are imported where they are first needed, so the mode
+# prompt shows up right away; the modes that train or run the torch policy prefetch them while the game launches
+PREFETCH_MODULES = ["torch", "stable_baselines3", "torch._dynamo"]
+
+def create_env(game_path, game_parameters: dict, worker_id=0, no_graphics=False, time_scale=1.0, players=1):
+    with startup_profile.phase("import mlgame3d"):
+        from mlgame3d.game_env import GameEnvironment
     # Create the environment with controlled players
     env = GameEnvironment(
         file_name=game_path,  # Or None to connect to a running Unity editor
-        worker_id=0,
-        no_graphics=False,
+        worker_id=worker_id,  # Port offset, distinct per running game instance
+        no_graphics=no_graphics,
         fps=60,  # Target frames per second for rendering
-        time_scale=1.0,  # Time scale factor for simulation speed
+        time_scale=time_scale,  # Time scale factor for simulation speed
         decision_period=5,  # Number of FixedUpdate steps between AI decisions
-        controlled_players=[0],  # Control P1
-        control_modes=["mlplay"],  # Control P1 with MLPlay
+        controlled_players=list(range(players)),  # Control P1 to P{players}
+        control_modes=["mlplay"] * players,  # Control P1 to P{players} with MLPlay
         game_parameters=dict_to_tuple_list(game_parameters),  # Game parameters
     )
     return env
 
+def needs_torch(mode, config):
+    if mode == "inference":
+        return config["model"].get("inference_engine", "sb3") != "numpy"
+    return mode == "train"
+
 def get_mlplay(mode, observation_structure, action_space_info, config):
+    from mlgame3d.mlplay_loader import load_mlplay_class
     if mode == "train":
         file_path = config["mlplay_path"]
     elif mode == "inference":
         file_path = config["inference_path"]
+    elif mode == "demonstrate":
+        file_path = config["demonstration_path"]
 
-    mlplay = create_mlplay_from_file(
-        file_path=file_path,
-        observation_structure=observation_structure,
-        action_space_info=action_space_info,
-        game_parameters=config["game_parameters"]
-    )
+    # Same as mlgame3d's create_mlplay_from_file, but the already parsed config is handed to the constructor
+    with startup_profile.phase("import MLPlay"):
+        mlplay_class = load_mlplay_class(file_path)
+    with startup_profile.phase("create MLPlay"):
+        mlplay = mlplay_class(observation_structure, action_space_info, None, game_params=config["game_parameters"], config=config)
     return mlplay
 
-def create_runner(mlplay, env, mlplay_to_behavior_map, game_parameters):
+def get_shared_players(observation_structure, action_space_info, players, config):
+    # Every player of the game instance trains the same PPO model
+    with startup_profile.phase("import MLPlay"):
+        from sharedPolicy import create_shared_players
+    with startup_profile.phase("create MLPlay"):
+        mlplays = create_shared_players(observation_structure, action_space_info, players, config)
+    return mlplays
+
+def create_runner(mlplays: list, env, mlplay_to_behavior_map, game_parameters):
+    from mlgame3d.game_runner import GameRunner
     # Create a game runner
     runner = GameRunner(
         env=env,
-        mlplays=[mlplay],
+        mlplays=mlplays,
         max_episodes=3000,
         render=True,
         mlplay_timeout=0.1,  # Timeout for MLPlay actions in seconds
@@ -49,24 +69,36 @@ def choose_mode():
     print("Select mode:")
     print("1. Train")
     print("2. Inference")
-    choice = input("Enter choice (1 or 2): ")
+    print("3. Record keyboard demonstrations")
+    choice = input("Enter choice (1, 2 or 3): ")
     if choice == '1':
         return "train"
     elif choice == '2':
         return "inference"
+    elif choice == '3':
+        return "demonstrate"
     else:
-        raise KeyError("Invalid choice. Please enter 1 or 2.")
+        raise KeyError("Invalid choice. Please enter 1, 2 or 3.")
 
 if __name__ == "__main__":
     config = get_config()
-    mode = choose_mode()
-    env = create_env(config["game_path"], config["game_parameters"])
+    with startup_profile.phase("choose mode", waiting=True):
+        mode = choose_mode()
+    if needs_torch(mode, config):
+        startup_profile.prefetch(PREFETCH_MODULES)
+    # model.players > 1 trains one shared policy from that many players of this game instance
+    players = config["model"].get("players", 1) if mode == "train" else 1
+    with startup_profile.phase("launch game"):
+        env = create_env(config["game_path"], config["game_parameters"], players=players)
     behavior_name = env.behavior_names[0]
     observation_structure = env.get_observation_structure(behavior_name)
     action_space_info = env.get_action_space_info(behavior_name)
-    mlplay_to_behavior_map = {0: behavior_name}
-    mlplay = get_mlplay(mode, observation_structure, action_space_info, config)
+    mlplay_to_behavior_map = {i: env.behavior_names[i] for i in range(players)}
+    if players > 1:
+        mlplays = get_shared_players(observation_structure, action_space_info, players, config)
+    else:
+        mlplays = [get_mlplay(mode, observation_structure, action_space_info, config)]
 
-    runner = create_runner(mlplay, env, mlplay_to_behavior_map, config["game_parameters"])
+    runner = create_runner(mlplays, env, mlplay_to_behavior_map, config["game_parameters"])
     runner.run() # Run the game
     env.close() # Close the environment
@@ -0,0 +1,91 @@
+import os
+import time
+import threading
+import numpy as np
+
+
+class ModelWatcher:
+    # Polls the model file's mtime and size on a background thread. Once the file has changed and then stayed
+    # the same for one more poll (a copy still in progress keeps changing), load(model_path) runs on that thread
+    # and its result waits in `loaded` until the owner takes it at its next reset or step boundary. If load
+    # raises, the model in use stays in use and the watcher waits for the file to change again.
+    def __init__(self, model_path, load, poll_interval=1.0, name="ModelWatcher"):
+        self.model_path = model_path
+        self.load = load
+        self.poll_interval = poll_interval
+        self.name = name
+        self.loaded = None
+        self.reloads = 0
+        self.failures = 0
+        self.lock = threading.Lock()
+        self.stopped = threading.Event()
+        self.signature = self._signature()
+        self.thread = threading.Thread(target=self._run, name=name, daemon=True)
+        self.thread.start()
+
+    def take(self):
+        # The newest model that loaded and validated, once, or None; only an attribute read while nothing changed
+        if self.loaded is None:
+            return None
+        with self.lock:
+            loaded, self.loaded = self.loaded, None
+        return loaded
+
+    def close(self):
+        self.stopped.set()
+        self.thread.join()
+
+    def _signature(self):
+        try:
+            stat = os.stat(self.model_path)
+        except OSError:
+            return None
+        return (stat.st_mtime_ns, stat.st_size)
+
+    def _run(self):
+        changed = None
+        while not self.stopped.wait(self.poll_interval):
+            signature = self._signature()
+            if signature is None or signature == self.signature:
+                changed = None
+                continue
+            if signature != changed:
+                changed = signature
+                continue
+            changed = None
+            self.signature = signature
+            start = time.perf_counter()
+            try:
+                loaded = self.load(self.model_path)
+            except Exception as e:
+                self.failures += 1
+                print(f"[{self.name}] Could not reload {self.model_path}, keeping the current model: {e}")
+                continue
+            if self._signature() != signature:
+                # Replaced again while loading: the next poll loads the newer file
+                continue
+            with self.lock:
+                self.loaded = loaded
+            self.reloads += 1
+            print(f"[{self.name}] Loaded the updated {self.model_path} in {(time.perf_counter() - start) * 1000:.0f} ms")
+
+
+def check_policy(observation_size, model=None, numpy_policy=None):
+    # Raises unless the policy takes observation_size entries and gets a finite action out of a zero observation
+    expected = numpy_policy.obs_size if numpy_policy is not None else model.observation_space.shape[0]
+    if expected != observation_size:
+        raise ValueError(f"the policy takes {expected} observation entries, the game sends {observation_size}")
+    obs = np.zeros(observation_size, dtype=np.float32)
+    if numpy_policy is not None:
+        action = numpy_policy.forward(obs, deterministic=True)
+    else:
+        action, _ = model.predict(obs, deterministic=True)
+    if not np.all(np.isfinite(action)):
+        raise ValueError("the policy returns non-finite actions")
+
+
+def create_model_watcher(hot_reload_config, model_path, load, name="ModelWatcher"):
+    hot_reload_config = hot_reload_config or {}
+    if not hot_reload_config.get("enabled", False):
+        return None
+    return ModelWatcher(model_path, load, poll_interval=hot_reload_config.get("poll_interval", 1.0), name=name)
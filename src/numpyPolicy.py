@@ -0,0 +1,173 @@
+import os
+import argparse
+import tempfile
+import numpy as np
+
+ACTIVATIONS = {
+    "Tanh": np.tanh,
+    "ReLU": lambda x: np.maximum(x, 0.0),
+    "LeakyReLU": lambda x: np.where(x > 0.0, x, x * 0.01),
+    "ELU": lambda x: np.where(x > 0.0, x, np.expm1(x)),
+    "Sigmoid": lambda x: 1.0 / (1.0 + np.exp(-x)),
+    "Identity": lambda x: x
+}
+
+
+def get_weights_path(model_path):
+    return os.path.splitext(model_path)[0] + ".npz"
+
+
+def export_policy(model_path, weights_path=None):
+    import torch
+    from gymnasium import spaces
+    from stable_baselines3 import PPO
+
+    weights_path = weights_path or get_weights_path(model_path)
+    policy = PPO.load(model_path, device="cpu").policy
+    if policy.use_sde or policy.squash_output:
+        raise ValueError("Exporting policies that use gSDE or squashed outputs is not supported.")
+    activation = policy.activation_fn.__name__
+    if activation not in ACTIVATIONS:
+        raise ValueError(f"Unsupported activation function: {activation}")
+
+    arrays = {"activation": np.array(activation)}
+    layers = [module for module in policy.mlp_extractor.policy_net if isinstance(module, torch.nn.Linear)]
+    for i, layer in enumerate(layers):
+        arrays[f"layer_{i}_weight"] = layer.weight.detach().numpy().T.astype(np.float32)
+        arrays[f"layer_{i}_bias"] = layer.bias.detach().numpy().astype(np.float32)
+    arrays["action_weight"] = policy.action_net.weight.detach().numpy().T.astype(np.float32)
+    arrays["action_bias"] = policy.action_net.bias.detach().numpy().astype(np.float32)
+
+    action_space = policy.action_space
+    if isinstance(action_space, spaces.Box):
+        arrays["kind"] = np.array("box")
+        arrays["log_std"] = policy.log_std.detach().numpy().astype(np.float32)
+    elif isinstance(action_space, spaces.Discrete):
+        arrays["kind"] = np.array("discrete")
+        arrays["branches"] = np.array([action_space.n], dtype=np.int64)
+    elif isinstance(action_space, spaces.MultiDiscrete):
+        arrays["kind"] = np.array("multi_discrete")
+        arrays["branches"] = np.asarray(action_space.nvec, dtype=np.int64).reshape(-1)
+    else:
+        raise ValueError(f"Unsupported action space: {action_space}")
+
+    # A temporary name of this process's own, so concurrent exports of the same model cannot clobber each other
+    fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(weights_path) or ".", suffix=".npz")
+    try:
+        with os.fdopen(fd, "wb") as f:
+            np.savez(f, **arrays)
+        os.replace(tmp_path, weights_path)
+    except BaseException:
+        os.remove(tmp_path)
+        raise
+    print(f"Policy weights exported to {weights_path}")
+    return weights_path
+
+
+def verify_export(model_path, weights_path=None, samples=1000, seed=0):
+    import torch
+    from stable_baselines3 import PPO
+
+    policy = PPO.load(model_path, device="cpu").policy
+    numpy_policy = NumpyPolicy(weights_path or get_weights_path(model_path), seed=seed)
+    obs = np.random.default_rng(seed).normal(0.0, 5.0, size=(samples, numpy_policy.obs_size)).astype(np.float32)
+
+    with torch.no_grad():
+        obs_tensor = torch.as_tensor(obs)
+        distribution = policy.get_distribution(obs_tensor)
+        expected_actions = policy._predict(obs_tensor, deterministic=True).numpy().reshape(samples, -1)
+        if numpy_policy.kind == "box":
+            expected_params = distribution.distribution.mean.numpy()
+            expected_std = distribution.distribution.stddev.numpy()
+        elif numpy_policy.kind == "discrete":
+            expected_params = distribution.distribution.logits.numpy()
+        else:
+            expected_params = np.concatenate([d.logits.numpy() for d in distribution.distribution], axis=1)
+
+    params = numpy_policy.action_parameters(obs)
+    if numpy_policy.kind != "box":
+        # Categorical logits are only defined up to a constant per branch, so compare log-softmax values
+        params = numpy_policy.log_softmax(params)
+    param_error = float(np.max(np.abs(params - expected_params)))
+    actions = numpy_policy.forward(obs, deterministic=True)
+    if numpy_policy.kind == "box":
+        action_error = float(np.max(np.abs(actions - expected_actions)))
+        std_error = float(np.max(np.abs(np.exp(numpy_policy.log_std) - expected_std)))
+        passed = action_error < 1e-4 and std_error < 1e-5
+    else:
+        action_error = float(np.mean(actions != expected_actions))
+        passed = action_error == 0.0
+    passed = passed and param_error < 1e-4
+    print(f"Parity with SB3 over {samples} observations: max parameter error {param_error:.2e}, "
+          f"deterministic action error {action_error:.2e} -> {'OK' if passed else 'MISMATCH'}")
+    return passed
+
+
+class NumpyPolicy:
+    def __init__(self, weights_path, seed=None):
+        with np.load(weights_path) as data:
+            self.kind = str(data["kind"])
+            self.activation = ACTIVATIONS[str(data["activation"])]
+            self.layers = []
+            while f"layer_{len(self.layers)}_weight" in data:
+                i = len(self.layers)
+                self.layers.append((data[f"layer_{i}_weight"], data[f"layer_{i}_bias"]))
+            self.action_weight = data["action_weight"]
+            self.action_bias = data["action_bias"]
+            self.log_std = data["log_std"] if self.kind == "box" else None
+            self.branches = data["branches"] if self.kind != "box" else None
+
+        self.obs_size = self.layers[0][0].shape[0] if self.layers else self.action_weight.shape[0]
+        self.std = np.exp(self.log_std) if self.log_std is not None else None
+        if self.branches is not None:
+            self.offsets = np.concatenate([[0], np.cumsum(self.branches)])
+        self.rng = np.random.default_rng(seed)
+
+    def action_parameters(self, obs):
+        x = np.asarray(obs, dtype=np.float32).reshape(-1, self.obs_size)
+        for weight, bias in self.layers:
+            x = self.activation(x @ weight + bias)
+        return x @ self.action_weight + self.action_bias
+
+    def forward(self, obs, deterministic=False):
+        single = np.ndim(obs) == 1
+        params = self.action_parameters(obs)
+        if self.kind == "box":
+            actions = params
+            if not deterministic:
+                actions = params + self.std * self.rng.standard_normal(params.shape, dtype=np.float32)
+        else:
+            actions = np.empty((params.shape[0], len(self.branches)), dtype=np.int64)
+            for i in range(len(self.branches)):
+                logits = params[:, self.offsets[i]:self.offsets[i + 1]]
+                if not deterministic:
+                    logits = logits + self.rng.gumbel(size=logits.shape)
+                actions[:, i] = np.argmax(logits, axis=1)
+        return actions[0] if single else actions
+
+    def log_softmax(self, params):
+        result = np.empty_like(params)
+        for i in range(len(self.branches)):
+            logits = params[:, self.offsets[i]:self.offsets[i + 1]]
+            shifted = logits - logits.max(axis=1, keepdims=True)
+            result[:, self.offsets[i]:self.offsets[i + 1]] = shifted - np.log(np.exp(shifted).sum(axis=1, keepdims=True))
+        return result
+
+
+def load_numpy_policy(model_path, seed=None):
+    weights_path = get_weights_path(model_path)
+    if not os.path.exists(weights_path) or os.path.getmtime(weights_path) < os.path.getmtime(model_path):
+        print(f"Exporting {model_path} for the NumPy inference engine...")
+        export_policy(model_path, weights_path)
+    return NumpyPolicy(weights_path, seed=seed)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Export a trained PPO zip to a NumPy weights file")
+    parser.add_argument("model_path")
+    parser.add_argument("--output", default=None, help="Weights file path (defaults to the model path with .npz)")
+    parser.add_argument("--verify", type=int, default=1000, help="Number of random observations for the SB3 parity check (0 to skip)")
+    args = parser.parse_args()
+    weights_path = export_policy(args.model_path, args.output)
+    if args.verify > 0 and not verify_export(args.model_path, weights_path, samples=args.verify):
+        raise SystemExit(1)
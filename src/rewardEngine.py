@@ -0,0 +1,262 @@
+import os
+import json
+import time
+import argparse
+import itertools
+import numpy as np
+from concurrent.futures import ProcessPoolExecutor
+from RLPlay import DEFAULT_REWARD_WEIGHTS, MUD_OBJECT_TYPE, merge_reward_weights
+from observationProcessor import ObservationProcessor
+
+TERMS = list(DEFAULT_REWARD_WEIGHTS)
+
+
+def compute_features(processor, flattened):
+    # Same per-observation features as RlplayRewardCalculator.compute_features, for a (T, size) array at once
+    flattened = np.asarray(flattened, dtype=np.float32)
+    target = np.ascontiguousarray(processor.view(flattened, "target_position")[:, :2])
+    object_types = processor.value(flattened, "nearby_map_objects.object_type")
+    positions = np.ascontiguousarray(processor.view(flattened, "nearby_map_objects.relative_position"))
+
+    # Batched matmul is the dot product np.linalg.norm uses, so distances match the step-by-step version bit for bit
+    target_distance = np.sqrt(np.matmul(target[:, None, :], target[:, :, None])[:, 0, 0])
+    distances = np.sqrt(np.matmul(positions[..., None, :], positions[..., :, None])[..., 0, 0])
+    is_mud = object_types == MUD_OBJECT_TYPE
+    # Distances are float32 like the step-by-step ones, everything after that is double precision
+    return {
+        "target_distance": target_distance.astype(np.float64),
+        "mud_distance": np.where(is_mud, distances, np.inf).min(axis=1, initial=np.inf).astype(np.float64),
+        "has_mud": is_mud.any(axis=1),
+        "health": processor.view(flattened, "agent_health").astype(np.float64),
+        "checkpoint": processor.value(flattened, "last_checkpoint_index").astype(np.int64),
+        "finished": processor.value(flattened, "reached_final_checkpoint")
+    }
+
+
+def compute_terms(features, episode_starts, *weights):
+    # Every reward term for all transitions at once, in double precision like RLPlay's compiled reward function.
+    # weights are merged onto DEFAULT_REWARD_WEIGHTS in order (config.json's "reward" section, then an override).
+    w = merge_reward_weights(*weights)
+    valid = ~np.asarray(episode_starts, dtype=bool)
+
+    def previous(values):
+        return np.concatenate([values[:1], values[:-1]])
+
+    checkpoint, prev_checkpoint = features["checkpoint"], previous(features["checkpoint"])
+    finished, prev_finished = features["finished"], previous(features["finished"])
+    distance, prev_distance = features["target_distance"], previous(features["target_distance"])
+    health, prev_health = features["health"], previous(features["health"])
+    mud, prev_mud = features["mud_distance"], previous(features["mud_distance"])
+    has_mud = valid & features["has_mud"] & previous(features["has_mud"])
+
+    params = w["checkpoint"]
+    gained = valid & (prev_checkpoint < checkpoint)
+    checkpoint_term = np.where(gained, params["weight"] * (checkpoint - prev_checkpoint), 0.0)
+
+    params = w["finish_game"]
+    finish_term = np.where(valid & ~prev_finished & finished, float(params["weight"]), 0.0)
+
+    params = w["distance"]
+    same_target = valid & (prev_checkpoint == checkpoint)
+    distance_values = np.where(distance <= prev_distance, params["close_weight"] * (prev_distance - distance),
+                               params["leave_weight"] * (distance - prev_distance))
+    distance_term = np.where(same_target, distance_values, 0.0)
+
+    params = w["health"]
+    alive = valid & (prev_health > 0.0)
+    health_values = np.where(health >= prev_health, params["increase_weight"] * (health - prev_health),
+                             params["decrease_weight"] * (prev_health - health))
+    health_values = np.where(health <= 0.0, float(params["death_weight"]), health_values)
+    health_term = np.where(alive, health_values, 0.0)
+
+    params = w["mud"]
+    threshold = params["threshold"]
+    was_in, is_in = prev_mud <= threshold, mud <= threshold
+    with np.errstate(invalid="ignore"):
+        mud_values = np.where(was_in & ~is_in, params["leave_weight"] * (mud - prev_mud),
+                              np.where(~was_in & is_in, params["close_weight"] * (prev_mud - mud), 0.0))
+    mud_values = np.where(was_in & is_in, float(params["stay_weight"]), mud_values)
+    mud_term = np.where(has_mud, mud_values, 0.0)
+
+    params = w["time"]
+    time_term = np.full(len(checkpoint), float(params["time_penalty"]))
+
+    return {
+        "checkpoint": checkpoint_term,
+        "finish_game": finish_term,
+        "distance": distance_term,
+        "health": health_term,
+        "mud": mud_term,
+        "time": time_term
+    }
+
+
+def sum_terms(terms):
+    # reward = 0.0; reward += term ... in the order of the compiled reward function
+    reward = np.zeros(len(terms[TERMS[0]]))
+    for term in TERMS:
+        reward = reward + terms[term]
+    return reward
+
+
+def compute_rewards(features, episode_starts, *weights):
+    # Returns the per-step rewards and RLPlay's not_used_for_training flags (first 9 steps of every episode)
+    episode_starts = np.asarray(episode_starts, dtype=bool)
+    rewards = sum_terms(compute_terms(features, episode_starts, *weights))
+    episode_ids = np.cumsum(episode_starts) - 1
+    first_step = np.flatnonzero(episode_starts)[episode_ids]
+    step_count = np.arange(len(rewards)) - first_step + 1
+    return rewards, step_count < 10
+
+
+def episode_returns(rewards, episode_starts):
+    return np.add.reduceat(rewards, np.flatnonzero(episode_starts)) if len(rewards) else np.zeros(0)
+
+
+def load_episodes(paths):
+    # Stacks every recorded episode into one (T, size) array with episode_starts marking each first step
+    from trajectoryRecorder import TrajectoryReader
+    flattened, episode_starts, recorded_rewards = [], [], []
+    observation_structure = None
+    for path in paths:
+        reader = TrajectoryReader(path)
+        if observation_structure is None:
+            observation_structure = reader.meta["observation_structure"]
+        elif reader.meta["observation_structure"] != observation_structure:
+            raise ValueError(f"{path} was recorded with a different observation structure")
+        for episode in reader:
+            starts = np.zeros(len(episode), dtype=bool)
+            starts[0] = True
+            flattened.append(np.asarray(episode.flattened))
+            episode_starts.append(starts)
+            recorded_rewards.append(np.asarray(episode.rewards))
+    if not flattened:
+        raise ValueError("No finished episodes found")
+    return observation_structure, np.concatenate(flattened), np.concatenate(episode_starts), np.concatenate(recorded_rewards)
+
+
+def step_by_step_rewards(processor, flattened, episode_starts, weights=None):
+    # Reference: the live RLPlay/RlplayRewardCalculator path, one observation at a time
+    from RLPlay import RLPlay
+    from RlplayRewardCalculator import RlplayRewardCalculator
+    reward_calculator = RlplayRewardCalculator()
+    rlplay = RLPlay(reward_calculator, weights)
+    keys = ["agent_health", "target_position", "last_checkpoint_index", "reached_final_checkpoint"]
+    rewards = np.zeros(len(flattened))
+    for t in range(len(flattened)):
+        if episode_starts[t]:
+            reward_calculator.reset()
+            rlplay.reset()
+        observation = {key: processor.value(flattened[t], key)[()] if processor.layout[key].shape == () else processor.view(flattened[t], key)
+                       for key in keys}
+        observation["last_checkpoint_index"] = int(observation["last_checkpoint_index"])
+        observation["reached_final_checkpoint"] = bool(observation["reached_final_checkpoint"])
+        types = processor.value(flattened[t], "nearby_map_objects.object_type")
+        positions = processor.view(flattened[t], "nearby_map_objects.relative_position")
+        observation["nearby_map_objects"] = [
+            {"object_type": int(object_type), "relative_position": np.array(position)} for object_type, position in zip(types, positions)
+        ]
+        reward_calculator.update(observation)
+        rewards[t], _ = rlplay.update()
+    return rewards
+
+
+def expand_grid(grid):
+    # {"distance.close_weight": [1, 2], "mud.stay_weight": [-30, -10]} -> every combination as weight overrides
+    keys = list(grid)
+    configs = []
+    for values in itertools.product(*(grid[key] for key in keys)):
+        config = {}
+        for key, value in zip(keys, values):
+            term, param = key.split(".", 1)
+            config.setdefault(term, {})[param] = value
+        configs.append(config)
+    return configs
+
+
+_sweep_data = None
+
+
+def _init_sweep_worker(features, episode_starts, base_weights):
+    global _sweep_data
+    _sweep_data = (features, episode_starts, base_weights)
+
+
+def _evaluate_configs(configs):
+    features, episode_starts, base_weights = _sweep_data
+    results = []
+    for config in configs:
+        terms = compute_terms(features, episode_starts, base_weights, config)
+        returns = episode_returns(sum_terms(terms), episode_starts)
+        results.append({
+            "weights": config,
+            "mean_return": float(returns.mean()),
+            "std_return": float(returns.std()),
+            "mean_terms": {term: float(episode_returns(values, episode_starts).mean()) for term, values in terms.items()}
+        })
+    return results
+
+
+def sweep(features, episode_starts, configs, workers=None, base_weights=None):
+    # Features are computed once and shipped to each worker once; configs are split into one batch per worker
+    # and override base_weights
+    workers = workers or os.cpu_count() or 1
+    batches = [configs[i::workers] for i in range(workers) if configs[i::workers]]
+    if len(batches) <= 1:
+        _init_sweep_worker(features, episode_starts, base_weights)
+        return _evaluate_configs(configs)
+    with ProcessPoolExecutor(max_workers=len(batches), initializer=_init_sweep_worker,
+                             initargs=(features, episode_starts, base_weights)) as executor:
+        results = list(executor.map(_evaluate_configs, batches))
+    # Undo the round-robin split so results line up with configs
+    ordered = [None] * len(configs)
+    for i, batch_results in enumerate(results):
+        ordered[i::len(batches)] = batch_results
+    return ordered
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Recompute RLPlay rewards over recorded trajectories and sweep reward weights")
+    parser.add_argument("trajectories", nargs="+", help="Trajectory directories written by the recorder")
+    parser.add_argument("--check", action="store_true", help="Compare with the step-by-step reward code")
+    parser.add_argument("--sweep", default=None, help="JSON file with a list of weight overrides or a {\"term.param\": [values]} grid")
+    parser.add_argument("--workers", type=int, default=None)
+    parser.add_argument("--output", default=None, help="Write the sweep results to this JSON file")
+    args = parser.parse_args()
+
+    from utils import get_config
+    base_weights = get_config().get("reward")
+
+    observation_structure, flattened, episode_starts, recorded_rewards = load_episodes(args.trajectories)
+    processor = ObservationProcessor(observation_structure)
+    start = time.perf_counter()
+    features = compute_features(processor, flattened)
+    rewards, _ = compute_rewards(features, episode_starts, base_weights)
+    elapsed = time.perf_counter() - start
+    print(f"{int(episode_starts.sum())} episodes, {len(rewards)} steps: rewards recomputed in {elapsed * 1000:.1f} ms "
+          f"({elapsed / len(rewards) * 1e9:.0f} ns/step)")
+    print(f"Max difference from recorded rewards: {np.max(np.abs(rewards.astype(np.float32) - recorded_rewards)):.2e}")
+
+    if args.check:
+        start = time.perf_counter()
+        reference = step_by_step_rewards(processor, flattened, episode_starts, base_weights)
+        elapsed = time.perf_counter() - start
+        mismatches = int(np.sum(reference != rewards))
+        print(f"Step-by-step version: {elapsed * 1000:.1f} ms, {mismatches} mismatching steps "
+              f"(max difference {np.max(np.abs(reference - rewards)):.2e})")
+        if mismatches:
+            raise SystemExit(1)
+
+    if args.sweep:
+        with open(args.sweep, "r") as f:
+            spec = json.load(f)
+        configs = expand_grid(spec) if isinstance(spec, dict) else spec
+        start = time.perf_counter()
+        results = sweep(features, episode_starts, configs, args.workers, base_weights)
+        print(f"Evaluated {len(configs)} weight configurations in {time.perf_counter() - start:.2f}s")
+        for result in sorted(results, key=lambda result: result["mean_return"], reverse=True):
+            terms = ", ".join(f"{term} {value:.1f}" for term, value in result["mean_terms"].items())
+            print(f"{result['mean_return']:10.2f} +- {result['std_return']:8.2f}  {json.dumps(result['weights'])}  [{terms}]")
+        if args.output:
+            with open(args.output, "w") as f:
+                json.dump(results, f, indent=4)
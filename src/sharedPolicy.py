@@ -0,0 +1,215 @@
+import copy
+import time
+import threading
+import numpy as np
+import torch
+from stable_baselines3.common.vec_env import DummyVecEnv
+from MLPlay import MLPlay
+from RLPlay import RLPlay
+from episodeMetrics import create_episode_metrics
+from compactRolloutBuffer import store_observation
+from startupProfile import startup_profile
+from RlplayRewardCalculator import RlplayRewardCalculator
+
+
+class TickBatcher:
+    # Collects the observation of every player for the current tick and runs one forward pass for all of
+    # them. GameRunner calls each player's update() on its own thread, so the last player to arrive runs the
+    # batch; a player that does not show up within batch_wait (finished, slow reward code) is left out of
+    # this tick's batch.
+    def __init__(self, forward, players, batch_wait=0.02):
+        self.forward = forward
+        self.batch_wait = batch_wait
+        self.expected = set(range(players))
+        self.pending = {}
+        self.results = {}
+        self.condition = threading.Condition()
+
+    def predict(self, player, obs):
+        with self.condition:
+            self.pending[player] = obs
+            if self.expected.issubset(self.pending):
+                self._run_pending()
+            else:
+                deadline = time.perf_counter() + self.batch_wait
+                while player not in self.results:
+                    remaining = deadline - time.perf_counter()
+                    if remaining <= 0:
+                        self._run_pending()
+                        break
+                    self.condition.wait(remaining)
+            return self.results.pop(player)
+
+    def _run_pending(self):
+        players = list(self.pending)
+        outputs = self.forward(np.stack([self.pending[player] for player in players]))
+        for i, player in enumerate(players):
+            self.results[player] = tuple(output[i] for output in outputs)
+        self.expected = set(players)
+        self.pending.clear()
+        self.condition.notify_all()
+
+
+class SharedPolicyLearner(MLPlay):
+    # One PPO model trained from several players of the same game. The rollout buffer has one column
+    # (n_envs) per player and every column fills at its own position; once all of them hold n_steps
+    # transitions, returns are computed per column and the buffer is trained on like MLPlay's.
+    # The learner itself is not handed to GameRunner, its `agents` are.
+    def __init__(self, observation_structure, action_space_info, players, config):
+        self.players = players
+        # Episodes, recording and decision skipping are per player; the learner only keeps the shared model
+        super().__init__(observation_structure, action_space_info, "SharedPolicy", config=dict(
+            config,
+            recording={"enabled": False},
+            decision_skipping=None,
+            metrics={"columnar": False, "tensorboard": False}
+        ))
+        self.positions = np.zeros(players, dtype=np.int64)
+        self.pending_columns = [[] for _ in range(players)]
+        self.column_lock = threading.Lock()
+        self.finished_resets = 0
+        self.batcher = TickBatcher(self._forward, players, config["model"].get("batch_wait", 0.02))
+        self.agents = [PlayerAgent(self, player, observation_structure, config) for player in range(players)]
+        print(f"Training one shared policy from {players} players, {self.model.n_steps * players} transitions per rollout")
+
+    def _model_env(self):
+        # One column per player; PPO never steps these envs, but DummyVecEnv wants a distinct object per column
+        return DummyVecEnv([lambda: copy.copy(self.env_wrapper)] * self.players)
+
+    def _init_hot_path(self):
+        self._last_value_tensor = torch.zeros(self.players, device=self.model.device)
+        self._last_done_array = np.zeros(self.players, dtype=np.float32)
+
+    def _forward(self, obs_batch):
+        # Runs inside the batcher's lock, so the observation statistics and the policy swap need no lock of their own
+        if self.async_learner is not None:
+            self.async_learner.swap_policy()
+        normalizer = self.env_wrapper.observation_normalizer
+        if normalizer is not None:
+            for obs in obs_batch:
+                normalizer.observe(obs)
+            obs_batch = normalizer.normalize(obs_batch)
+        obs_tensor = torch.as_tensor(obs_batch, dtype=torch.float32).to(self.model.device)
+        with torch.no_grad():
+            actions, values, log_probs = self.policy(obs_tensor)
+        return obs_batch, actions.cpu().numpy(), log_probs.cpu().numpy().reshape(-1, 1), values.cpu().numpy().reshape(-1, 1)
+
+    def store_transition(self, player, obs, action, reward, done, value, log_prob, next_value):
+        with self.column_lock:
+            self._store_column(player, (obs, action, reward, done, value, log_prob, next_value))
+
+    def _store_column(self, player, transition):
+        # A full column keeps its transitions until the next rollout starts
+        if self.positions[player] == self.model.n_steps:
+            self.pending_columns[player].append(transition)
+            return
+
+        obs, action, reward, done, value, log_prob, next_value = transition
+        rollout_buffer = self.rollout_buffer
+        pos = self.positions[player]
+        store_observation(rollout_buffer, pos, player, obs)
+        rollout_buffer.actions[pos, player] = action
+        rollout_buffer.rewards[pos, player] = reward
+        rollout_buffer.episode_starts[pos, player] = done
+        rollout_buffer.values[pos, player] = value[0]
+        rollout_buffer.log_probs[pos, player] = log_prob[0]
+        self.positions[player] += 1
+        if self.positions[player] < self.model.n_steps:
+            return
+
+        self._last_done_array[player] = done
+        self._last_value_tensor[player] = float(next_value[0])
+        if (self.positions == self.model.n_steps).all():
+            rollout_buffer.pos = rollout_buffer.buffer_size
+            rollout_buffer.full = True
+            with self.profiler.timed("compute_returns"):
+                rollout_buffer.compute_returns_and_advantage(last_values=self._last_value_tensor, dones=self._last_done_array)
+            if self.async_learner is not None:
+                self.async_learner.submit()
+                self._start_rollout()
+
+    def _start_rollout(self):
+        # Called with the column lock held, once the full buffer has been trained on or handed to the learner thread
+        self.positions[:] = 0
+        pending_columns = self.pending_columns
+        self.pending_columns = [[] for _ in range(self.players)]
+        for player, transitions in enumerate(pending_columns):
+            for transition in transitions:
+                self._store_column(player, transition)
+
+    def player_reset(self, player):
+        # GameRunner resets every player after the episode; the last one ends the shared episode
+        self.finished_resets += 1
+        if self.finished_resets < self.players:
+            return
+        self.finished_resets = 0
+        episode = self.episode_count
+        with self.profiler.timed("reset"):
+            if self.async_learner is not None:
+                self.async_learner.swap_policy()
+            elif self.rollout_buffer.full:
+                self._update_policy()
+                with self.column_lock:
+                    self._start_rollout()
+            self.episode_count += 1
+        self.profiler.flush_episode(episode, self._tensorboard_writer())
+
+
+class PlayerAgent:
+    # The MLPlay GameRunner drives for one player: its own reward calculator and previous step, the
+    # learner's model, batcher and rollout column
+    def __init__(self, learner, player, observation_structure, config):
+        self.learner = learner
+        self.player = player
+        self.name = f"MLPlay{player + 1}"
+        self.rlplayRewardCalculator = RlplayRewardCalculator(learner.env_wrapper.observation_processor)
+        self.RLPlay = RLPlay(self.rlplayRewardCalculator, config.get("reward"))
+        self.action_processor = learner.env_wrapper.action_processor
+        self.episode_metrics = create_episode_metrics(
+            config.get("metrics"),
+            default_path=f"{learner.model_save_dir}/episodes_player{player + 1}",
+            mud_threshold=self.RLPlay.weights["mud"]["threshold"],
+            tensorboard_writer=learner._tensorboard_writer,
+            tag=f"episode_player{player + 1}"
+        )
+        self.episode_count = 1
+        self.prev_observation = None
+        self.prev_action = None
+        self.prev_log_prob = None
+        self.prev_value = None
+
+    def update(self, observations, done, info, keyboard=set(), *args, **kwargs):
+        self.rlplayRewardCalculator.update(observations)
+        reward, not_used_for_training = self.RLPlay.update()
+        if self.prev_observation is not None:
+            self.episode_metrics.step(reward, self.rlplayRewardCalculator.features)
+
+        policy_observation, action, log_prob, value = self.learner.batcher.predict(self.player, observations["flattened"])
+        if self.prev_observation is not None and not not_used_for_training:
+            self.learner.store_transition(self.player, self.prev_observation, self.prev_action, reward, done,
+                                          self.prev_value, self.prev_log_prob, value)
+
+        self.prev_observation = policy_observation
+        self.prev_action = action
+        self.prev_log_prob = log_prob
+        self.prev_value = value
+        startup_profile.first_action()
+        return self.action_processor.create_action(action)
+
+    def reset(self):
+        row = self.episode_metrics.end_episode(self.episode_count)
+        if row is not None:
+            print(f"Player {self.player + 1} episode {self.episode_count}: Total Reward = {row['return']:.2f}, "
+                  f"Steps = {row['length']}, Checkpoints = {row['checkpoints']}")
+        self.episode_count += 1
+        self.prev_observation = None
+        self.prev_action = None
+        self.prev_log_prob = None
+        self.prev_value = None
+        self.rlplayRewardCalculator.reset()
+        self.RLPlay.reset()
+        self.learner.player_reset(self.player)
+
+
+def create_shared_players(observation_structure, action_space_info, players, config):
+    return SharedPolicyLearner(observation_structure, action_space_info, players, config).agents
@@ -0,0 +1,212 @@
+import numpy as np
+from concurrent.futures import ThreadPoolExecutor
+from utils import ActionSpaceSpec
+
+STAND_IN_OBSERVATION_STRUCTURE = [
+    {"key": "agent_position", "type": "Vector3"},
+    {"key": "agent_health", "type": "float"},
+    {"key": "target_position", "type": "Vector2"},
+    {"key": "last_checkpoint_index", "type": "int"},
+    {"key": "reached_final_checkpoint", "type": "bool"},
+    {"key": "nearby_map_objects", "type": "List", "item_count": 5, "items": [
+        {"key": "object_type", "type": "int"},
+        {"key": "relative_position", "type": "Vector3"}
+    ]}
+]
+
+
+class StandInEnvironment:
+    # Synthetic replacement for mlgame3d's GameEnvironment: a flat track of checkpoints with mud pits
+    def __init__(self, worker_id=0, controlled_players=[0], game_parameters=None,
+                 observation_structure=None, action_space_info=None, max_steps=1000, seed=None):
+        game_parameters = dict(game_parameters or {})
+        self.worker_id = worker_id
+        self.behavior_names = [f"StandIn?team={player}" for player in controlled_players]
+        self.observation_structure = observation_structure or STAND_IN_OBSERVATION_STRUCTURE
+        self.action_space_info = action_space_info or ActionSpaceSpec(continuous_size=2, discrete_branches=(2,))
+        self.checkpoint_count = int(game_parameters.get("checkpoint", 10))
+        self.mud_count = int(game_parameters.get("mud_pit", 3))
+        self.max_steps = max_steps
+        self.rng = np.random.default_rng(worker_id if seed is None else seed)
+        self.keyboard = set()
+        self.step_count = 0
+
+    def get_observation_structure(self, behavior_name):
+        return self.observation_structure
+
+    def get_action_space_info(self, behavior_name):
+        return self.action_space_info
+
+    def reset(self):
+        angles = np.linspace(0.0, 2.0 * np.pi, self.checkpoint_count, endpoint=False)
+        self.checkpoints = np.stack([np.cos(angles), np.sin(angles)], axis=1) * 20.0
+        self.muds = self.rng.uniform(-20.0, 20.0, size=(self.mud_count, 2))
+        self.players = []
+        for _ in self.behavior_names:
+            self.players.append({
+                "position": self.rng.normal(0.0, 1.0, size=2),
+                "health": 100.0,
+                "checkpoint": 0,
+                "finished": False
+            })
+        self.step_count = 0
+        return {name: self._observe(player) for name, player in zip(self.behavior_names, self.players)}
+
+    def step(self, actions):
+        self.step_count += 1
+        rewards = {}
+        for name, player in zip(self.behavior_names, self.players):
+            action = actions.get(name, [None])[0]
+            if player["finished"] or player["health"] <= 0.0:
+                rewards[name] = 0.0
+                continue
+
+            in_mud = np.linalg.norm(self.muds - player["position"], axis=1).min(initial=np.inf) < 2.0
+            speed = 0.2 if in_mud else 0.6
+            player["position"] = player["position"] + self._movement(action) * speed
+            if in_mud:
+                player["health"] = max(0.0, player["health"] - 1.0)
+
+            target = self.checkpoints[player["checkpoint"] % self.checkpoint_count]
+            if np.linalg.norm(target - player["position"]) < 1.5:
+                player["checkpoint"] += 1
+                player["finished"] = player["checkpoint"] >= self.checkpoint_count
+            rewards[name] = 0.0
+
+        done = self.step_count >= self.max_steps or all(
+            player["finished"] or player["health"] <= 0.0 for player in self.players
+        )
+        observations = {name: self._observe(player) for name, player in zip(self.behavior_names, self.players)}
+        return observations, rewards, done, {}
+
+    def close(self):
+        pass
+
+    def _movement(self, action):
+        if action is None:
+            return np.zeros(2)
+        if isinstance(action, tuple):
+            action = action[0]
+        action = np.asarray(action, dtype=np.float64).reshape(-1)
+        if self.action_space_info.is_discrete():
+            direction = np.zeros(2)
+            if action.size > 0:
+                direction[0] = float(action[0]) - 1.0
+            if action.size > 1:
+                direction[1] = float(action[1]) - 1.0
+            return direction
+        movement = np.zeros(2)
+        movement[:min(2, action.size)] = np.clip(action[:2], -1.0, 1.0)
+        return movement
+
+    def _observe(self, player):
+        position = player["position"]
+        target = self.checkpoints[min(player["checkpoint"], self.checkpoint_count - 1)]
+        offsets = self.muds - position
+        values = {
+            "agent_position": [position[0], 0.0, position[1]],
+            "agent_health": player["health"],
+            "target_position": [target[0] - position[0], target[1] - position[1]],
+            "last_checkpoint_index": player["checkpoint"],
+            "reached_final_checkpoint": float(player["finished"]),
+            "nearby_map_objects": [
+                {"object_type": 1, "relative_position": [offset[0], 0.0, offset[1]]} for offset in offsets
+            ]
+        }
+        flattened = []
+        self._encode(self.observation_structure, values, flattened)
+        flattened = np.asarray(flattened, dtype=np.float32)
+        observation = _parse_items(self.observation_structure, flattened, 0)[0]
+        observation["flattened"] = flattened
+        return observation
+
+    def _encode(self, items, values, flattened):
+        for item in items:
+            value = values.get(item.get("key", ""))
+            item_type = item.get("type", "")
+            if item_type in ("Vector3", "Vector2", "Vector"):
+                size = {"Vector3": 3, "Vector2": 2}.get(item_type, item.get("vector_size", 0))
+                vector = np.zeros(size)
+                if value is not None:
+                    vector[:min(size, len(value))] = value[:size]
+                flattened.extend(vector)
+            elif item_type in ("float", "int", "bool"):
+                flattened.append(float(value) if value is not None else 0.0)
+            elif item_type == "List":
+                count = item.get("item_count", 0) or 1
+                sub_values = list(value or [])
+                for index in range(count):
+                    self._encode(item.get("items", []), sub_values[index] if index < len(sub_values) else {}, flattened)
+            elif item_type == "Grid":
+                for _ in range(item.get("grid_size", 0) ** 2):
+                    self._encode(item.get("items", []), {}, flattened)
+
+
+class StandInRunner:
+    # Same episode loop as mlgame3d's GameRunner, without timeouts so it runs at full speed
+    def __init__(self, env, mlplays, max_episodes=10, render=False, mlplay_timeout=0.1,
+                 game_parameters=None, mlplay_to_behavior_map=None):
+        self.env = env
+        self.mlplays = mlplays
+        self.max_episodes = max_episodes
+        self.executor = ThreadPoolExecutor(max_workers=max(1, len(mlplays)))
+        self.mlplay_to_behavior_map = mlplay_to_behavior_map or {
+            i: env.behavior_names[i] for i in range(len(mlplays))
+        }
+
+    def run(self):
+        for episode in range(self.max_episodes):
+            observations = self.env.reset()
+            done = False
+            info = {}
+            episode_step = 0
+            while not done:
+                futures = []
+                for i, mlplay in enumerate(self.mlplays):
+                    behavior_name = self.mlplay_to_behavior_map[i]
+                    future = self.executor.submit(mlplay.update, observations[behavior_name], done, info, self.env.keyboard)
+                    futures.append((behavior_name, future))
+                actions = {behavior_name: [future.result()] for behavior_name, future in futures}
+                observations, rewards, done, info = self.env.step(actions)
+                episode_step += 1
+            print(f"Episode {episode+1} finished: steps={episode_step}")
+            for mlplay in self.mlplays:
+                mlplay.reset()
+        self.executor.shutdown()
+
+
+def _parse_items(items, flattened, index):
+    parsed = {}
+    for item in items:
+        key = item.get("key", "")
+        if not key:
+            continue
+        parsed[key], index = _parse_item(item, flattened, index)
+    return parsed, index
+
+
+def _parse_item(item, flattened, index):
+    item_type = item.get("type", "")
+    if item_type in ("Vector3", "Vector2", "Vector"):
+        size = {"Vector3": 3, "Vector2": 2}.get(item_type, item.get("vector_size", 0))
+        return flattened[index:index + size], index + size
+    if item_type == "int":
+        return int(flattened[index]), index + 1
+    if item_type == "bool":
+        return bool(flattened[index] > 0.5), index + 1
+    if item_type == "float":
+        return flattened[index], index + 1
+    if item_type == "List":
+        result = []
+        for _ in range(item.get("item_count", 0) or 1):
+            sub_result, index = _parse_items(item.get("items", []), flattened, index)
+            result.append(sub_result)
+        return result, index
+    if item_type == "Grid":
+        grid_size = item.get("grid_size", 0)
+        result = np.zeros((grid_size, grid_size), dtype=object)
+        for row in range(grid_size):
+            for col in range(grid_size):
+                result[row, col], index = _parse_items(item.get("items", []), flattened, index)
+        return result, index
+    return None, index
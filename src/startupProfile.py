@@ -0,0 +1,59 @@
+import time
+import importlib
+import threading
+from contextlib import contextmanager
+
+
+class StartupProfile:
+    # Where the time between starting the entry point and MLPlay returning its first action goes.
+    # Phases marked waiting (the mode prompt) are reported but not counted as startup time.
+    def __init__(self):
+        self.start = time.perf_counter()
+        self.phases = []
+        self.imports = []
+        self.prefetch_thread = None
+        self.reported = False
+
+    @contextmanager
+    def phase(self, name, waiting=False):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.phases.append((name, time.perf_counter() - start, waiting))
+
+    def prefetch(self, modules):
+        # Imports the heavy modules on a background thread, e.g. while the game is launching; the
+        # import system's module locks make a later import on the main thread wait for it instead of racing it
+        def run():
+            for module in modules:
+                start = time.perf_counter()
+                try:
+                    importlib.import_module(module)
+                except Exception as e:
+                    print(f"Could not prefetch {module}: {e}")
+                    continue
+                self.imports.append((module, time.perf_counter() - start))
+
+        self.prefetch_thread = threading.Thread(target=run, name="ImportPrefetch", daemon=True)
+        self.prefetch_thread.start()
+
+    def first_action(self):
+        # Called on every step; only the first call reports
+        if not self.reported:
+            self.reported = True
+            self.report()
+
+    def report(self):
+        total = time.perf_counter() - self.start
+        waiting = sum(seconds for _, seconds, is_waiting in self.phases if is_waiting)
+        print(f"Startup profile: first action after {total - waiting:.2f} s"
+              + (f" (plus {waiting:.2f} s waiting for input)" if waiting > 0 else ""))
+        for name, seconds, is_waiting in self.phases:
+            print(f"  {name:<30} {seconds * 1000:8.0f} ms" + (" (waiting)" if is_waiting else ""))
+        for module, seconds in self.imports:
+            print(f"  {'import ' + module:<30} {seconds * 1000:8.0f} ms (background)")
+
+
+# Shared by the entry point and the MLPlay it loads; the clock starts when the entry point imports this module
+startup_profile = StartupProfile()
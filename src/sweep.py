@@ -0,0 +1,332 @@
+import os
+import sys
+import csv
+import copy
+import json
+import math
+import time
+import argparse
+import itertools
+import subprocess
+import numpy as np
+from utils import get_config
+
+# Search space keys without a dot are PPO parameters in config["model"]["params"]; dotted keys are
+# paths from the top of config.json ("model.params.gamma", "reward.time.time_penalty", ...)
+SHORTCUTS = {"net_arch": ["model", "params", "policy_kwargs", "net_arch"]}
+OBJECTIVE = "train/mean_reward"
+
+
+def config_path(key):
+    if key in SHORTCUTS:
+        return SHORTCUTS[key]
+    if "." in key:
+        return key.split(".")
+    return ["model", "params", key]
+
+
+def apply_overlay(config, overlay):
+    config = copy.deepcopy(config)
+    for key, value in overlay.items():
+        node = config
+        path = config_path(key)
+        for name in path[:-1]:
+            node = node.setdefault(name, {})
+        node[path[-1]] = value
+    return config
+
+
+def sample_value(spec, rng):
+    # [a, b, c] picks one of the values, {"uniform": [low, high]}, {"log_uniform": [low, high]} and
+    # {"int_uniform": [low, high]} (inclusive) sample a range
+    if isinstance(spec, list):
+        return spec[int(rng.integers(len(spec)))]
+    if "log_uniform" in spec:
+        low, high = spec["log_uniform"]
+        return float(math.exp(rng.uniform(math.log(low), math.log(high))))
+    if "uniform" in spec:
+        low, high = spec["uniform"]
+        return float(rng.uniform(low, high))
+    if "int_uniform" in spec:
+        low, high = spec["int_uniform"]
+        return int(rng.integers(low, high + 1))
+    raise ValueError(f"Unsupported search space entry {spec}")
+
+
+def generate_overlays(space, trials=None, seed=0):
+    # Every combination when the space only has value lists and no trial count is given, random samples otherwise
+    if trials is None:
+        if not all(isinstance(spec, list) for spec in space.values()):
+            raise ValueError("Ranges need --trials; only value lists can be swept as a full grid")
+        keys = list(space)
+        return [dict(zip(keys, values)) for values in itertools.product(*(space[key] for key in keys))]
+    rng = np.random.default_rng(seed)
+    return [{key: sample_value(spec, rng) for key, spec in space.items()} for _ in range(trials)]
+
+
+def read_progress(path):
+    # train/mean_reward of every update so far; the CSV is rewritten when new columns appear, so a partial
+    # last line or a missing file just means "nothing new yet"
+    rewards = []
+    try:
+        with open(path, newline="") as f:
+            for row in csv.DictReader(f):
+                value = row.get(OBJECTIVE)
+                if value:
+                    rewards.append(float(value))
+    except (OSError, ValueError, csv.Error):
+        pass
+    return rewards
+
+
+class Trial:
+    def __init__(self, index, overlay, directory):
+        self.index = index
+        self.overlay = overlay
+        self.directory = directory
+        self.config_path = os.path.join(directory, "config.json")
+        self.progress_path = os.path.join(directory, "progress.csv")
+        self.stop_path = os.path.join(directory, "stop")
+        self.log_path = os.path.join(directory, "output.log")
+        self.process = None
+        self.log = None
+        self.slot = None
+        self.status = "pending"
+        self.rewards = []
+        self.checked_updates = 0
+        self.start_time = None
+        self.duration = None
+        self.stop_requested = None
+
+    def objective(self, window):
+        return float(np.mean(self.rewards[-window:])) if self.rewards else float("-inf")
+
+
+def should_stop(trial, trials, grace_updates, min_trials):
+    # Median stopping rule: after update k, stop a trial whose running average of train/mean_reward is below
+    # the median running average of the other trials that got as far
+    k = len(trial.rewards)
+    if k < grace_updates:
+        return False
+    running_average = np.mean(trial.rewards[:k])
+    others = [np.mean(other.rewards[:k]) for other in trials if other is not trial and len(other.rewards) >= k]
+    if len(others) < min_trials:
+        return False
+    return running_average < np.median(others)
+
+
+def start_trial(trial, slot, options):
+    trial.slot = slot
+    trial.status = "running"
+    trial.start_time = time.perf_counter()
+    threads = str(options["threads"])
+    env = dict(os.environ, RLPROLY_CONFIG=trial.config_path, OMP_NUM_THREADS=threads, MKL_NUM_THREADS=threads)
+    command = [sys.executable, os.path.abspath(__file__), "--trial", trial.directory,
+               "--worker-id", str(options["base_worker_id"] + slot), "--updates", str(options["updates"]),
+               "--threads", threads, "--time-scale", str(options["time_scale"])]
+    if options["stand_in"]:
+        command.append("--stand-in")
+    trial.log = open(trial.log_path, "w")
+    trial.process = subprocess.Popen(command, env=env, stdout=trial.log, stderr=subprocess.STDOUT)
+    print(f"Trial {trial.index} started on worker {options['base_worker_id'] + slot}: {json.dumps(trial.overlay)}")
+
+
+def finish_trial(trial, updates):
+    trial.log.close()
+    trial.duration = time.perf_counter() - trial.start_time
+    trial.rewards = read_progress(trial.progress_path)
+    if trial.stop_requested is not None:
+        trial.status = "stopped"
+    elif trial.process.returncode == 0 and len(trial.rewards) >= updates:
+        trial.status = "completed"
+    else:
+        trial.status = "failed"
+    print(f"Trial {trial.index} {trial.status} after {len(trial.rewards)} updates, {trial.duration:.0f}s"
+          + (f", {OBJECTIVE} {trial.rewards[-1]:.3f}" if trial.rewards else ""))
+
+
+def run_sweep(overlays, base_config, output_dir, options):
+    os.makedirs(output_dir, exist_ok=True)
+    trials = []
+    for index, overlay in enumerate(overlays):
+        directory = os.path.join(output_dir, f"trial_{index:03d}")
+        os.makedirs(directory, exist_ok=True)
+        trial = Trial(index, overlay, directory)
+        config = apply_overlay(base_config, overlay)
+        config["model"].update(dir=directory, path=os.path.join(directory, "model.zip"), progress_csv=trial.progress_path)
+        config["model"]["params"].setdefault("seed", options["seed"] + index)
+        config["model"]["params"]["tensorboard_log"] = os.path.join(output_dir, "tensorboard")
+        config["profiling"] = {"enabled": False}
+        config["recording"] = {"enabled": False}
+        with open(trial.config_path, "w") as f:
+            json.dump(config, f, indent=4)
+        trials.append(trial)
+
+    with open(os.path.join(output_dir, "sweep.json"), "w") as f:
+        json.dump({"options": options, "overlays": overlays}, f, indent=4)
+
+    pending = list(trials)
+    running = {}
+    start = time.perf_counter()
+    try:
+        while pending or running:
+            for slot in range(options["parallel"]):
+                if slot not in running and pending:
+                    running[slot] = pending.pop(0)
+                    start_trial(running[slot], slot, options)
+
+            time.sleep(options["poll_interval"])
+            for slot, trial in list(running.items()):
+                trial.rewards = read_progress(trial.progress_path)
+                if trial.process.poll() is not None:
+                    finish_trial(trial, options["updates"])
+                    del running[slot]
+                elif trial.stop_requested is None and len(trial.rewards) > trial.checked_updates:
+                    trial.checked_updates = len(trial.rewards)
+                    if should_stop(trial, trials, options["grace_updates"], options["min_trials"]):
+                        print(f"Stopping trial {trial.index} early after {len(trial.rewards)} updates: "
+                              f"running average {np.mean(trial.rewards):.3f} is below the median")
+                        open(trial.stop_path, "w").close()
+                        trial.stop_requested = time.perf_counter()
+                elif trial.stop_requested is not None and time.perf_counter() - trial.stop_requested > options["stop_timeout"]:
+                    trial.process.kill()
+    finally:
+        for trial in running.values():
+            if trial.process.poll() is None:
+                trial.process.kill()
+
+    print(f"Sweep of {len(trials)} trials finished in {time.perf_counter() - start:.0f}s")
+    return trials
+
+
+def format_value(value):
+    return f"{value:.4g}" if isinstance(value, float) else json.dumps(value)
+
+
+def write_results(trials, output_dir, window):
+    # Completed trials first: a stopped trial's objective only covers its early updates
+    order = {"completed": 0, "stopped": 1, "failed": 2}
+    ranked = sorted(trials, key=lambda trial: (order.get(trial.status, 2), -trial.objective(window)))
+    keys = sorted({key for trial in trials for key in trial.overlay})
+    rows = []
+    for rank, trial in enumerate(ranked, 1):
+        row = {
+            "rank": rank,
+            "trial": trial.index,
+            "status": trial.status,
+            "updates": len(trial.rewards),
+            "objective": trial.objective(window),
+            "best": max(trial.rewards) if trial.rewards else None,
+            "seconds": round(trial.duration or 0.0, 1)
+        }
+        row.update({key: json.dumps(trial.overlay.get(key)) for key in keys})
+        rows.append(row)
+
+    with open(os.path.join(output_dir, "results.csv"), "w", newline="") as f:
+        writer = csv.DictWriter(f, fieldnames=list(rows[0]))
+        writer.writeheader()
+        writer.writerows(rows)
+    with open(os.path.join(output_dir, "results.json"), "w") as f:
+        json.dump([dict(row, overlay=trial.overlay, rewards=trial.rewards) for row, trial in zip(rows, ranked)], f, indent=4)
+
+    print(f"\nObjective: mean {OBJECTIVE} over the last {window} updates")
+    header = f"{'rank':>4} {'trial':>5} {'status':<9} {'updates':>7} {'objective':>10} {'best':>9} {'seconds':>8}  " + "  ".join(keys)
+    print(header)
+    for row, trial in zip(rows, ranked):
+        best = f"{row['best']:9.3f}" if row["best"] is not None else f"{'-':>9}"
+        print(f"{row['rank']:>4} {row['trial']:>5} {row['status']:<9} {row['updates']:>7} {row['objective']:10.3f} {best} "
+              f"{row['seconds']:8.0f}  " + "  ".join(format_value(trial.overlay.get(key)) for key in keys))
+    print(f"Results written to {output_dir}")
+
+
+def run_trial(trial_dir, worker_id, updates, threads, stand_in, time_scale):
+    # One training run: MLPlay against its own headless game until it has done `updates` PPO updates or
+    # the sweep asks it to stop
+    import torch
+    torch.set_num_threads(threads)
+    config = get_config()
+    if stand_in:
+        from standInGame import StandInEnvironment, StandInRunner
+        env = StandInEnvironment(worker_id=worker_id, game_parameters=config["game_parameters"])
+        runner_class = StandInRunner
+    else:
+        from main import create_env
+        from mlgame3d.game_runner import GameRunner
+        env = create_env(config["game_path"], config["game_parameters"], worker_id=worker_id,
+                         no_graphics=True, time_scale=time_scale)
+        runner_class = GameRunner
+
+    from MLPlay import MLPlay
+    behavior_name = env.behavior_names[0]
+    mlplay = MLPlay(env.get_observation_structure(behavior_name), env.get_action_space_info(behavior_name), None, config=config)
+
+    # One episode per runner, the way tournament workers reuse their env, so the trial can stop between
+    # episodes (where the synchronous update runs) and shut down on this thread
+    stop_path = os.path.join(trial_dir, "stop")
+    try:
+        while mlplay.update_count < updates and not os.path.exists(stop_path):
+            runner = runner_class(
+                env=env,
+                mlplays=[mlplay],
+                max_episodes=1,
+                render=False,
+                mlplay_timeout=0.1,
+                game_parameters=config["game_parameters"],
+                mlplay_to_behavior_map={0: behavior_name}
+            )
+            runner.run()
+            runner.executor.shutdown()
+        if mlplay.async_learner is not None:
+            mlplay.async_learner.close()
+        mlplay.checkpoint_writer.close()
+    finally:
+        env.close()
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Sweep PPO hyperparameters over parallel headless training runs")
+    parser.add_argument("space", nargs="?", help="JSON search space, inline or a file path, e.g. {\"learning_rate\": {\"log_uniform\": [1e-5, 1e-3]}, \"n_steps\": [1024, 2048]}")
+    parser.add_argument("--trials", type=int, default=None, help="Random samples to draw (default: the full grid of value lists)")
+    parser.add_argument("--updates", type=int, default=20, help="PPO updates per trial")
+    parser.add_argument("--parallel", type=int, default=None, help="Trials running at once (default: cores / threads)")
+    parser.add_argument("--threads", type=int, default=1, help="Torch threads per trial")
+    parser.add_argument("--grace-updates", type=int, default=5, help="Updates before a trial can be stopped early")
+    parser.add_argument("--min-trials", type=int, default=3, help="Other trials needed for the median stopping rule")
+    parser.add_argument("--window", type=int, default=5, help="Updates averaged for the final objective")
+    parser.add_argument("--base-worker-id", type=int, default=10, help="worker_id of the first slot; slot i uses base + i")
+    parser.add_argument("--time-scale", type=float, default=1.0)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--stand-in", action="store_true", help="Use the synthetic stand-in game instead of Proly")
+    parser.add_argument("--output", default=None, help="Sweep directory (default: <model dir>/sweeps/<time>)")
+    parser.add_argument("--trial", help=argparse.SUPPRESS)
+    parser.add_argument("--worker-id", type=int, default=0, help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.trial:
+        run_trial(args.trial, args.worker_id, args.updates, args.threads, args.stand_in, args.time_scale)
+    elif not args.space:
+        parser.error("a search space is required")
+    else:
+        if args.space.lstrip().startswith("{"):
+            space = json.loads(args.space)
+        else:
+            with open(args.space, "r") as f:
+                space = json.load(f)
+        base_config = get_config()
+        overlays = generate_overlays(space, args.trials, args.seed)
+        output_dir = args.output or os.path.join(base_config["model"]["dir"], "sweeps", time.strftime("%Y%m%d_%H%M%S"))
+        options = {
+            "parallel": args.parallel or max(1, (os.cpu_count() or 1) // args.threads),
+            "threads": args.threads,
+            "updates": args.updates,
+            "grace_updates": args.grace_updates,
+            "min_trials": args.min_trials,
+            "base_worker_id": args.base_worker_id,
+            "time_scale": args.time_scale,
+            "seed": args.seed,
+            "stand_in": args.stand_in,
+            "poll_interval": 1.0,
+            "stop_timeout": 300.0
+        }
+        print(f"{len(overlays)} trials, {options['parallel']} at a time, {args.updates} updates each")
+        trials = run_sweep(overlays, base_config, output_dir, options)
+        write_results(trials, output_dir, args.window)
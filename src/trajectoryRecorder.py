@@ -0,0 +1,346 @@
+import os
+import json
+import atexit
+import argparse
+import numpy as np
+
+# Structured fields RlplayRewardCalculator reads; everything else can be recovered from the flattened vector
+REWARD_FIELDS = ["agent_health", "target_position", "last_checkpoint_index", "reached_final_checkpoint", "nearby_map_objects"]
+SCALAR_DTYPES = {"float": "<f4", "int": "<i4", "bool": "u1"}
+VECTOR_SIZES = {"Vector3": 3, "Vector2": 2}
+FORMAT_VERSION = 1
+
+
+def compile_fields(items, keys=None):
+    # Returns ([name, dtype, shape] per fixed field, {key: item type}, {list key: its own fields})
+    fields, types, tables = [], {}, {}
+    for item in items:
+        key = item.get("key", "")
+        item_type = item.get("type", "")
+        if not key or (keys is not None and key not in keys):
+            continue
+        if item_type in SCALAR_DTYPES:
+            fields.append([key, SCALAR_DTYPES[item_type], []])
+        elif item_type in VECTOR_SIZES or item_type == "Vector":
+            fields.append([key, "<f4", [VECTOR_SIZES.get(item_type, item.get("vector_size", 0))]])
+        elif item_type == "List":
+            sub_fields, sub_types, _ = compile_fields(item.get("items", []))
+            tables[key] = {"fields": sub_fields, "types": sub_types}
+            fields.append([f"{key}_count", "<i4", []])
+        else:
+            continue
+        types[key] = item_type
+    return fields, types, tables
+
+
+def to_dtype(fields):
+    return np.dtype([(name, dtype, tuple(shape)) for name, dtype, shape in fields])
+
+
+def episode_index_dtype(table_keys):
+    return np.dtype([("chunk", "<i4"), ("start", "<i8"), ("length", "<i8"), ("total_reward", "<f4")] +
+                    [(f"{key}_start", "<i8") for key in table_keys])
+
+
+def chunk_file(path, chunk, name):
+    return os.path.join(path, f"chunk_{chunk:05d}_{name}.bin")
+
+
+class TrajectoryRecorder:
+    # Appends every step MLPlay.update sees to raw binary files that the reader memory-maps:
+    #   chunk_N_flattened.bin  float32 (steps, obs_size)
+    #   chunk_N_steps.bin      one record per step: action, reward, done and the reward fields
+    #   chunk_N_<list>.bin     the items of each List field, steps[<list>_count] rows per step
+    #   episodes.bin           one record per finished episode, written when the episode ends
+    # reward[t] is the reward RLPlay computed on arriving at observation t, action[t] the action taken from it.
+    # Episodes never span chunks; a new chunk is started once the current one holds chunk_steps steps.
+    def __init__(self, path, observation_structure, obs_size, action_space, fields=None, chunk_steps=100000, metadata=None):
+        self.path = path
+        self.metadata = metadata or {}
+        self.obs_size = obs_size
+        self.chunk_steps = chunk_steps
+
+        action_shape = list(action_space.shape) or [1]
+        obs_fields, self.types, self.tables = compile_fields(observation_structure, fields or REWARD_FIELDS)
+        self.step_fields = [["action", action_space.dtype.str, action_shape], ["reward", "<f4", []], ["done", "u1", []]] + obs_fields
+        self.step = np.zeros((), dtype=to_dtype(self.step_fields))
+        self.table_rows = {key: np.zeros(16, dtype=to_dtype(table["fields"])) for key, table in self.tables.items()}
+        self.index_dtype = episode_index_dtype(list(self.tables))
+
+        os.makedirs(path, exist_ok=True)
+        self.chunk = self._check_existing()
+        self._write_meta(observation_structure)
+        self.index_file = open(os.path.join(path, "episodes.bin"), "ab")
+        self._open_chunk()
+
+        self.episode_start = 0
+        self.episode_table_starts = {key: 0 for key in self.tables}
+        self.episode_length = 0
+        self.episode_reward = 0.0
+        atexit.register(self.close)
+
+    def record(self, observations, action, reward, done):
+        step = self.step
+        step["action"] = np.reshape(action, step["action"].shape)
+        step["reward"] = reward
+        step["done"] = done
+        for key, item_type in self.types.items():
+            if item_type == "List":
+                self._record_items(key, observations[key])
+            else:
+                step[key] = observations[key]
+        self.flattened_file.write(np.asarray(observations["flattened"], dtype=np.float32).tobytes())
+        self.steps_file.write(step.tobytes())
+        self.episode_length += 1
+        self.episode_reward += float(reward)
+
+    def end_episode(self):
+        if self.episode_length == 0:
+            return
+        entry = np.zeros((), dtype=self.index_dtype)
+        entry["chunk"] = self.chunk
+        entry["start"] = self.episode_start
+        entry["length"] = self.episode_length
+        entry["total_reward"] = self.episode_reward
+        for key in self.tables:
+            entry[f"{key}_start"] = self.episode_table_starts[key]
+
+        # Data first, then the index entry that makes the episode visible to readers
+        for f in self._chunk_files():
+            f.flush()
+        self.index_file.write(entry.tobytes())
+        self.index_file.flush()
+
+        self.episode_start += self.episode_length
+        self.episode_table_starts = dict(self.table_counts)
+        self.episode_length = 0
+        self.episode_reward = 0.0
+        if self.episode_start >= self.chunk_steps:
+            self._close_chunk()
+            self.chunk += 1
+            self._open_chunk()
+            self.episode_start = 0
+            self.episode_table_starts = {key: 0 for key in self.tables}
+
+    def close(self):
+        # An unfinished episode has no index entry and is ignored by the reader
+        if self.index_file.closed:
+            return
+        self._close_chunk()
+        self.index_file.close()
+
+    def _record_items(self, key, items):
+        count = len(items)
+        rows = self.table_rows[key]
+        if count > len(rows):
+            rows = self.table_rows[key] = np.zeros(count * 2, dtype=rows.dtype)
+        for i, item in enumerate(items):
+            for name in self.tables[key]["types"]:
+                rows[i][name] = item[name]
+        self.step[f"{key}_count"] = count
+        self.table_files[key].write(rows[:count].tobytes())
+        self.table_counts[key] += count
+
+    def _check_existing(self):
+        meta_path = os.path.join(self.path, "meta.json")
+        if not os.path.exists(meta_path):
+            return 0
+        with open(meta_path, "r") as f:
+            meta = json.load(f)
+        if meta["steps"] != self.step_fields or meta["tables"] != self.tables or meta["obs_size"] != self.obs_size:
+            raise ValueError(f"{self.path} already holds a recording with a different layout")
+        # Keep appending, but never into a chunk an earlier run may have left a partial episode in
+        return max((int(name[6:11]) for name in os.listdir(self.path) if name.startswith("chunk_")), default=-1) + 1
+
+    def _write_meta(self, observation_structure):
+        meta = {
+            "version": FORMAT_VERSION,
+            "obs_size": self.obs_size,
+            "steps": self.step_fields,
+            "types": self.types,
+            "tables": self.tables,
+            "observation_structure": observation_structure,
+            **self.metadata
+        }
+        tmp_path = os.path.join(self.path, "meta.json.tmp")
+        with open(tmp_path, "w") as f:
+            json.dump(meta, f, indent=4)
+        os.replace(tmp_path, os.path.join(self.path, "meta.json"))
+
+    def _open_chunk(self):
+        self.flattened_file = open(chunk_file(self.path, self.chunk, "flattened"), "ab")
+        self.steps_file = open(chunk_file(self.path, self.chunk, "steps"), "ab")
+        self.table_files = {key: open(chunk_file(self.path, self.chunk, key), "ab") for key in self.tables}
+        self.table_counts = {key: 0 for key in self.tables}
+
+    def _chunk_files(self):
+        return [self.flattened_file, self.steps_file] + list(self.table_files.values())
+
+    def _close_chunk(self):
+        for f in self._chunk_files():
+            f.close()
+
+
+class NullRecorder:
+    def record(self, observations, action, reward, done):
+        pass
+
+    def end_episode(self):
+        pass
+
+    def close(self):
+        pass
+
+
+def create_recorder(recording_config, observation_structure, obs_size, action_space, default_path=None, metadata=None):
+    recording_config = recording_config or {}
+    if not recording_config.get("enabled", False):
+        return NullRecorder()
+    path = recording_config.get("dir") or default_path
+    print(f"Recording trajectories to {path}")
+    return TrajectoryRecorder(
+        path,
+        observation_structure,
+        obs_size,
+        action_space,
+        fields=recording_config.get("fields"),
+        chunk_steps=recording_config.get("chunk_steps", 100000),
+        metadata=metadata
+    )
+
+
+class Episode:
+    def __init__(self, flattened, steps, tables, types, table_types):
+        self.flattened = flattened
+        self.steps = steps
+        self.actions = steps["action"]
+        self.rewards = steps["reward"]
+        self.dones = steps["done"]
+        self.types = types
+        self.table_types = table_types
+        self.tables = {}
+        for key, rows in tables.items():
+            offsets = np.zeros(len(steps) + 1, dtype=np.int64)
+            np.cumsum(steps[f"{key}_count"], out=offsets[1:])
+            self.tables[key] = (rows, offsets)
+
+    def __len__(self):
+        return len(self.steps)
+
+    def items(self, key, t):
+        rows, offsets = self.tables[key]
+        return rows[offsets[t]:offsets[t + 1]]
+
+    def observation(self, t):
+        # The observation dict as the game parsed it, limited to the recorded fields
+        observation = {"flattened": self.flattened[t]}
+        for key, item_type in self.types.items():
+            if item_type == "List":
+                observation[key] = [_item_value(row, self.table_types[key]) for row in self.items(key, t)]
+            else:
+                observation[key] = _field_value(self.steps[key][t], item_type)
+        return observation
+
+    def observations(self):
+        for t in range(len(self)):
+            yield self.observation(t)
+
+
+def _field_value(value, item_type):
+    if item_type == "int":
+        return int(value)
+    if item_type == "bool":
+        return bool(value)
+    return value
+
+
+def _item_value(row, types):
+    return {name: _field_value(row[name], item_type) for name, item_type in types.items()}
+
+
+class TrajectoryReader:
+    def __init__(self, path):
+        self.path = path
+        with open(os.path.join(path, "meta.json"), "r") as f:
+            self.meta = json.load(f)
+        self.obs_size = self.meta["obs_size"]
+        self.step_dtype = to_dtype(self.meta["steps"])
+        self.types = self.meta["types"]
+        self.table_dtypes = {key: to_dtype(table["fields"]) for key, table in self.meta["tables"].items()}
+        self.table_types = {key: table["types"] for key, table in self.meta["tables"].items()}
+        # The index is small; a trailing partial record (crash while writing) is dropped
+        index_dtype = episode_index_dtype(list(self.table_dtypes))
+        with open(os.path.join(path, "episodes.bin"), "rb") as f:
+            data = f.read()
+        self.episodes = np.frombuffer(data[:len(data) - len(data) % index_dtype.itemsize], dtype=index_dtype)
+        self.chunks = {}
+
+    def __len__(self):
+        return len(self.episodes)
+
+    def __getitem__(self, index):
+        entry = self.episodes[index]
+        flattened, steps, tables = self._chunk(int(entry["chunk"]))
+        start, end = int(entry["start"]), int(entry["start"] + entry["length"])
+        episode_steps = steps[start:end]
+        episode_tables = {}
+        for key, rows in tables.items():
+            table_start = int(entry[f"{key}_start"])
+            episode_tables[key] = rows[table_start:table_start + int(episode_steps[f"{key}_count"].sum())]
+        return Episode(flattened[start:end], episode_steps, episode_tables, self.types, self.table_types)
+
+    def __iter__(self):
+        for index in range(len(self)):
+            yield self[index]
+
+    @property
+    def total_steps(self):
+        return int(self.episodes["length"].sum())
+
+    def _chunk(self, chunk):
+        if chunk not in self.chunks:
+            flattened = self._map(chunk_file(self.path, chunk, "flattened"), np.dtype((np.float32, (self.obs_size,))))
+            steps = self._map(chunk_file(self.path, chunk, "steps"), self.step_dtype)
+            tables = {key: self._map(chunk_file(self.path, chunk, key), dtype) for key, dtype in self.table_dtypes.items()}
+            self.chunks[chunk] = (flattened, steps, tables)
+        return self.chunks[chunk]
+
+    def _map(self, path, dtype):
+        count = os.path.getsize(path) // dtype.itemsize
+        if count == 0:
+            return np.zeros(0, dtype=dtype)
+        return np.memmap(path, dtype=dtype, mode="r", shape=(count,))
+
+
+def check_rewards(reader):
+    # Replays the recorded observations through the reward code and compares with what was recorded
+    from RLPlay import RLPlay
+    from RlplayRewardCalculator import RlplayRewardCalculator
+    reward_calculator = RlplayRewardCalculator()
+    rlplay = RLPlay(reward_calculator, reader.meta.get("reward_weights"))
+    max_error = 0.0
+    for episode in reader:
+        reward_calculator.reset()
+        rlplay.reset()
+        for t, observation in enumerate(episode.observations()):
+            reward_calculator.update(observation)
+            reward, _ = rlplay.update()
+            max_error = max(max_error, abs(float(reward) - float(episode.rewards[t])))
+    return max_error
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Summarize a recorded trajectory directory")
+    parser.add_argument("path")
+    parser.add_argument("--check-rewards", action="store_true", help="Recompute rewards from the recorded observations")
+    args = parser.parse_args()
+    reader = TrajectoryReader(args.path)
+    print(f"{len(reader)} episodes, {reader.total_steps} steps, observation size {reader.obs_size}")
+    if len(reader):
+        rewards = reader.episodes["total_reward"]
+        lengths = reader.episodes["length"]
+        print(f"Episode reward: mean {rewards.mean():.2f}, min {rewards.min():.2f}, max {rewards.max():.2f}")
+        print(f"Episode length: mean {lengths.mean():.1f}, min {lengths.min()}, max {lengths.max()}")
+    if args.check_rewards:
+        max_error = check_rewards(reader)
+        print(f"Max difference between recorded and recomputed rewards: {max_error:.2e}")
@@ -3,12 +3,39 @@ import json
 
 
 def get_config():
-    curr_path = os.path.dirname(__file__)
-    parent_path = os.path.dirname(curr_path)
-    config_path = os.path.join(parent_path, "config.json")
+    # RLPROLY_CONFIG points at another config file, e.g. the temporary one benchmark.py writes
+    config_path = os.environ.get("RLPROLY_CONFIG")
+    if not config_path:
+        curr_path = os.path.dirname(__file__)
+        parent_path = os.path.dirname(curr_path)
+        config_path = os.path.join(parent_path, "config.json")
     with open(config_path, "r") as f:
         config = json.load(f)
     return config
 
 def dict_to_tuple_list(d):
-    return [(k, v) for k, v in d.items()]
\ No newline at end of file
+    return [(k, v) for k, v in d.items()]
+
+class ActionSpaceSpec:
+    # Picklable stand-in for ML-Agents' ActionSpec, used where the game's own object is not available
+    def __init__(self, continuous_size=0, discrete_branches=()):
+        self.continuous_size = int(continuous_size)
+        self.discrete_branches = tuple(int(branch) for branch in discrete_branches)
+        self.discrete_size = len(self.discrete_branches)
+
+    def is_continuous(self):
+        return self.discrete_size == 0
+
+    def is_discrete(self):
+        return self.continuous_size == 0
+
+    def to_dict(self):
+        return {"continuous_size": self.continuous_size, "discrete_branches": list(self.discrete_branches)}
+
+    @classmethod
+    def from_action_space_info(cls, action_space_info):
+        return cls(action_space_info.continuous_size, action_space_info.discrete_branches)
+
+    @classmethod
+    def from_dict(cls, d):
+        return cls(d["continuous_size"], d["discrete_branches"])